@@ -0,0 +1,219 @@
+"""Corpus-scale scoring: streams conversations from JSONL files (or a directory of them) through a
+pool of worker processes that each keep an EnsembleEvaluator warm, appending results to a JSONL file.
+
+    python batch.py conversations.jsonl -o results.jsonl --workers 8
+
+Each input line is either a JSON list of utterances or an object with "conversation" (and
+optionally "id"). Re-running the same command resumes an interrupted run: conversations whose
+IDs are already in the output file are skipped. --preload loads every model once in the parent and
+forks the workers from it, so they share the weights instead of each loading a copy. Each worker
+gets cores/workers threads for torch, its task scheduler and its R politeness workers, so together
+the workers use every core once instead of each sizing itself to the whole machine. With
+--columnar results.npz (or .parquet) the whole output file is also converted to columnar frames
+(see modules.frames) at the end."""
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+import argparse, json, multiprocessing, os, sys, time
+
+_ensemble = None
+
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+def _limit_threads(threads: int):
+    """Caps torch/BLAS intra-op threads in this worker. Read at import by libraries loaded later,
+    set directly on torch when it is already loaded (inherited from a --preload parent)"""
+    for var in THREAD_ENV_VARS:
+        os.environ.setdefault(var, str(threads))
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads)
+
+def worker_ensemble_kwargs(ensemble_kwargs: dict, threads: int) -> dict:
+    """Ensemble options for one of several worker processes that share the machine: `threads`
+    cores each for the cpu lane and the R politeness workers"""
+    from modules.scheduler import Scheduler
+    options = dict(ensemble_kwargs.get("evaluator_options") or {})
+    options["constructiveness"] = {"politeness_workers": threads, **options.get("constructiveness", {})}
+    return {**ensemble_kwargs, "evaluator_options": options,
+            "scheduler": Scheduler(cpu_workers=threads)}
+
+def _init_worker(ensemble_kwargs: dict, threads: int):
+    global _ensemble
+    from main import EnsembleEvaluator
+    _limit_threads(threads)
+    _ensemble = EnsembleEvaluator(**worker_ensemble_kwargs(ensemble_kwargs, threads))
+    _ensemble.warmup()
+
+def _score(conversation_id: str, conversation: list[str]) -> tuple:
+    try:
+        return conversation_id, _ensemble.evaluate_conversation(conversation), None
+    except Exception as e:
+        return conversation_id, None, f"{type(e).__name__}: {e}"
+
+def input_files(path: Path) -> list[Path]:
+    if path.is_dir():
+        return sorted(p for p in path.iterdir() if p.suffix in (".jsonl", ".json"))
+    return [path]
+
+def iter_conversations(paths: list[Path]):
+    """Yields (id, utterances) one line at a time, so memory does not grow with the input"""
+    for path in paths:
+        with open(path) as f:
+            if path.suffix == ".json": # a single conversation per file
+                record = json.load(f)
+                yield from _parse_record(record, path.stem)
+                continue
+            for line_idx, line in enumerate(f):
+                if line.strip():
+                    yield from _parse_record(json.loads(line), f"{path.name}:{line_idx}")
+
+def _parse_record(record, default_id: str):
+    if isinstance(record, list):
+        yield default_id, record
+    else:
+        yield str(record.get("id", default_id)), record["conversation"]
+
+def count_conversations(paths: list[Path]) -> int:
+    total = 0
+    for path in paths:
+        with open(path) as f:
+            total += 1 if path.suffix == ".json" else sum(1 for line in f if line.strip())
+    return total
+
+def completed_ids(output: Path) -> set:
+    """IDs already written to `output`. A partially written last line from an interrupted run is
+    truncated so appending can continue cleanly"""
+    done = set()
+    if not output.exists():
+        return done
+    valid_bytes = 0
+    with open(output, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                done.add(json.loads(line)["id"])
+            except (ValueError, KeyError):
+                break
+            valid_bytes += len(line)
+    if valid_bytes != output.stat().st_size:
+        with open(output, "r+b") as f:
+            f.truncate(valid_bytes)
+    return done
+
+def _to_json(value):
+    return value.item() if hasattr(value, "item") else str(value) # numpy scalars
+
+def _preload(ensemble_kwargs: dict):
+    """Loads the models into this process's registry so forked workers inherit them"""
+    from main import EnsembleEvaluator
+    from modules.models import get_model_registry
+    EnsembleEvaluator(**ensemble_kwargs).load_models() # models only, no R workers or HTTP clients to inherit
+    registry = get_model_registry()
+    for name, info in registry.report().items():
+        print(f"[batch] preloaded {name}: {info['rss_mb']}MB", file=sys.stderr)
+    registry.freeze()
+
+def run_batch(inputs: Path, output: Path, workers: int = None, max_in_flight: int = None,
+              report_every: float = 10.0, preload: bool = False, **ensemble_kwargs) -> dict:
+    paths = input_files(inputs)
+    done = completed_ids(output)
+    total = count_conversations(paths)
+    from modules import available_cores
+    workers = workers or available_cores()
+    threads = max(1, available_cores() // workers) # per worker, so the workers together fill the machine once
+    max_in_flight = max_in_flight or 2 * workers
+    errors_path = output.with_name(output.stem + ".errors.jsonl")
+
+    stats = {"total": total, "skipped": len(done), "scored": 0, "failed": 0, "utterances": 0}
+    started = last_report = time.monotonic()
+    mp_context = None
+    if preload:
+        _preload(ensemble_kwargs)
+        mp_context = multiprocessing.get_context("fork") # copy-on-write sharing needs fork
+    with ProcessPoolExecutor(workers, mp_context=mp_context, initializer=_init_worker, initargs=(ensemble_kwargs, threads)) as executor, \
+            open(output, "a") as out, open(errors_path, "a") as errors:
+        running = {}
+
+        def drain(return_when):
+            nonlocal last_report
+            finished, _ = wait(running, return_when=return_when)
+            for future in finished:
+                num_utterances = running.pop(future)
+                conversation_id, result, error = future.result()
+                if error is None:
+                    # the output file doubles as the checkpoint, flush so a crash loses at most this line
+                    out.write(json.dumps({"id": conversation_id, "result": result}, default=_to_json) + "\n")
+                    out.flush()
+                    stats["scored"] += 1
+                    stats["utterances"] += num_utterances
+                else: # not recorded as done, a resumed run retries it
+                    errors.write(json.dumps({"id": conversation_id, "error": error}) + "\n")
+                    errors.flush()
+                    stats["failed"] += 1
+            if time.monotonic() - last_report >= report_every:
+                last_report = time.monotonic()
+                _report(stats, last_report - started)
+
+        # bounded submission keeps memory flat however large the input is
+        for conversation_id, conversation in iter_conversations(paths):
+            if conversation_id in done:
+                continue
+            if len(running) >= max_in_flight:
+                drain(FIRST_COMPLETED)
+            running[executor.submit(_score, conversation_id, conversation)] = len(conversation)
+        while running:
+            drain(FIRST_COMPLETED)
+
+    _report(stats, time.monotonic() - started)
+    return stats
+
+def write_frame(output: Path, frame_path: Path):
+    """Converts the results JSONL into a ResultFrame one line at a time, so only the typed
+    columns are held in memory"""
+    from modules.frames import FrameBuilder
+    builder = FrameBuilder()
+    with open(output) as f:
+        for line in f:
+            record = json.loads(line)
+            builder.add(record["id"], record["result"])
+    builder.build().save(frame_path)
+
+def _report(stats: dict, elapsed: float):
+    processed = stats["scored"] + stats["failed"]
+    remaining = stats["total"] - stats["skipped"] - processed
+    rate = processed / elapsed if elapsed > 0 else 0.0
+    eta = remaining / rate if rate > 0 else float("inf")
+    print(
+        f"[batch] {processed + stats['skipped']}/{stats['total']} conversations "
+        f"({stats['failed']} failed) | {rate:.2f} conv/s, {stats['utterances'] / elapsed if elapsed > 0 else 0.0:.1f} utt/s "
+        f"| ETA {eta:.0f}s",
+        file=sys.stderr
+    )
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a corpus of conversations with EnsembleEvaluator")
+    parser.add_argument("input", type=Path, help="JSONL file or directory of .jsonl/.json files")
+    parser.add_argument("-o", "--output", type=Path, required=True, help="results JSONL, also used to resume")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="conversations queued at once (default: 2x workers)")
+    parser.add_argument("--report-every", type=float, default=10.0, help="seconds between progress reports")
+    parser.add_argument("--politeness-backend", choices=("rscript", "spacy"), default="rscript")
+    parser.add_argument("--evaluators", nargs="+", default=None, help="evaluator names to run (default: all)")
+    parser.add_argument("--preload", action="store_true", help="load models once and fork workers that share them")
+    parser.add_argument("--columnar", type=Path, default=None, help="also write columnar results (.npz or .parquet)")
+    args = parser.parse_args(argv)
+
+    run_batch(
+        args.input, args.output,
+        workers=args.workers,
+        max_in_flight=args.max_in_flight,
+        report_every=args.report_every,
+        preload=args.preload,
+        politeness_backend=args.politeness_backend,
+        evaluators=args.evaluators
+    )
+    if args.columnar:
+        write_frame(args.output, args.columnar)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""Throughput/latency benchmarks for every evaluator and the ensemble, fully offline (the
+Perspective API and the R politeness workers are replaced by local stand-ins).
+
+    python -m benchmarks.run -o bench.json
+    python -m benchmarks.run -o bench.json --compare baseline.json --threshold 0.10
+
+Each target runs in its own spawned process so model load time and peak RSS are measured in
+isolation. Results are written as JSON; with --compare, targets whose p50 latency grew or whose
+throughput dropped by more than --threshold are reported and the exit status is 1."""
+from pathlib import Path
+import argparse, json, multiprocessing, os, platform, resource, subprocess, sys, time
+
+TARGETS = ["sentiment", "lsm", "idea_adoption", "relevance", "hate_speech", "toxicity", "constructiveness", "ensemble"]
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    if not values:
+        return 0.0
+    pos = (len(values) - 1) * q
+    low, high = int(pos), min(int(pos) + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (pos - low)
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+def _build(target: str, perspective_url: str, config: dict):
+    from benchmarks.synthetic import StubPolitenessBackend
+    from main import EnsembleEvaluator, load_evaluator
+    politeness = StubPolitenessBackend(config["r_call_latency"], config["r_utterance_latency"])
+    toxicity_options = {"base_url": perspective_url, "qps": 1000.0}
+
+    if target == "ensemble":
+        evaluator = EnsembleEvaluator(evaluator_options={"toxicity": toxicity_options})
+        evaluator.constructiveness_evaluator.politeness = politeness
+        evaluator.politeness = politeness
+        return evaluator
+    evaluator = load_evaluator(target, **(toxicity_options if target == "toxicity" else {}))
+    if target == "constructiveness":
+        evaluator.politeness = politeness
+    return evaluator
+
+def _evaluate(target: str, evaluator, conversation: list[str]):
+    if target == "constructiveness": # utterance-level only
+        for text in conversation[1::2]:
+            evaluator.evaluate_utterance(text)
+    elif target in ("toxicity", "hate_speech", "sentiment"): # scored on participant turns by the ensemble
+        evaluator.evaluate_conversation(conversation[1::2])
+    elif target == "relevance":
+        evaluator.evaluate_conversation([conversation[0]] + conversation[1::2])
+    else:
+        evaluator.evaluate_conversation(conversation)
+
+def bench_target(target: str, config: dict) -> dict:
+    """Runs inside a fresh process"""
+    from benchmarks.synthetic import generate_corpus
+    from modules.perspective_stub import StubPerspectiveServer
+
+    corpus = generate_corpus(config["conversations"], config["turns"], config["words"], config["seed"])
+    num_utterances = sum(len(conversation) for conversation in corpus)
+    with StubPerspectiveServer(latency=config["perspective_latency"]) as stub:
+        started = time.perf_counter()
+        evaluator = _build(target, stub.url, config)
+        evaluator.warmup()
+        load_time = time.perf_counter() - started
+
+        for conversation in corpus[:config["warmup"]]:
+            _evaluate(target, evaluator, conversation)
+
+        latencies = []
+        started = time.perf_counter()
+        for conversation in corpus:
+            t0 = time.perf_counter()
+            _evaluate(target, evaluator, conversation)
+            latencies.append(time.perf_counter() - t0)
+        total = time.perf_counter() - started
+
+    return {
+        "load_time_s": load_time,
+        "p50_latency_s": percentile(latencies, 0.5),
+        "p95_latency_s": percentile(latencies, 0.95),
+        "conversations_per_s": len(corpus) / total,
+        "utterances_per_s": num_utterances / total,
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+def _child(target: str, config: dict, queue):
+    # measure the models, not the result cache (the warmup conversations would be cache hits)
+    os.environ["RESULT_CACHE_ENTRIES"] = "0"
+    os.environ.pop("RESULT_CACHE_PATH", None)
+    try:
+        queue.put({"target": target, **bench_target(target, config)})
+    except Exception as e:
+        queue.put({"target": target, "error": f"{type(e).__name__}: {e}"})
+
+def run(targets: list[str], config: dict) -> dict:
+    ctx = multiprocessing.get_context("spawn") # a clean interpreter per target, no inherited models
+    results = {}
+    for target in targets:
+        queue = ctx.Queue()
+        process = ctx.Process(target=_child, args=(target, config, queue))
+        process.start()
+        res = queue.get()
+        process.join()
+        results[target] = {key: value for key, value in res.items() if key != "target"}
+        print(f"[bench] {target}: {_summary(results[target])}", file=sys.stderr)
+    return {"meta": _meta(config), "results": results}
+
+def _summary(res: dict) -> str:
+    if "error" in res:
+        return res["error"]
+    return (f"load {res['load_time_s']:.2f}s | p50 {res['p50_latency_s'] * 1000:.1f}ms "
+            f"p95 {res['p95_latency_s'] * 1000:.1f}ms | {res['utterances_per_s']:.1f} utt/s | "
+            f"peak RSS {res['peak_rss_mb']:.0f}MB")
+
+def _meta(config: dict) -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=Path(__file__).resolve().parent.parent).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": config
+    }
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[str]:
+    """Regressions of more than `threshold` (relative) in p50/p95 latency or throughput"""
+    regressions = []
+    for target, res in current["results"].items():
+        base = baseline["results"].get(target)
+        if base is None or "error" in res or "error" in base:
+            continue
+        for metric in ("p50_latency_s", "p95_latency_s"):
+            if base[metric] > 0 and res[metric] > base[metric] * (1 + threshold):
+                regressions.append(f"{target}: {metric} {base[metric]:.4f} -> {res[metric]:.4f}")
+        if res["utterances_per_s"] < base["utterances_per_s"] * (1 - threshold):
+            regressions.append(f"{target}: utterances_per_s {base['utterances_per_s']:.1f} -> {res['utterances_per_s']:.1f}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every evaluator and the ensemble offline")
+    parser.add_argument("-o", "--output", type=Path, default=Path("bench.json"))
+    parser.add_argument("--targets", nargs="+", default=TARGETS, choices=TARGETS)
+    parser.add_argument("--conversations", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=6)
+    parser.add_argument("--words", type=int, default=60, help="mean words per utterance")
+    parser.add_argument("--warmup", type=int, default=2, help="conversations run before timing starts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--perspective-latency", type=float, default=0.1, help="stub Perspective round-trip (s)")
+    parser.add_argument("--r-call-latency", type=float, default=0.05, help="stub R worker per-call cost (s)")
+    parser.add_argument("--r-utterance-latency", type=float, default=0.01, help="stub R worker per-utterance cost (s)")
+    parser.add_argument("--compare", type=Path, default=None, help="baseline JSON to flag regressions against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    args = parser.parse_args(argv)
+
+    config = {
+        "conversations": args.conversations, "turns": args.turns, "words": args.words,
+        "warmup": args.warmup, "seed": args.seed, "perspective_latency": args.perspective_latency,
+        "r_call_latency": args.r_call_latency, "r_utterance_latency": args.r_utterance_latency
+    }
+    report = run(args.targets, config)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"[bench] REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import random, time
+
+# Word pools chosen so every evaluator has something to find: LSM function words, connectives,
+# stance adverbials, pronouns, politeness markers and a few abusive words for the toxicity stub
+FUNCTION_WORDS = [
+    "the", "a", "an", "of", "to", "in", "for", "with", "on", "at", "by", "from", "and", "or", "but",
+    "because", "if", "so", "is", "are", "was", "were", "be", "have", "has", "do", "does", "can",
+    "could", "would", "should", "not", "no", "all", "some", "many", "most", "every", "always", "never",
+    "often", "i", "me", "my", "you", "we", "they", "it", "one"
+]
+CONTENT_WORDS = [
+    "tax", "taxes", "capital", "labor", "wealth", "shareholders", "workers", "company", "market",
+    "risk", "reward", "policy", "government", "income", "investment", "dividend", "value", "profit",
+    "economy", "society", "argue", "believe", "think", "produce", "earn", "pay", "create", "fair",
+    "unfair", "productive", "significant", "however", "therefore", "moreover", "actually", "really",
+    "probably", "perhaps", "clearly", "thanks", "please", "sorry", "idiot", "nonsense", "garbage"
+]
+
+def generate_utterance(rng: random.Random, num_words: int) -> str:
+    words = []
+    sentence_length = 0
+    for _ in range(num_words):
+        pool = FUNCTION_WORDS if rng.random() < 0.45 else CONTENT_WORDS
+        words.append(rng.choice(pool))
+        sentence_length += 1
+        if sentence_length >= rng.randint(8, 20):
+            words[-1] += rng.choice([".", ".", "?", "!"])
+            sentence_length = 0
+    text = " ".join(words)
+    text = text[0].upper() + text[1:]
+    return text if text[-1] in ".?!" else text + "."
+
+def generate_conversation(num_turns: int = 6, words_per_utterance: int = 60, seed: int = 0) -> list[str]:
+    """Deterministic conversation; utterance lengths vary +/-50% around `words_per_utterance`"""
+    rng = random.Random(seed)
+    return [
+        generate_utterance(rng, max(1, int(words_per_utterance * rng.uniform(0.5, 1.5))))
+        for _ in range(num_turns)
+    ]
+
+def generate_corpus(num_conversations: int, num_turns: int = 6, words_per_utterance: int = 60, seed: int = 0) -> list[list[str]]:
+    return [generate_conversation(num_turns, words_per_utterance, seed + idx) for idx in range(num_conversations)]
+
+class StubPolitenessBackend:
+    """Offline stand-in for the R politeness workers: returns zeroed politeness() columns after a
+    fixed per-call plus per-utterance delay, roughly what a warm R worker costs"""
+
+    def __init__(self, call_latency: float = 0.05, utterance_latency: float = 0.01):
+        from modules.politeness import SpacyPolitenessExtractor
+        self.features = SpacyPolitenessExtractor.FEATURES
+        self.call_latency = call_latency
+        self.utterance_latency = utterance_latency
+
+    def score(self, texts: list[str], docs: list = None) -> list[dict]:
+        time.sleep(self.call_latency + self.utterance_latency * len(texts))
+        return [dict.fromkeys(self.features, 0) for _ in texts]
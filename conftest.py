@@ -0,0 +1,7 @@
+import pytest
+
+@pytest.fixture
+def no_result_cache(monkeypatch):
+    """Swaps the process-wide result cache for a disabled one, so every evaluator really runs"""
+    import modules.cache
+    monkeypatch.setattr(modules.cache, "_shared_cache", modules.cache.ResultCache(max_entries=0))
@@ -1,146 +1,397 @@
 from dotenv import load_dotenv
 from modules import Evaluator
-from textstat import smog_index
-from pathlib import Path
-import json, subprocess
-from modules.hate_speech.hate_speech import HateSpeechEvaluator
-from modules.toxicity import ToxicityEvaluator
-from modules.sentiment import SentimentEvaluator
-from modules.constructiveness import ConstructivenessEvaluator
-from modules.relevance import RelevanceEvaluator
-from modules.idea_adoption import IdeaAdoptionEvaluator
-from modules.linguistic_style_matching import LSMEvaluator
+from modules.documents import get_document_service
+from modules.features import UtteranceFeatures
+from modules.scheduler import Scheduler, TaskGraph
+import importlib
 
 load_dotenv(".env.local")
 
+# name -> (module, class). Evaluator modules are imported only when selected and load their
+# models on first use, so e.g. a sentiment-only ensemble never imports torch
+EVALUATORS = {
+    "hate_speech": ("modules.hate_speech.hate_speech", "HateSpeechEvaluator"),
+    "toxicity": ("modules.toxicity", "ToxicityEvaluator"),
+    "sentiment": ("modules.sentiment", "SentimentEvaluator"),
+    "constructiveness": ("modules.constructiveness", "ConstructivenessEvaluator"),
+    "relevance": ("modules.relevance", "RelevanceEvaluator"),
+    "idea_adoption": ("modules.idea_adoption", "IdeaAdoptionEvaluator"),
+    "lsm": ("modules.linguistic_style_matching", "LSMEvaluator")
+}
+
+def load_evaluator(name: str, **kwargs) -> Evaluator:
+    if name not in EVALUATORS:
+        raise ValueError(f"Unknown evaluator '{name}', expected one of {list(EVALUATORS)}")
+    module_name, class_name = EVALUATORS[name]
+    return getattr(importlib.import_module(module_name), class_name)(**kwargs)
+
 class EnsembleEvaluator(Evaluator):
-    def __init__(self):
+    def __init__(self, politeness_backend: str = "rscript", parallel: bool = True, scheduler: Scheduler = None,
+                 evaluators: list[str] = None, evaluator_options: dict = None):
+        """`evaluators` selects which evaluators run (all of EVALUATORS by default), results of
+        unselected evaluators are left out. `evaluator_options` maps a name to constructor kwargs"""
         super().__init__(name="Ensemble Evaluator")
+        self.scheduler = scheduler or Scheduler(parallel=parallel)
+
+        options = {"constructiveness": {"politeness_backend": politeness_backend}}
+        for name, kwargs in (evaluator_options or {}).items():
+            options[name] = {**options.get(name, {}), **kwargs}
+        self.evaluators = {
+            name: load_evaluator(name, **options.get(name, {}))
+            for name in (evaluators if evaluators is not None else EVALUATORS)
+        }
 
-        self.hate_speech_evaluator = HateSpeechEvaluator()
-        self.toxicity_evaluator = ToxicityEvaluator()
-        self.sentiment_evaluator = SentimentEvaluator()
-        self.constructiveness_evaluator = ConstructivenessEvaluator()
-        self.relevance_evaluator = RelevanceEvaluator()
-        self.idea_adoption_evaluator = IdeaAdoptionEvaluator()
-        self.lsm_evaluator = LSMEvaluator()
+        self.hate_speech_evaluator = self.evaluators.get("hate_speech")
+        self.toxicity_evaluator = self.evaluators.get("toxicity")
+        self.sentiment_evaluator = self.evaluators.get("sentiment")
+        self.constructiveness_evaluator = self.evaluators.get("constructiveness")
+        self.relevance_evaluator = self.evaluators.get("relevance")
+        self.idea_adoption_evaluator = self.evaluators.get("idea_adoption")
+        self.lsm_evaluator = self.evaluators.get("lsm")
 
         self.utterance_evaluators: list[Evaluator] = [
-            self.hate_speech_evaluator,
-            self.toxicity_evaluator,
-            self.sentiment_evaluator,
-            self.constructiveness_evaluator
+            evaluator for evaluator in [
+                self.hate_speech_evaluator,
+                self.toxicity_evaluator,
+                self.sentiment_evaluator,
+                self.constructiveness_evaluator
+            ] if evaluator is not None
         ]
 
-    def evaluate_utterance(self, text: str) -> dict:
+        # every utterance is parsed once with the union of what the spaCy consumers need
+        self.documents = get_document_service()
+        self.politeness = self.constructiveness_evaluator.politeness if self.constructiveness_evaluator else None
+        self.utterance_annotations = self._annotations(self.constructiveness_evaluator)
+        # idea adoption is left out: it parses the lower-cased text itself, like the original evaluator
+        self.conversation_annotations = self._annotations(self.lsm_evaluator, self.politeness)
+
+    @staticmethod
+    def _annotations(*consumers) -> set:
+        res = set()
+        for consumer in consumers:
+            res |= getattr(consumer, "annotations", set())
+        return res
+
+    def load_models(self):
+        """Loads every selected model (and nothing else), e.g. in a parent process before forking
+        workers that then share the weights"""
+        if self.utterance_annotations or self.conversation_annotations:
+            self.documents.nlp
+        for evaluator in self.evaluators.values():
+            evaluator.load_models()
+
+    def warmup(self):
+        """Loads every selected model up front"""
+        if self.utterance_annotations or self.conversation_annotations:
+            self.documents.nlp
+        for evaluator in self.evaluators.values():
+            evaluator.warmup()
+
+    def evaluate_utterance(self, text: str, doc=None) -> dict:
+        if doc is None and self.utterance_annotations:
+            doc = self.documents.parse_one(text, self.utterance_annotations)
+
+        features = UtteranceFeatures(text) if self.constructiveness_evaluator else None
+
         result = dict()
         for evaluator in self.utterance_evaluators:
-            result[evaluator.name] = evaluator.evaluate_utterance(text)
+            if hasattr(evaluator, "annotations"): # spaCy consumers reuse the shared parse and lexical features
+                result[evaluator.name] = evaluator.evaluate_utterance(text, doc=doc, features=features)
+            else:
+                result[evaluator.name] = evaluator.evaluate_utterance(text)
 
         return result
     
     def evaluate_utterance_pair(self, text1: str, text2: str) -> dict:
-        utterance_results = self.evaluate_utterance(text2)
-        relevance = self.relevance_evaluator.evaluate_utterance_pair(text1, text2)
-        ideas_adopted = self.idea_adoption_evaluator.evaluate_conversation([text1, text2])
+        result = self.evaluate_utterance(text2)
+        if self.relevance_evaluator:
+            result[self.relevance_evaluator.name] = self.relevance_evaluator.evaluate_utterance_pair(text1, text2)
+        if self.idea_adoption_evaluator:
+            result[self.idea_adoption_evaluator.name] = self.idea_adoption_evaluator.evaluate_conversation([text1, text2])
 
-        return {
-            **utterance_results,
-            self.relevance_evaluator.name: relevance,
-            self.idea_adoption_evaluator.name: ideas_adopted
-        }
+        return result
 
     def evaluate_conversation(self, conversation: list[str]) -> dict:
-        # extracting metrics only for participant utterances
-        participant_utterances = [res for idx, res in enumerate(conversation) if idx%2==1]
-        toxicity_res = self.toxicity_evaluator.evaluate_conversation(participant_utterances)
-        hate_speech_res = self.hate_speech_evaluator.evaluate_conversation(participant_utterances)
-
-        def count_self_disclosure_utterances(conversation):
-            self_references = ["i", "me", "my", "mine", "myself", "meself"]
-            count = 0
-            for text in conversation:
-                text = text.lower()
-                word_set = set(text.split())
-                for self_reference in self_references:
-                    if self_reference in word_set:
-                        count += 1
-                        break # counting utterances containing at least 1 self-disclosure
-            return count
+        """Runs every evaluator as a task graph; independent evaluators overlap, so latency
+        approaches the slowest evaluator rather than the sum of all of them"""
+        graph = TaskGraph()
+        # shared artifacts
+        graph.add("participant_utterances", lambda: [res for idx, res in enumerate(conversation) if idx%2==1]) # extracting metrics only for participant utterances
+        if self.conversation_annotations:
+            graph.add("docs", self.documents.parse, args=(conversation, self.conversation_annotations))
+            graph.add("participant_docs", lambda docs: docs[1::2], deps=("docs",))
+        # every utterance is tokenized once (textstat runs only for participant turns)
+        graph.add("features", conversation_features, args=(conversation,))
+        graph.add("participant_features", lambda features: features[1::2], deps=("features",))
+
+        # evaluators
+        graph.add("self_disclosure", self._count_self_disclosure_utterances, deps=("participant_features",))
+        graph.add("utterance_stats", calculate_utterance_stats, deps=("participant_features",))
+        graph.add("readability", calculate_avg_readability, deps=("participant_features",))
+        if self.toxicity_evaluator:
+            graph.add("toxicity", self.toxicity_evaluator.evaluate_conversation, deps=("participant_utterances",), lane="io")
+        if self.hate_speech_evaluator:
+            graph.add("hate_speech", self.hate_speech_evaluator.evaluate_conversation, deps=("participant_utterances",))
+        if self.lsm_evaluator:
+            graph.add("lsm", lambda docs, features: self.lsm_evaluator.evaluate_conversation(conversation, docs=docs, features=features), deps=("docs", "features"))
+        if self.idea_adoption_evaluator:
+            graph.add("idea_adoption", self.idea_adoption_evaluator.evaluate_conversation, args=(conversation,))
+        if self.relevance_evaluator:
+            graph.add("relevance_utterances", lambda participant_utterances: [conversation[0]] + participant_utterances, deps=("participant_utterances",))
+            graph.add("embeddings", self.relevance_evaluator.embed, deps=("relevance_utterances",))
+            graph.add("relevance", self.relevance_evaluator.evaluate_conversation, deps=("relevance_utterances", "embeddings"))
+        if self.sentiment_evaluator:
+            graph.add("sentiment", self.sentiment_evaluator.evaluate_conversation, deps=("participant_utterances",))
+        if self.politeness is not None:
+            if hasattr(self.politeness, "annotations"): # in-process backend reuses the parses
+                graph.add("politeness", self._calculate_argumentative_features, deps=("participant_utterances", "participant_docs"))
+            else: # R workers parse the text themselves, no need to wait for spaCy
+                graph.add("politeness", self._calculate_argumentative_features, deps=("participant_utterances",), lane="io")
+
+        return self._conversation_result(self.scheduler.run(graph))
 
+    def _conversation_result(self, results: dict) -> dict:
+        """Assembles the evaluate_conversation dict from per-task results"""
         social_cohesion = {
-            "num_dialogue_exchanges": len(participant_utterances),
-            "num_self_disclosure_utterances": count_self_disclosure_utterances(participant_utterances),
-            "avg_lsm_score": self.lsm_evaluator.evaluate_conversation(conversation)["avg_lsm_score"],
-            "num_ideas_adopted": self.idea_adoption_evaluator.evaluate_conversation(conversation)["participant_2"]["num_ideas_adopted"]
+            "num_dialogue_exchanges": len(results["participant_utterances"]),
+            "num_self_disclosure_utterances": results["self_disclosure"]
         }
-
-        relevance_utterances = [conversation[0]] + participant_utterances
-        num_irrelevant_utterances = self.relevance_evaluator.evaluate_conversation(relevance_utterances)
-
-        def calculate_utterance_stats(utterances):
-            total_words = sum(len(text.split()) for text in utterances)
-            total_chars = sum(len(text) for text in utterances)
-            num_utterances = len(utterances)
-            
-            return {
-                "avg_words": total_words / num_utterances if num_utterances > 0 else 0,
-                "avg_chars": total_chars / num_utterances if num_utterances > 0 else 0
-            }
-        
-        def calculate_avg_readability(utterances):
-            sum_smog_score = 0
-            for utterance in utterances:
-                sum_smog_score += smog_index(utterance)
-            return sum_smog_score / len(utterances)
+        if "lsm" in results:
+            social_cohesion["avg_lsm_score"] = results["lsm"]["avg_lsm_score"]
+        if "idea_adoption" in results:
+            social_cohesion["num_ideas_adopted"] = results["idea_adoption"]["participant_2"]["num_ideas_adopted"]
 
         general_engagement = {
-            **calculate_utterance_stats(participant_utterances),
-            "average_readability": calculate_avg_readability(participant_utterances)
+            **results["utterance_stats"],
+            "average_readability": results["readability"]
+        }
+
+        res = {}
+        antisocialness = {
+            evaluator.name: results[key]
+            for key, evaluator in [("toxicity", self.toxicity_evaluator), ("hate_speech", self.hate_speech_evaluator)]
+            if evaluator is not None
+        }
+        if antisocialness:
+            res["Antisocialness"] = antisocialness
+        res["Social Cohesion"] = social_cohesion
+        if "relevance" in results:
+            res["num_irrelevant_messages"] = results["relevance"]
+        res["General Engagement"] = general_engagement
+        if "sentiment" in results:
+            res["Sentiment"] = results["sentiment"]
+        if "politeness" in results:
+            res["Argumentative Features"] = results["politeness"]
+        return res
+
+    def session(self) -> "ConversationSession":
+        """Turn-by-turn scoring for live conversations, see ConversationSession"""
+        return ConversationSession(self)
+
+    def _count_self_disclosure_utterances(self, features: list[UtteranceFeatures]):
+        count = 0
+        for feats in features:
+            if feats.self_disclosure:
+                count += 1 # counting utterances containing at least 1 self-disclosure
+        return count
+
+    def _calculate_argumentative_features(self, utterances, docs=None):
+        res = {
+            "aggregate": {
+
+            },
+            "utterances": []
         }
 
-        def calculate_argumentative_features(utterances):
-            res = {
-                "aggregate": {
-
-                },
-                "utterances": []
-            }
-
-            for utterance in utterances:
-                r_script = Path(__file__).resolve().parent / "r" / "politeness_eval.R"
-                cmd = ["Rscript", str(r_script), utterance]
-                result = subprocess.run(
-                    cmd,
-                    capture_output=True,
-                    text=True,
-                )
-                if result.returncode != 0 or not result.stdout.strip():
-                    print("R STDERR:\n", result.stderr)
-                    print("R STDOUT:\n", result.stdout)
-                    raise RuntimeError(f"Rscript failed (exit {result.returncode})")
-                politeness_dict = json.loads(result.stdout)
-                res["utterances"].append(politeness_dict)
-
-                for key in politeness_dict.keys(): # averaging for each respective feature, maybe we should just sum all features into one number
-                    res['aggregate'][key] = res['aggregate'].get(key, 0) + politeness_dict[key] 
-
-            for key in res['aggregate'].keys():
-                res['aggregate'][key] /= len(res['utterances'])
-            
-            return res
+        # all utterances are scored in one call to the configured politeness backend
+        for politeness_dict in self.politeness.score(utterances, docs=docs):
+            res["utterances"].append(politeness_dict)
+
+            for key in politeness_dict.keys(): # averaging for each respective feature, maybe we should just sum all features into one number
+                res['aggregate'][key] = res['aggregate'].get(key, 0) + politeness_dict[key] 
+
+        for key in res['aggregate'].keys():
+            res['aggregate'][key] /= len(res['utterances'])
+        
+        return res
+
+class _RunningResults:
+    """An {"aggregate", "utterances"} result built up one utterance at a time, accumulated in the
+    same order as the batch evaluators so the aggregates come out identical. With `labels` the
+    aggregate holds label fractions, otherwise the mean of every key"""
 
+    def __init__(self, labels: tuple = None):
+        self.labels = labels
+        self.totals = dict.fromkeys(labels, 0) if labels else {}
+        self.utterances = []
+
+    def add(self, res: dict):
+        self.utterances.append(res)
+        if self.labels:
+            self.totals[res["label"]] += 1
+        else:
+            for key in res.keys():
+                self.totals[key] = self.totals.get(key, 0) + res[key]
+
+    def result(self) -> dict:
+        num_utterances = len(self.utterances)
         return {
-            "Antisocialness": {
-                self.toxicity_evaluator.name: toxicity_res,
-                self.hate_speech_evaluator.name: hate_speech_res
+            "aggregate": {key: total / num_utterances if num_utterances else total for key, total in self.totals.items()},
+            "utterances": list(self.utterances)
+        }
+
+class ConversationSession:
+    """Incremental EnsembleEvaluator.evaluate_conversation for live conversations. `add_turn`
+    scores only the new utterance and folds it into running totals, returning the same dict a
+    full recompute over every turn so far would (averages are 0 until the participant speaks)"""
+
+    def __init__(self, ensemble: EnsembleEvaluator):
+        self.ensemble = ensemble
+        self.conversation = []
+        self.participant_utterances = []
+        self.num_self_disclosure = 0
+        self.total_words = 0
+        self.total_chars = 0
+        self.sum_smog = 0
+        self.num_irrelevant = 0
+        self.anchor_embedding = None
+        self.toxicity = _RunningResults(("non-toxic", "toxic", "highly-toxic"))
+        self.hate_speech = _RunningResults(("non-hate", "hate"))
+        self.sentiment = _RunningResults()
+        self.politeness = _RunningResults()
+        self.lsm = ensemble.lsm_evaluator.session() if ensemble.lsm_evaluator else None
+        self.idea_adoption = ensemble.idea_adoption_evaluator.session() if ensemble.idea_adoption_evaluator else None
+
+    def add_turn(self, text: str) -> dict:
+        ensemble = self.ensemble
+        is_participant = len(self.conversation) % 2 == 1
+        self.conversation.append(text)
+
+        graph = TaskGraph()
+        graph.add("features", UtteranceFeatures, args=(text, is_participant))
+        if ensemble.conversation_annotations:
+            graph.add("doc", ensemble.documents.parse_one, args=(text, ensemble.conversation_annotations))
+        if self.lsm is not None:
+            graph.add("lsm", lambda doc, features: self.lsm.add_turn(text, doc, features), deps=("doc", "features"))
+        if self.idea_adoption is not None:
+            graph.add("idea_adoption", self.idea_adoption.add_turn, args=(text,))
+        if ensemble.relevance_evaluator and (is_participant or self.anchor_embedding is None):
+            graph.add("embedding", ensemble.relevance_evaluator.embed, args=([text],))
+        if is_participant:
+            if ensemble.toxicity_evaluator:
+                graph.add("toxicity", ensemble.toxicity_evaluator.evaluate_utterance, lane="io", args=(text,))
+            if ensemble.hate_speech_evaluator:
+                graph.add("hate_speech", ensemble.hate_speech_evaluator.evaluate_utterance, args=(text,))
+            if ensemble.sentiment_evaluator:
+                graph.add("sentiment", ensemble.sentiment_evaluator.evaluate_utterance, args=(text,))
+            if ensemble.politeness is not None:
+                if hasattr(ensemble.politeness, "annotations"):
+                    graph.add("politeness", lambda doc: ensemble.politeness.score([text], docs=[doc])[0], deps=("doc",))
+                else:
+                    graph.add("politeness", lambda: ensemble.politeness.score([text])[0], lane="io")
+        results = ensemble.scheduler.run(graph)
+
+        if "embedding" in results and self.anchor_embedding is None:
+            self.anchor_embedding = results["embedding"]
+        elif "embedding" in results:
+            import numpy as np
+            embeddings = np.vstack([self.anchor_embedding, results["embedding"]])
+            res = ensemble.relevance_evaluator.evaluate_batch(self.conversation[0], [text], embeddings, bertscore=False)[0]
+            if ensemble.relevance_evaluator.is_irrelevant(res["cosine_similarity"], res["semantic_similarity"]):
+                self.num_irrelevant += 1
+        if is_participant:
+            features = results["features"]
+            self.participant_utterances.append(text)
+            self.num_self_disclosure += features.self_disclosure
+            self.total_words += features.num_words
+            self.total_chars += features.num_chars
+            self.sum_smog += features.smog
+            for key, running in [("toxicity", self.toxicity), ("hate_speech", self.hate_speech),
+                                 ("sentiment", self.sentiment), ("politeness", self.politeness)]:
+                if key in results:
+                    running.add(results[key])
+        return self.result()
+
+    def result(self) -> dict:
+        ensemble = self.ensemble
+        num_utterances = len(self.participant_utterances)
+        results = {
+            "participant_utterances": self.participant_utterances,
+            "self_disclosure": self.num_self_disclosure,
+            "utterance_stats": {
+                "avg_words": self.total_words / num_utterances if num_utterances > 0 else 0,
+                "avg_chars": self.total_chars / num_utterances if num_utterances > 0 else 0
             },
-            "Social Cohesion": social_cohesion,
-            "num_irrelevant_messages": num_irrelevant_utterances,
-            "General Engagement": general_engagement,
-            "Sentiment": self.sentiment_evaluator.evaluate_conversation(participant_utterances),
-            "Argumentative Features": calculate_argumentative_features(participant_utterances)
+            "readability": self.sum_smog / num_utterances if num_utterances > 0 else 0
         }
+        if ensemble.toxicity_evaluator:
+            results["toxicity"] = self.toxicity.result()
+        if ensemble.hate_speech_evaluator:
+            results["hate_speech"] = self.hate_speech.result()
+        if self.lsm is not None:
+            results["lsm"] = ensemble.lsm_evaluator._score(*self.lsm.speaker_counts)
+        if self.idea_adoption is not None:
+            results["idea_adoption"] = self.idea_adoption.result()
+        if ensemble.relevance_evaluator:
+            results["relevance"] = self.num_irrelevant
+        if ensemble.sentiment_evaluator:
+            results["sentiment"] = self.sentiment.result()
+        if ensemble.politeness is not None:
+            results["politeness"] = self.politeness.result()
+        return ensemble._conversation_result(results)
+
+def check_session(ensemble: EnsembleEvaluator, conversation: list[str], rel_tol: float = 1e-6) -> list[str]:
+    """Feeds `conversation` through a ConversationSession and compares the result after every
+    participant turn with a full evaluate_conversation over the same prefix. Returns the paths
+    that differ (floats within `rel_tol`, since batched and single-text forward passes can differ
+    in the last bits); an empty list means the two agree"""
+    import math
+    mismatches = []
+
+    def compare(path, incremental, full):
+        if isinstance(full, dict) and isinstance(incremental, dict):
+            for key in full.keys() | incremental.keys():
+                compare(f"{path}.{key}", incremental.get(key), full.get(key))
+        elif isinstance(full, list) and isinstance(incremental, list) and len(full) == len(incremental):
+            for idx, (a, b) in enumerate(zip(incremental, full)):
+                compare(f"{path}[{idx}]", a, b)
+        elif isinstance(full, float) and isinstance(incremental, (int, float)):
+            if not math.isclose(incremental, full, rel_tol=rel_tol, abs_tol=rel_tol):
+                mismatches.append(f"{path}: {incremental} != {full}")
+        elif incremental != full:
+            mismatches.append(f"{path}: {incremental} != {full}")
+
+    session = ensemble.session()
+    for idx, text in enumerate(conversation):
+        incremental = session.add_turn(text)
+        if idx % 2 == 1:
+            compare(f"turn {idx}", incremental, ensemble.evaluate_conversation(conversation[:idx + 1]))
+    return mismatches
+
+def conversation_features(conversation: list[str]) -> list[UtteranceFeatures]:
+    return [UtteranceFeatures(text, readability=idx % 2 == 1) for idx, text in enumerate(conversation)]
+
+def _as_features(utterances: list, readability: bool = True) -> list[UtteranceFeatures]:
+    return [UtteranceFeatures(utterance, readability) if isinstance(utterance, str) else utterance for utterance in utterances]
+
+def calculate_utterance_stats(utterances):
+    """`utterances` are UtteranceFeatures records (raw texts are tokenized first)"""
+    features = _as_features(utterances, readability=False)
+    total_words = sum(feats.num_words for feats in features)
+    total_chars = sum(feats.num_chars for feats in features)
+    num_utterances = len(features)
+    
+    return {
+        "avg_words": total_words / num_utterances if num_utterances > 0 else 0,
+        "avg_chars": total_chars / num_utterances if num_utterances > 0 else 0
+    }
+
+def calculate_avg_readability(utterances):
+    """Mean SMOG index of UtteranceFeatures records (raw texts are scored first)"""
+    sum_smog_score = 0
+    for feats in _as_features(utterances):
+        sum_smog_score += feats.smog
+    return sum_smog_score / len(utterances)
 
 if __name__ == "__main__":
     conversation = [
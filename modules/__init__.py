@@ -1,15 +1,72 @@
 # modules/__init__.py
 from abc import ABC, abstractmethod
+import os, threading
+from modules.metrics import instrument, registry
+
+def available_cores() -> int:
+    """Number of cores this process is allowed to run on"""
+    if hasattr(os, "sched_getaffinity"):
+        return max(1, len(os.sched_getaffinity(0)))
+    return max(1, os.cpu_count() or 1)
+
+class lazy_property:
+    """Like functools.cached_property, but the first computation is guarded by a lock so that
+    concurrent callers load a model only once"""
+
+    def __init__(self, func):
+        self.func = func
+        self.name = func.__name__
+        self.__doc__ = func.__doc__
+        self.lock = threading.Lock()
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        if self.name in instance.__dict__:
+            return instance.__dict__[self.name]
+        with self.lock:
+            if self.name not in instance.__dict__:
+                instance.__dict__[self.name] = self.func(instance)
+        return instance.__dict__[self.name]
 
 class Evaluator(ABC):
     """
     Abstract base class for all utterance evaluators.
     Each subclass should implement an `evaluate(text: str)` method
     """
+    version = 1 # bump when an evaluator's scores change, so its cached results are not reused
+
+    def __init_subclass__(cls, **kwargs):
+        # every evaluate_* method is timed when metrics are enabled, see modules.metrics
+        super().__init_subclass__(**kwargs)
+        for attr, value in list(vars(cls).items()):
+            if attr.startswith("evaluate_") and callable(value) and not getattr(value, "_instrumented", False):
+                setattr(cls, attr, instrument(value))
 
     def __init__(self, name: str):
         self.name = name
 
+    def profile(self, enabled: bool = True):
+        """Opt in to cProfile (and trace spans, if tracing is on) for this evaluator's calls"""
+        registry.profile(self.name, enabled)
+
+    def profile_stats(self, sort: str = "cumulative", limit: int = 30) -> str:
+        return registry.profile_stats(self.name, sort, limit)
+
+    def load_models(self):
+        """Load this evaluator's models into the process-wide registry (modules.models) and
+        nothing else: no clients, threads or worker processes, so it is safe to call before
+        forking. Override if applicable."""
+        pass
+
+    def warmup(self):
+        """Load models eagerly (e.g. before a server starts taking traffic). Models are otherwise
+        loaded on first use. Override if applicable."""
+        self.load_models()
+
     def evaluate_utterance(self, text: str) -> dict:
         """Evaluate a single utterance. Override if applicable."""
         raise NotImplementedError(
@@ -0,0 +1,66 @@
+import numpy as np
+
+COMBINE = ("max", "mean")
+
+class TokenBudgetBatcher:
+    """Splits tokenized texts into overlapping windows that fit the model, and packs windows from
+    many texts into batches whose padded size (windows x longest window) stays under
+    `token_budget`, so a long post is scored in full and never inflates a batch of short ones.
+    Window results are combined back per text with `combine` ("max" or "mean")"""
+
+    def __init__(self, max_length: int = 512, num_special_tokens: int = 2, stride: int = 128,
+                 token_budget: int = 8192, max_batch_size: int = None, combine: str = "max"):
+        """`max_length` includes the `num_special_tokens` the model adds ([CLS]/[SEP] for BERT),
+        consecutive windows share `stride` tokens"""
+        if combine not in COMBINE:
+            raise ValueError(f"Unknown combine '{combine}', expected one of {COMBINE}")
+        self.window_length = max_length - num_special_tokens
+        if not 0 <= stride < self.window_length:
+            raise ValueError(f"stride must be in [0, {self.window_length})")
+        self.num_special_tokens = num_special_tokens
+        self.stride = stride
+        self.token_budget = max(token_budget, max_length) # a full window must always fit
+        self.max_batch_size = max_batch_size
+        self.combine_mode = combine
+
+    def split(self, token_ids: list[list[int]]) -> tuple[list[int], list[list[int]]]:
+        """(owner text index, window token ids) for every window, at least one per text"""
+        owners, windows = [], []
+        step = self.window_length - self.stride
+        for owner, ids in enumerate(token_ids):
+            start = 0
+            while True:
+                owners.append(owner)
+                windows.append(ids[start:start + self.window_length])
+                if start + self.window_length >= len(ids):
+                    break
+                start += step
+        return owners, windows
+
+    def batches(self, lengths: list[int], max_batch_size: int = None) -> list[list[int]]:
+        """Window indices grouped into batches, shortest first. `lengths` exclude special tokens"""
+        max_batch_size = max_batch_size or self.max_batch_size
+        order = sorted(range(len(lengths)), key=lambda idx: lengths[idx])
+        res, batch = [], []
+        for idx in order:
+            padded_length = lengths[idx] + self.num_special_tokens # sorted, so the batch's longest
+            if batch and ((len(batch) + 1) * padded_length > self.token_budget or len(batch) == max_batch_size):
+                res.append(batch)
+                batch = []
+            batch.append(idx)
+        if batch:
+            res.append(batch)
+        return res
+
+    def combine(self, owners: list[int], values, num_texts: int, combine: str = None) -> np.ndarray:
+        """Per-text max or mean of window `values` (scalars or vectors, one row per window)"""
+        combine = combine or self.combine_mode
+        values, owners = np.asarray(values, dtype=float), np.asarray(owners)
+        if combine == "max":
+            res = np.full((num_texts, *values.shape[1:]), -np.inf)
+            np.maximum.at(res, owners, values)
+            return res
+        res = np.zeros((num_texts, *values.shape[1:]))
+        np.add.at(res, owners, values)
+        counts = np.bincount(owners, minlength=num_texts).reshape(-1, *[1] * (values.ndim - 1))
+        return res / counts
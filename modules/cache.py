@@ -0,0 +1,168 @@
+from collections import Counter, OrderedDict
+from modules.metrics import registry
+import hashlib, json, os, sqlite3, threading, time
+
+class ResultCache:
+    """Content-addressed cache for per-utterance results, keyed on (namespace, text hash) where the
+    namespace names the evaluator, its version and any config that changes scores. Values are
+    stored JSON-encoded, so callers always get a fresh copy.
+
+    Two tiers: an in-process LRU of `max_entries` results, and optionally a SQLite file at `path`
+    shared by every process pointing at it (WAL mode, so concurrent readers and writers don't
+    block each other). The file is trimmed to `max_bytes` by evicting least recently used rows"""
+    EVICT_EVERY = 1000 # disk writes between size checks
+
+    def __init__(self, max_entries: int = 100_000, path: str = None, max_bytes: int = 1 << 30):
+        self.max_entries = max_entries
+        self.path = path
+        self.max_bytes = max_bytes
+        self.enabled = max_entries > 0 or path is not None
+        self.memory = OrderedDict()
+        self.stats = Counter()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+        self._writes = 0
+
+    @staticmethod
+    def key(namespace: str, text: str) -> str:
+        return hashlib.blake2b(f"{namespace}\0{text}".encode(), digest_size=16).hexdigest()
+
+    def _db(self) -> sqlite3.Connection:
+        # connections must not cross a fork, each process opens its own
+        if self._conn is None or self._conn_pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            self._conn_pid = os.getpid()
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+        return self._conn
+
+    def get_many(self, keys) -> dict:
+        """{key: encoded value} for every key found in either tier"""
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self.memory:
+                    self.memory.move_to_end(key)
+                    found[key] = self.memory[key]
+            self.stats["memory_hits"] += len(found)
+            missing = [key for key in keys if key not in found]
+            if missing and self.path is not None:
+                db = self._db()
+                disk = {}
+                for start in range(0, len(missing), 500): # SQLite caps bound parameters
+                    chunk = missing[start:start + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    disk.update(db.execute(f"SELECT key, value FROM results WHERE key IN ({placeholders})", chunk))
+                    db.execute(f"UPDATE results SET accessed = ? WHERE key IN ({placeholders})", [time.time(), *chunk])
+                self.stats["disk_hits"] += len(disk)
+                for key, value in disk.items():
+                    self._remember(key, value)
+                found.update(disk)
+            self.stats["misses"] += len(keys) - len(found)
+        registry.inc("evaluator_cache_hits_total", len(found), cache="results")
+        registry.inc("evaluator_cache_misses_total", len(keys) - len(found), cache="results")
+        return found
+
+    def _remember(self, key: str, value: str):
+        if self.max_entries <= 0:
+            return
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def put_many(self, items: dict):
+        with self._lock:
+            for key, value in items.items():
+                self._remember(key, value)
+            if self.path is None or not items:
+                return
+            now = time.time()
+            db = self._db()
+            db.executemany(
+                "INSERT OR REPLACE INTO results (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                [(key, value, len(key) + len(value), now) for key, value in items.items()]
+            )
+            self._writes += len(items)
+            if self._writes >= self.EVICT_EVERY:
+                self._writes = 0
+                self._evict(db)
+
+    def _evict(self, db: sqlite3.Connection):
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - int(self.max_bytes * 0.9) # leave headroom so we don't evict on every check
+        stale = []
+        for key, size in db.execute("SELECT key, size FROM results ORDER BY accessed"):
+            stale.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        db.executemany("DELETE FROM results WHERE key = ?", stale)
+        self.stats["evictions"] += len(stale)
+
+    def map(self, namespace: str, texts: list[str], fn) -> list:
+        """`fn(texts) -> results` applied through the cache: only texts not cached yet (each once,
+        however often it repeats) are passed to `fn`. Results come back in input order"""
+        if not self.enabled:
+            return list(fn(texts))
+        keys = [self.key(namespace, text) for text in texts]
+        found = self.get_many(list(dict.fromkeys(keys)))
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        if missing:
+            computed = {key: json.dumps(value) for key, value in zip(missing, fn(list(missing.values())))}
+            self.put_many(computed)
+            found.update(computed)
+        return [json.loads(found[key]) for key in keys]
+
+    def report(self) -> dict:
+        """Hit counts and rate since this process started (or the last clear)"""
+        with self._lock:
+            stats = dict(self.stats)
+            lookups = stats.get("memory_hits", 0) + stats.get("disk_hits", 0) + stats.get("misses", 0)
+            return {
+                **stats,
+                "hit_rate": (lookups - stats.get("misses", 0)) / lookups if lookups else 0.0,
+                "memory_entries": len(self.memory)
+            }
+
+    def clear(self):
+        with self._lock:
+            self.memory.clear()
+            self.stats.clear()
+            if self.path is not None:
+                self._db().execute("DELETE FROM results")
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._conn_pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+def get_result_cache() -> ResultCache:
+    """Process-wide result cache shared by every evaluator. Configured through the environment
+    (e.g. in .env.local): RESULT_CACHE_ENTRIES (in-memory LRU size, 0 disables it),
+    RESULT_CACHE_PATH (SQLite file shared across processes, off by default) and
+    RESULT_CACHE_MAX_MB (disk tier size limit)"""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = ResultCache(
+                max_entries=int(os.getenv("RESULT_CACHE_ENTRIES", 100_000)),
+                path=os.getenv("RESULT_CACHE_PATH") or None,
+                max_bytes=int(float(os.getenv("RESULT_CACHE_MAX_MB", 1024)) * (1 << 20))
+            )
+        return _shared_cache
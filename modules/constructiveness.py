@@ -1,10 +1,12 @@
 from modules import Evaluator
-from textstat import smog_index
-import json, subprocess
-from pathlib import Path
-import spacy
+from modules.cache import get_result_cache
+from modules.documents import DocumentService, get_document_service
+from modules.features import UtteranceFeatures
+from modules.lexicon import PhraseMatcher
+from modules.politeness import get_politeness_backend
 
 class ConstructivenessEvaluator(Evaluator):
+    annotations = DocumentService.ALL
     discourse_connectives = {
         "and", "or", "for", "as", "if", "so", "when", "but",
         "one", "then", "now", "after", "before", "here", "never", "since", 
@@ -141,30 +143,41 @@ class ConstructivenessEvaluator(Evaluator):
         "doubt", "wonder", "question"
     }
 
-    def __init__(self):
+    # lexicons compiled once into token-boundary automata
+    discourse_matcher = PhraseMatcher(discourse_connectives)
+    stance_matcher = PhraseMatcher(stance_adverbials)
+
+    def __init__(self, politeness_backend: str = "rscript", politeness_workers: int = None):
         super().__init__(name="Constructiveness")
+        self.politeness = get_politeness_backend(politeness_backend, politeness_workers)
+        self.documents = get_document_service()
+
+    def load_models(self):
+        self.documents.nlp
+
+    def warmup(self):
+        self.load_models()
+        if hasattr(self.politeness, "warmup"):
+            self.politeness.warmup()
 
-    def evaluate_utterance(self, text: str) -> dict:
-        word_count = len(text.split())
-        readability = smog_index(text)
+    def evaluate_utterance(self, text: str, doc=None, features: UtteranceFeatures = None) -> dict:
+        # the two politeness backends score differently, so each gets its own cache entries
+        namespace = f"{self.name}/v{self.version}/{type(self.politeness).__name__}"
+        return get_result_cache().map(namespace, [text], lambda _: [self._evaluate(text, doc, features)])[0]
 
-        # Computing politeness features with R script (annoying)
-        r_script = Path(__file__).resolve().parent.parent / "r" / "politeness_eval.R"
-        cmd = ["Rscript", str(r_script), text]
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-        )
-        if result.returncode != 0 or not result.stdout.strip():
-            print("R STDERR:\n", result.stderr)
-            print("R STDOUT:\n", result.stdout)
-            raise RuntimeError(f"Rscript failed (exit {result.returncode})")
-        politeness_dict = json.loads(result.stdout)
+    def _evaluate(self, text: str, doc=None, features: UtteranceFeatures = None) -> dict:
+        if features is None or features.smog is None:
+            features = UtteranceFeatures(text)
+        word_count = features.num_words
+        readability = features.smog
+
+        if doc is None:
+            doc = self.documents.parse_one(text, self.annotations)
+
+        # Computing politeness features (persistent R workers or in-process from the parse above)
+        politeness_dict = self.politeness.score([text], docs=[doc])[0]
 
         # Counting named entities
-        nlp = spacy.load("en_core_web_sm")
-        doc = nlp(text)
         num_entities = len(doc.ents)
 
         # Counting argumentative features
@@ -176,14 +189,9 @@ class ConstructivenessEvaluator(Evaluator):
             "full_root_clauses": 0,
             "partial_root_clauses": 0
         }
-        text = text.lower()
-        for dc in self.discourse_connectives:
-            if dc in text:
-                argumentative_features["discourse_connectives"] = argumentative_features.get("discourse_connectives", 0) + 1
-        
-        for stance_adverbial in self.stance_adverbials:
-            if stance_adverbial in text:
-                argumentative_features["stance_adverbials"] = argumentative_features.get("stance_adverbials", 0) + 1
+        # counting distinct lexicon entries present, each found in a single pass over the text
+        argumentative_features["discourse_connectives"] = len(self.discourse_matcher.counts(text))
+        argumentative_features["stance_adverbials"] = len(self.stance_matcher.counts(text))
         
         for token in doc:
             if token.pos_ == "VERB" and token.lemma_.lower() in self.reasoning_lemmas:
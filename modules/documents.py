@@ -0,0 +1,59 @@
+from modules.metrics import registry
+from modules.models import get_model_registry
+import threading
+
+class DocumentService:
+    """Loads a spaCy pipeline once per process and parses utterances in batches with `nlp.pipe`.
+    Consumers declare which annotations they need ("tag", "lemma", "dep", "ents") and every
+    component nobody asked for is disabled for that parse"""
+    COMPONENTS = {
+        "tag": {"tok2vec", "tagger", "attribute_ruler"},
+        "lemma": {"tok2vec", "tagger", "attribute_ruler", "lemmatizer"},
+        "dep": {"tok2vec", "parser"}, # also provides sentence boundaries
+        "ents": {"ner"}
+    }
+    ALL = frozenset(COMPONENTS)
+
+    def __init__(self, model: str = "en_core_web_sm", batch_size: int = 64, n_process: int = 1):
+        self.model = model
+        self.batch_size = batch_size
+        self.n_process = n_process
+
+    @property
+    def nlp(self):
+        import spacy
+        return get_model_registry().get(f"spacy:{self.model}", lambda: spacy.load(self.model))
+
+    def _disabled(self, annotations) -> list[str]:
+        needed = set()
+        for annotation in annotations:
+            needed |= self.COMPONENTS[annotation]
+        return [name for name in self.nlp.pipe_names if name not in needed]
+
+    def parse(self, texts: list[str], annotations=ALL, n_process: int = None) -> list:
+        """Parses every text exactly once, returning Docs in input order"""
+        if not texts:
+            return []
+        n_process = n_process or self.n_process
+        with registry.timer("evaluator_parse_duration_seconds", annotations=",".join(sorted(annotations))):
+            return list(self.nlp.pipe(
+                texts,
+                disable=self._disabled(annotations),
+                batch_size=self.batch_size,
+                # forking workers only pays off for larger batches
+                n_process=n_process if len(texts) >= self.batch_size else 1
+            ))
+
+    def parse_one(self, text: str, annotations=ALL):
+        return self.parse([text], annotations, n_process=1)[0]
+
+_shared_service = None
+_shared_service_lock = threading.Lock()
+
+def get_document_service() -> DocumentService:
+    """Process-wide document service shared by every evaluator that needs spaCy parses"""
+    global _shared_service
+    with _shared_service_lock:
+        if _shared_service is None:
+            _shared_service = DocumentService()
+        return _shared_service
@@ -0,0 +1,212 @@
+from modules.metrics import registry
+import hashlib, json, os, threading
+import numpy as np
+try:
+    import fcntl
+except ImportError: # no cross-process append lock on Windows, one writer per store there
+    fcntl = None
+
+KEY_SIZE = 16
+
+class EmbeddingStore:
+    """Append-only, memory-mapped store of unit-length embeddings keyed by utterance hash, so a
+    corpus is encoded once across runs and processes. Lives in `path` as three files per `name`
+    (one name per model/config): <name>.vectors (float32 rows), <name>.keys (one 16-byte blake2b
+    digest per row) and <name>.json (the dimension).
+
+    Rows are written before their keys, so a key always has its vector even if a writer dies
+    mid-append. Appends take an exclusive lock on the keys file, readers never lock: they pick
+    up other processes' rows by reading the keys file past what they have seen"""
+
+    def __init__(self, path: str, name: str):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.name = name
+        self.vectors_path = os.path.join(path, f"{name}.vectors")
+        self.keys_path = os.path.join(path, f"{name}.keys")
+        self.meta_path = os.path.join(path, f"{name}.json")
+        self.dim = None
+        self.rows = {} # key -> row
+        self._mmap = None
+        self._lock = threading.Lock()
+        self._refresh()
+
+    @staticmethod
+    def key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode(), digest_size=KEY_SIZE).digest()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, text: str):
+        return self.key(text) in self.rows
+
+    def _refresh(self):
+        """Reads keys appended (by any process) since the last refresh"""
+        if self.dim is None and os.path.exists(self.meta_path): # written before the first key
+            with open(self.meta_path) as f:
+                self.dim = json.load(f)["dim"]
+        if not os.path.exists(self.keys_path):
+            return
+        with open(self.keys_path, "rb") as f:
+            f.seek(len(self.rows) * KEY_SIZE)
+            data = f.read()
+        for offset in range(0, len(data) - len(data) % KEY_SIZE, KEY_SIZE): # ignore a half-written key
+            self.rows.setdefault(data[offset:offset + KEY_SIZE], len(self.rows))
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """(rows x dim) read-only memory map over every stored vector"""
+        if not self.rows:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        if self._mmap is None or len(self._mmap) < len(self.rows): # remap after appends
+            self._mmap = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(len(self.rows), self.dim))
+        return self._mmap[:len(self.rows)]
+
+    def get_many(self, texts: list[str]) -> tuple[np.ndarray, list[int]]:
+        """(vectors of the stored texts, indices of texts that are not stored)"""
+        with self._lock:
+            self._refresh()
+            rows = [self.rows.get(self.key(text)) for text in texts]
+        missing = [idx for idx, row in enumerate(rows) if row is None]
+        found = [row for row in rows if row is not None]
+        registry.inc("evaluator_cache_hits_total", len(found), cache="embeddings")
+        registry.inc("evaluator_cache_misses_total", len(missing), cache="embeddings")
+        return np.array(self.vectors[found]) if found else np.zeros((0, self.dim or 0), dtype=np.float32), missing
+
+    def add(self, texts: list[str], vectors: np.ndarray):
+        """Appends the vectors of texts not stored yet (by this or any other process)"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if not len(texts):
+            return
+        with self._lock, open(self.keys_path, "ab") as keys_file:
+            if fcntl is not None:
+                fcntl.flock(keys_file, fcntl.LOCK_EX) # released on close
+            self._refresh()
+            if self.dim is None:
+                with open(f"{self.meta_path}.tmp", "w") as f:
+                    json.dump({"dim": vectors.shape[1]}, f)
+                os.replace(f"{self.meta_path}.tmp", self.meta_path) # readers never see it half-written
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Store '{self.name}' holds {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+            new = {}
+            for text, vector in zip(texts, vectors):
+                key = self.key(text)
+                if key not in self.rows:
+                    new.setdefault(key, vector)
+            if not new:
+                return
+            with open(self.vectors_path, "ab") as vectors_file:
+                # a crashed writer may have left rows without keys, overwrite them
+                vectors_file.truncate(len(self.rows) * self.dim * 4)
+                vectors_file.write(np.stack(list(new.values())).tobytes())
+            keys_file.truncate(len(self.rows) * KEY_SIZE) # and half a key
+            keys_file.write(b"".join(new))
+            keys_file.flush()
+            for key in new:
+                self.rows[key] = len(self.rows)
+
+    def map(self, texts: list[str], fn) -> np.ndarray:
+        """Vectors for `texts` in input order, only texts not stored yet (each once) go through
+        `fn(texts) -> vectors` and are appended"""
+        texts = list(texts)
+        found, missing = self.get_many(texts)
+        if not missing:
+            return found
+        unique = list(dict.fromkeys(texts[idx] for idx in missing))
+        self.add(unique, fn(unique))
+        with self._lock:
+            rows = [self.rows[self.key(text)] for text in texts]
+        return np.array(self.vectors[rows])
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Column indices of the k highest scores per row, best first"""
+    if k < scores.shape[1]:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=1)
+
+class TopKIndex:
+    """Top-k cosine search over unit-length vectors (e.g. EmbeddingStore.vectors, read straight
+    from the memory map). Exact search is a blocked matrix product with a running top-k per query.
+
+    With `num_lists`, the index is approximate (IVF): vectors are clustered by spherical k-means
+    and a query only scans the `nprobe` clusters whose centroids are closest, so a search touches
+    roughly nprobe / num_lists of the corpus at the cost of occasionally missing a neighbour"""
+    BLOCK_ROWS = 65536
+
+    def __init__(self, vectors: np.ndarray, ids: list = None, num_lists: int = 0, nprobe: int = 8,
+                 iterations: int = 10, seed: int = 0):
+        self.vectors = vectors
+        self.ids = ids
+        self.nprobe = nprobe
+        self.centroids = None
+        self.lists = None
+        if num_lists and len(vectors) > num_lists:
+            self._train(num_lists, iterations, np.random.default_rng(seed))
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        return np.concatenate([
+            np.argmax(vectors[start:start + self.BLOCK_ROWS] @ self.centroids.T, axis=1)
+            for start in range(0, len(vectors), self.BLOCK_ROWS)
+        ])
+
+    def _train(self, num_lists: int, iterations: int, rng: np.random.Generator):
+        sample_size = min(len(self.vectors), 256 * num_lists)
+        sample = np.asarray(self.vectors[np.sort(rng.choice(len(self.vectors), sample_size, replace=False))])
+        self.centroids = sample[rng.choice(len(sample), num_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = self._assign(sample)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, assignment, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0 # keep the old centroid of clusters that lost every member
+            self.centroids[~empty] = sums[~empty] / norms[~empty]
+        assignment = self._assign(self.vectors)
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.searchsorted(assignment[order], np.arange(num_lists + 1))
+        self.lists = [order[start:end] for start, end in zip(bounds, bounds[1:])]
+
+    def search(self, queries: np.ndarray, k: int = 10, exact: bool = False) -> tuple[np.ndarray, np.ndarray]:
+        """(indices, scores), each queries x min(k, len(index)), best first. Indices are mapped
+        through `ids` when the index has them. `exact=True` scans everything even when the index
+        is approximate. Approximate searches that find fewer than k candidates pad with index -1
+        (id None) and score -inf"""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        k = min(k, len(self))
+        if exact or self.centroids is None:
+            indices, scores = self._search_exact(queries, k)
+        else:
+            indices, scores = self._search_lists(queries, k)
+        if self.ids is not None:
+            indices = np.where(indices >= 0, np.asarray(self.ids, dtype=object)[indices], None)
+        return indices, scores
+
+    def _search_exact(self, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_indices = np.zeros((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(self), self.BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + self.BLOCK_ROWS])
+            scores = np.concatenate([best_scores, queries @ block.T], axis=1)
+            indices = np.concatenate([best_indices, np.broadcast_to(np.arange(start, start + len(block)), (len(queries), len(block)))], axis=1)
+            top = _top_k(scores, k)
+            best_scores, best_indices = np.take_along_axis(scores, top, axis=1), np.take_along_axis(indices, top, axis=1)
+        return best_indices, best_scores
+
+    def _search_lists(self, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        probes = _top_k(queries @ self.centroids.T, min(self.nprobe, len(self.centroids)))
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for row, query in enumerate(queries):
+            candidates = np.sort(np.concatenate([self.lists[probe] for probe in probes[row]])) # sequential reads
+            candidate_scores = np.asarray(self.vectors[candidates]) @ query
+            top = _top_k(candidate_scores[None], min(k, len(candidates)))[0]
+            indices[row, :len(top)] = candidates[top]
+            scores[row, :len(top)] = candidate_scores[top]
+        return indices, scores
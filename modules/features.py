@@ -0,0 +1,74 @@
+from array import array
+import re, sys
+
+_NON_WORD = re.compile(r"[^\w']")
+
+# pronoun flags, one bit per person
+FIRST_PERSON_SINGULAR = 1
+FIRST_PERSON_PLURAL = 2
+SECOND_PERSON = 4
+THIRD_PERSON = 8
+PRONOUNS = {
+    **dict.fromkeys(["i", "me", "my", "mine", "myself", "meself"], FIRST_PERSON_SINGULAR), # self-disclosure
+    **dict.fromkeys(["we", "us", "our", "ours", "ourselves"], FIRST_PERSON_PLURAL),
+    **dict.fromkeys(["you", "your", "yours", "yourself", "yourselves"], SECOND_PERSON),
+    **dict.fromkeys(["he", "him", "his", "himself", "she", "her", "hers", "herself", "they", "them",
+                     "their", "theirs", "themselves"], THIRD_PERSON)
+}
+
+_lsm_masks = None
+
+def _lsm_categories() -> tuple:
+    global _lsm_masks
+    if _lsm_masks is None: # imported late, the LSM module consumes this one
+        from modules.linguistic_style_matching import LSMEvaluator
+        _lsm_masks = LSMEvaluator.word_categories, len(LSMEvaluator.categories)
+    return _lsm_masks
+
+class UtteranceFeatures:
+    """Cheap lexical statistics of one utterance, computed once and shared by every evaluator
+    instead of each re-splitting the text. Tokens are lower-cased, punctuation-stripped and
+    interned, so a corpus of records shares one copy of every word"""
+    __slots__ = ("tokens", "num_words", "num_chars", "num_sentences", "num_polysyllables", "smog", "pronouns",
+                 "lsm_counts")
+
+    def __init__(self, text: str, readability: bool = True):
+        """`readability=False` skips the textstat sentence/syllable counts (left as None)"""
+        word_categories, num_categories = _lsm_categories()
+        lsm_counts = array("I", [0] * num_categories)
+        pronouns = 0
+        tokens = []
+        for word in text.lower().split():
+            token = sys.intern(_NON_WORD.sub('', word))
+            tokens.append(token)
+            pronouns |= PRONOUNS.get(token, 0)
+            mask = word_categories.get(token, 0)
+            bit = 0
+            while mask:
+                if mask & 1:
+                    lsm_counts[bit] += 1
+                mask >>= 1
+                bit += 1
+
+        self.tokens = tuple(tokens)
+        self.num_words = len(tokens)
+        self.num_chars = len(text)
+        self.pronouns = pronouns
+        self.lsm_counts = lsm_counts # one count per LSMEvaluator.categories entry
+        self.num_sentences = self.num_polysyllables = self.smog = None
+        if readability:
+            import textstat
+            # textstat memoizes these per text, so smog_index reuses both counts
+            self.num_sentences = textstat.sentence_count(text)
+            self.num_polysyllables = textstat.polysyllabcount(text)
+            self.smog = textstat.smog_index(text)
+
+    @property
+    def self_disclosure(self) -> bool:
+        return bool(self.pronouns & FIRST_PERSON_SINGULAR)
+
+    def __repr__(self):
+        return f"<UtteranceFeatures words={self.num_words} sentences={self.num_sentences} smog={self.smog}>"
+
+def extract_features(texts: list[str], readability: bool = True) -> list[UtteranceFeatures]:
+    return [UtteranceFeatures(text, readability) for text in texts]
@@ -0,0 +1,300 @@
+from array import array
+import json
+import numpy as np
+
+SEP = "/" # nested dict keys are flattened into column paths like "Antisocialness/Toxicity/score"
+
+def _is_section(value) -> bool:
+    return isinstance(value, dict) and "utterances" in value and "aggregate" in value
+
+def _flatten(value: dict, prefix: str = ""):
+    """Yields (path, leaf) for every non-dict value"""
+    for key, item in value.items():
+        path = f"{prefix}{key}"
+        if isinstance(item, dict) and not _is_section(item):
+            yield from _flatten(item, path + SEP)
+        else:
+            yield path, item
+
+def _nest(items) -> dict:
+    res = {}
+    for path, value in items:
+        *parents, key = path.split(SEP)
+        node = res
+        for parent in parents:
+            node = node.setdefault(parent, {})
+        node[key] = value
+    return res
+
+class _Column:
+    """Typed, append-only column: bools, ints and floats in compact arrays, strings as codes.
+    Missing values (None) are NaN in numeric columns and the None category in string columns"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.values = None
+        self.categories = None
+        self.num_missing = 0 # leading Nones, appended once the column's type is known
+
+    def __len__(self):
+        return self.num_missing if self.values is None else len(self.values)
+
+    def append(self, value):
+        if self.values is None:
+            if value is None:
+                self.num_missing += 1
+                return
+            if isinstance(value, str):
+                self.values, self.categories = array("i"), {}
+            elif isinstance(value, bool):
+                self.values = array("b")
+            elif isinstance(value, int):
+                self.values = array("q")
+            else:
+                self.values = array("d")
+            for _ in range(self.num_missing):
+                self.append(None)
+            self.num_missing = 0
+        if value is not None and isinstance(value, str) != (self.categories is not None):
+            raise ValueError(f"Column '{self.path}' mixes strings and numbers, results with different schemas can't share a frame")
+        if self.categories is not None:
+            value = self.categories.setdefault(value, len(self.categories))
+        elif value is None:
+            value = float("nan")
+        if isinstance(value, float) and self.values.typecode != "d":
+            self.values = array("d", self.values) # int column turned out to hold floats
+        self.values.append(value)
+
+    def pad(self, length: int):
+        """Appends missing values up to `length` rows, for rows whose result lacked this key"""
+        while len(self) < length:
+            self.append(None)
+
+    def to_numpy(self) -> tuple:
+        if self.values is None: # never saw a value
+            return np.full(self.num_missing, np.nan), None
+        values = np.frombuffer(self.values, dtype=self.values.typecode).copy() if self.values else np.zeros(0)
+        if self.values.typecode == "b":
+            values = values.astype(bool)
+        return values, list(self.categories) if self.categories is not None else None
+
+class FrameBuilder:
+    """Accumulates EnsembleEvaluator.evaluate_conversation results into typed columns, one
+    conversation at a time, without keeping the result dicts around. Results may differ in
+    their keys (e.g. a resumed batch run with other --evaluators): every column is padded with
+    missing values for the conversations and utterances that lack it"""
+
+    def __init__(self):
+        self.ids = []
+        self.layout = {} # path -> "scalar" | "section", in first-seen order
+        self.conversation_columns = {}
+        self.sections = {} # path -> {"conversation": array, "turn": array, "columns": {key: _Column}}
+        self.aggregate_keys = {} # label sections keep every label, even ones never seen
+
+    def add(self, conversation_id, result: dict):
+        conversation = len(self.ids)
+        self.ids.append(str(conversation_id))
+        for path, value in _flatten(result):
+            if _is_section(value):
+                self.layout.setdefault(path, "section")
+                self._add_section(path, conversation, value)
+            else:
+                self.layout.setdefault(path, "scalar")
+                column = self.conversation_columns.setdefault(path, _Column(path))
+                column.pad(conversation)
+                column.append(value)
+        for column in self.conversation_columns.values():
+            column.pad(len(self.ids))
+
+    def _add_section(self, path: str, conversation: int, section: dict):
+        table = self.sections.setdefault(path, {"conversation": array("i"), "turn": array("i"), "columns": {}})
+        self.aggregate_keys.setdefault(path, list(section["aggregate"]))
+        for turn, utterance in enumerate(section["utterances"]):
+            row = len(table["turn"])
+            table["conversation"].append(conversation)
+            table["turn"].append(turn)
+            for key, value in _flatten(utterance):
+                column = table["columns"].setdefault(key, _Column(f"{path}{SEP}{key}"))
+                column.pad(row)
+                column.append(value)
+            for column in table["columns"].values():
+                column.pad(row + 1)
+
+    def build(self) -> "ResultFrame":
+        columns, categories = {}, {}
+        for path, column in self.conversation_columns.items():
+            columns[path], categories[path] = column.to_numpy()
+        sections = {}
+        for path, table in self.sections.items():
+            section_columns = {}
+            for key, column in table["columns"].items():
+                section_columns[key], categories[f"{path}{SEP}{key}"] = column.to_numpy()
+            sections[path] = {
+                "conversation": np.frombuffer(table["conversation"], dtype=np.int32).copy(),
+                "turn": np.frombuffer(table["turn"], dtype=np.int32).copy(),
+                "columns": section_columns
+            }
+        meta = {
+            "layout": self.layout,
+            "categories": {path: cats for path, cats in categories.items() if cats is not None},
+            "aggregate_keys": self.aggregate_keys
+        }
+        return ResultFrame(np.array(self.ids, dtype=str), columns, sections, meta)
+
+class ResultFrame:
+    """Columnar corpus results: conversation-level scalars as one row per conversation, and every
+    per-utterance section ({"aggregate", "utterances"} in the dict output) as its own table keyed
+    by (conversation, turn). Aggregates are vectorized group-bys over those tables"""
+
+    def __init__(self, ids: np.ndarray, columns: dict, sections: dict, meta: dict):
+        self.ids = ids
+        self.columns = columns
+        self.sections = sections
+        self.meta = meta
+
+    @classmethod
+    def from_results(cls, results, ids=None) -> "ResultFrame":
+        builder = FrameBuilder()
+        for idx, result in enumerate(results):
+            builder.add(ids[idx] if ids is not None else idx, result)
+        return builder.build()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def categories(self, section: str, key: str) -> list:
+        return self.meta["categories"].get(f"{section}{SEP}{key}")
+
+    def group_sum(self, section: str, key: str) -> np.ndarray:
+        table = self.sections[section]
+        return np.bincount(table["conversation"], weights=table["columns"][key], minlength=len(self))
+
+    def group_count(self, section: str) -> np.ndarray:
+        return np.bincount(self.sections[section]["conversation"], minlength=len(self))
+
+    def group_mean(self, section: str, key: str) -> np.ndarray:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.group_sum(section, key) / self.group_count(section)
+
+    def label_fractions(self, section: str, key: str = "label") -> tuple[list, np.ndarray]:
+        """(labels, conversations x labels matrix of fractions)"""
+        table = self.sections[section]
+        labels = list(self.meta["aggregate_keys"].get(section) or self.categories(section, key))
+        seen = self.categories(section, key)
+        # map the column's codes onto the aggregate's label order
+        remap = np.array([labels.index(label) if label in labels else len(labels) for label in seen], dtype=np.int64)
+        codes = remap[table["columns"][key]]
+        counts = np.bincount(table["conversation"] * (len(labels) + 1) + codes,
+                             minlength=len(self) * (len(labels) + 1)).reshape(len(self), len(labels) + 1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return labels, counts[:, :len(labels)] / self.group_count(section)[:, None]
+
+    def aggregates(self, section: str) -> dict:
+        """{aggregate key: per-conversation array}, computed like the evaluators do: label
+        fractions for labelled sections, key-wise means otherwise"""
+        table = self.sections[section]
+        if self.categories(section, "label") is not None:
+            labels, fractions = self.label_fractions(section)
+            return {label: fractions[:, idx] for idx, label in enumerate(labels)}
+        return {key: self.group_mean(section, key) for key in table["columns"] if self.categories(section, key) is None}
+
+    def _value(self, path: str, values: np.ndarray, idx: int):
+        categories = self.meta["categories"].get(path)
+        return categories[values[idx]] if categories is not None else values[idx].item()
+
+    def to_dicts(self) -> list[dict]:
+        """Back to the evaluate_conversation dict shape, one dict per conversation"""
+        aggregates = {path: self.aggregates(path) for path in self.sections}
+        rows = {} # section -> per-conversation slice bounds, tables are in conversation order
+        for path, table in self.sections.items():
+            rows[path] = np.searchsorted(table["conversation"], np.arange(len(self) + 1))
+
+        res = []
+        for conversation in range(len(self)):
+            items = []
+            for path, kind in self.meta["layout"].items():
+                if kind == "scalar":
+                    items.append((path, self._value(path, self.columns[path], conversation)))
+                    continue
+                table = self.sections[path]
+                start, end = rows[path][conversation], rows[path][conversation + 1]
+                utterances = [
+                    _nest((key, self._value(f"{path}{SEP}{key}", values, idx)) for key, values in table["columns"].items())
+                    for idx in range(start, end)
+                ]
+                aggregate = {key: values[conversation].item() for key, values in aggregates[path].items()}
+                items.append((path, {"aggregate": aggregate, "utterances": utterances}))
+            res.append(_nest(items))
+        return res
+
+    def save(self, path):
+        """`.npz` (numpy only) or `.parquet` (needs pyarrow; writes one file per table next to
+        `path`, named <stem>.<table>.parquet)"""
+        path = str(path)
+        if path.endswith(".parquet"):
+            return self._save_parquet(path)
+        arrays = {"__ids__": self.ids, "__meta__": np.array(json.dumps(self.meta))}
+        for name, values in self.columns.items():
+            arrays[f"c:{name}"] = values
+        for section, table in self.sections.items():
+            arrays[f"s:{section}:__conversation__"] = table["conversation"]
+            arrays[f"s:{section}:__turn__"] = table["turn"]
+            for key, values in table["columns"].items():
+                arrays[f"s:{section}:{key}"] = values
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path) -> "ResultFrame":
+        path = str(path)
+        if path.endswith(".parquet"):
+            return cls._load_parquet(path)
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(data["__meta__"].item())
+            columns, sections = {}, {}
+            for name in data.files:
+                if name.startswith("c:"):
+                    columns[name[2:]] = data[name]
+                elif name.startswith("s:"):
+                    section, key = name[2:].rsplit(":", 1)
+                    table = sections.setdefault(section, {"columns": {}})
+                    if key in ("__conversation__", "__turn__"):
+                        table[key.strip("_")] = data[name]
+                    else:
+                        table["columns"][key] = data[name]
+            ids = data["__ids__"]
+        # keep the original column order
+        columns = {path: columns[path] for path, kind in meta["layout"].items() if kind == "scalar"}
+        return cls(ids, columns, sections, meta)
+
+    def _parquet_paths(self, path: str) -> dict:
+        stem = path[:-len(".parquet")]
+        return {"conversations": f"{stem}.conversations.parquet",
+                **{section: f"{stem}.{section.replace(SEP, '.').replace(' ', '_')}.parquet" for section in self.sections}}
+
+    def _save_parquet(self, path: str):
+        import pyarrow as pa, pyarrow.parquet as pq
+        meta = {b"result_frame": json.dumps({**self.meta, "sections": list(self.sections)}).encode()}
+        paths = self._parquet_paths(path)
+        table = pa.table({"id": self.ids, **self.columns})
+        pq.write_table(table.replace_schema_metadata(meta), paths["conversations"])
+        for section, data in self.sections.items():
+            pq.write_table(pa.table({"conversation": data["conversation"], "turn": data["turn"], **data["columns"]}), paths[section])
+
+    @classmethod
+    def _load_parquet(cls, path: str) -> "ResultFrame":
+        import pyarrow.parquet as pq
+        stem = path[:-len(".parquet")]
+        conversations = pq.read_table(f"{stem}.conversations.parquet")
+        meta = json.loads(conversations.schema.metadata[b"result_frame"])
+        frame = cls(conversations.column("id").to_numpy(), {}, {section: None for section in meta.pop("sections")}, meta)
+        frame.columns = {name: conversations.column(name).to_numpy() for name in conversations.column_names if name != "id"}
+        for section, section_path in frame._parquet_paths(path).items():
+            if section == "conversations":
+                continue
+            table = pq.read_table(section_path)
+            frame.sections[section] = {
+                "conversation": table.column("conversation").to_numpy(),
+                "turn": table.column("turn").to_numpy(),
+                "columns": {name: table.column(name).to_numpy() for name in table.column_names if name not in ("conversation", "turn")}
+            }
+        return frame
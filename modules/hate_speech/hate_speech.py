@@ -1,44 +1,98 @@
-from transformers import BertTokenizer, BertForSequenceClassification
-import torch
 from modules import Evaluator
+from modules.batching import TokenBudgetBatcher
+from modules.cache import get_result_cache
+from modules.models import get_model_registry
 from pathlib import Path
 
 class HateSpeechEvaluator(Evaluator):
     MODEL_PATH = Path(__file__).resolve().parent / "HateBERT_hateval"
+    version = 2 # long utterances are scored in full instead of truncated
 
-    def __init__(self):
+    def __init__(self, max_batch_size: int = 32, runtime: str = "fp32", token_budget: int = 8192,
+                 stride: int = 128, combine: str = "max"):
+        """`runtime` is one of "fp32", "torchscript" or "int8" (dynamically quantized TorchScript),
+        optimized runtimes are cached next to MODEL_PATH after the first conversion.
+        Utterances longer than the model's 512 tokens are split into windows overlapping by
+        `stride` tokens, whose scores are combined with `combine` ("max" or "mean"); every
+        forward pass holds at most `token_budget` (padded) tokens"""
         super().__init__(name="Hate Speech")
-        self.tokenizer = BertTokenizer.from_pretrained(self.MODEL_PATH)
-        self.model = BertForSequenceClassification.from_pretrained(self.MODEL_PATH)
-        self.model.eval()
+        self.max_batch_size = max_batch_size
+        self.runtime = runtime
+        self.batcher = TokenBudgetBatcher(512, stride=stride, token_budget=token_budget, max_batch_size=max_batch_size,
+                                          combine=combine)
 
-    def evaluate_utterance(self, text: str) -> dict:
-        inputs = self.tokenizer(text, return_tensors="pt", truncation=True, padding=True)
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-            probs = torch.softmax(outputs.logits, dim=-1)
-        score = probs[0, 1].item()
+    # transformers/torch are only imported once the model is first needed. Both live in the
+    # model registry, so every evaluator with the same runtime shares them
+    @property
+    def tokenizer(self):
+        from transformers import BertTokenizerFast
+        return get_model_registry().get("hatebert-tokenizer", lambda: BertTokenizerFast.from_pretrained(self.MODEL_PATH))
+
+    @property
+    def model(self):
+        from modules.hate_speech.runtime import load_model
+        return get_model_registry().get(f"hatebert:{self.runtime}", lambda: load_model(self.MODEL_PATH, self.runtime))
+
+    def load_models(self):
+        self.tokenizer, self.model
+
+    def check_runtime(self, texts: list[str] = None) -> dict:
+        """Label agreement and score drift of this evaluator's runtime against the fp32 model"""
+        from modules.hate_speech.runtime import check_runtime
+        return check_runtime(self.MODEL_PATH, self.runtime, texts)
+
+    def _result(self, score: float) -> dict:
         label = "hate" if score > 0.5 else "non-hate"
         return {
             "score": round(score, 3),
             "label": label
         }
 
+    def evaluate_batch(self, texts: list[str], max_batch_size: int = None) -> list[dict]:
+        """Scores many utterances at once, only texts not in the result cache reach the model"""
+        if not texts:
+            return []
+        namespace = f"{self.name}/v{self.version}/{self.runtime}/{self.batcher.combine_mode}/{self.batcher.stride}"
+        scores = get_result_cache().map(namespace, texts, lambda misses: self._scores(misses, max_batch_size))
+        return [self._result(score) for score in scores]
+
+    def _scores(self, texts: list[str], max_batch_size: int = None) -> list[float]:
+        """Hate probabilities. Each utterance is split into 512-token windows, windows of all
+        utterances are packed into length-sorted batches under the token budget, and window
+        probabilities are combined back per utterance"""
+        import torch
+        from modules.hate_speech.runtime import logits
+        tokenizer, model = self.tokenizer, self.model
+        token_ids = tokenizer(texts, add_special_tokens=False, verbose=False)["input_ids"]
+        owners, windows = self.batcher.split(token_ids)
+
+        window_scores = [0.0] * len(windows)
+        with torch.inference_mode():
+            for batch in self.batcher.batches([len(window) for window in windows], max_batch_size):
+                features = [tokenizer.prepare_for_model(windows[idx]) for idx in batch] # adds [CLS]/[SEP]
+                inputs = tokenizer.pad(features, return_tensors="pt")
+                probs = torch.softmax(logits(model, inputs), dim=-1)
+                for idx, score in zip(batch, probs[:, 1].tolist()):
+                    window_scores[idx] = score
+        return self.batcher.combine(owners, window_scores, len(texts)).tolist()
+
+    def evaluate_utterance(self, text: str) -> dict:
+        return self.evaluate_batch([text])[0]
+
     def evaluate_conversation(self, conversation: list[str]):
         res = {
             "aggregate": {
-                "non-hate": 0, 
+                "non-hate": 0,
                 "hate": 0,
             },
             "utterances": []
         }
 
-        for text in conversation:
-            _res = self.evaluate_utterance(text)
+        for _res in self.evaluate_batch(conversation):
             res["aggregate"][_res["label"]] += 1
             res["utterances"].append(_res)
 
         for label in ["non-hate", "hate"]:
             res["aggregate"][label] /= len(conversation)
 
-        return res
\ No newline at end of file
+        return res
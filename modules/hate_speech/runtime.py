@@ -0,0 +1,111 @@
+from transformers import BertTokenizerFast, BertForSequenceClassification
+from modules.metrics import registry
+from pathlib import Path
+import os
+import torch
+
+RUNTIMES = ("fp32", "torchscript", "int8")
+
+# Short, label-diverse utterances used to sanity check an optimized runtime against fp32
+SAMPLE_TEXTS = [
+    "Thanks for explaining, I see your point now.",
+    "I disagree, but I think we can find some common ground here.",
+    "Shareholders provide the capital that makes production possible.",
+    "What naive garbage, you clearly have no idea what you are talking about.",
+    "People like you are the reason this country is falling apart.",
+    "Get out of our country, nobody wants your kind here.",
+    "They are all criminals and should be sent back where they came from.",
+    "Women are too emotional to be trusted with any real decisions.",
+    "The housing market crash hurt a lot of families.",
+    "Shut up, idiot.",
+]
+
+def cached_runtime_path(model_path: Path, runtime: str) -> Path:
+    """Optimized artifacts live next to the model directory, e.g. HateBERT_hateval.int8.pt"""
+    return model_path.parent / f"{model_path.name}.{runtime}.pt"
+
+def _is_stale(cache_path: Path, model_path: Path) -> bool:
+    if not cache_path.exists():
+        return True
+    newest_source = max(f.stat().st_mtime for f in model_path.iterdir())
+    return cache_path.stat().st_mtime < newest_source
+
+def _example_inputs(model_path: Path):
+    tokenizer = BertTokenizerFast.from_pretrained(model_path)
+    inputs = tokenizer(SAMPLE_TEXTS[:2], padding=True, return_tensors="pt")
+    return inputs["input_ids"], inputs["attention_mask"], inputs["token_type_ids"]
+
+def build_runtime(model_path: Path, runtime: str) -> Path:
+    """Converts the fp32 model (dynamic int8 quantization of the linear layers for "int8") and
+    saves it as a traced TorchScript graph"""
+    model = BertForSequenceClassification.from_pretrained(model_path, torchscript=True)
+    model.eval()
+    if runtime == "int8":
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    with torch.inference_mode():
+        traced = torch.jit.trace(model, _example_inputs(model_path), strict=False)
+    cache_path = cached_runtime_path(model_path, runtime)
+    # workers started without --preload may build at the same time: each writes its own file and
+    # renames it into place, so a reader never sees a half-written one
+    tmp_path = cache_path.with_name(f"{cache_path.stem}.{os.getpid()}.tmp.pt")
+    try:
+        torch.jit.save(traced, str(tmp_path))
+        os.replace(tmp_path, cache_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return cache_path
+
+def load_model(model_path: Path, runtime: str = "fp32"):
+    """Loads the classifier for `runtime`. Optimized runtimes are converted once and cached on
+    disk, later loads skip the conversion unless the model files changed"""
+    if runtime not in RUNTIMES:
+        raise ValueError(f"Unknown runtime '{runtime}', expected one of {RUNTIMES}")
+    if runtime == "fp32":
+        model = BertForSequenceClassification.from_pretrained(model_path)
+        model.eval()
+        return model
+
+    cache_path = cached_runtime_path(model_path, runtime)
+    if _is_stale(cache_path, model_path):
+        registry.inc("evaluator_cache_misses_total", cache="hate_speech_runtime")
+        build_runtime(model_path, runtime)
+    else:
+        registry.inc("evaluator_cache_hits_total", cache="hate_speech_runtime")
+    model = torch.jit.load(str(cache_path))
+    model.eval()
+    return model
+
+def logits(model, inputs) -> torch.Tensor:
+    """Runs either an eager model or a TorchScript graph (which returns a plain tuple)"""
+    if isinstance(model, torch.jit.ScriptModule):
+        return model(inputs["input_ids"], inputs["attention_mask"], inputs["token_type_ids"])[0]
+    return model(**inputs).logits
+
+def check_runtime(model_path: Path, runtime: str, texts: list[str] = None) -> dict:
+    """Reports label agreement and hate-score drift of `runtime` against the fp32 model"""
+    texts = texts or SAMPLE_TEXTS
+    tokenizer = BertTokenizerFast.from_pretrained(model_path)
+    reference = load_model(model_path, "fp32")
+    candidate = load_model(model_path, runtime)
+
+    with torch.inference_mode():
+        inputs = tokenizer(texts, truncation=True, padding=True, return_tensors="pt")
+        expected = torch.softmax(logits(reference, inputs), dim=-1)[:, 1]
+        actual = torch.softmax(logits(candidate, inputs), dim=-1)[:, 1]
+
+    drift = (expected - actual).abs()
+    return {
+        "runtime": runtime,
+        "num_samples": len(texts),
+        "label_agreement": ((expected > 0.5) == (actual > 0.5)).float().mean().item(),
+        "mean_score_drift": drift.mean().item(),
+        "max_score_drift": drift.max().item()
+    }
+
+if __name__ == "__main__":
+    import sys, json
+    from modules.hate_speech.hate_speech import HateSpeechEvaluator
+    # python -m modules.hate_speech.runtime int8
+    runtime = sys.argv[1] if len(sys.argv) > 1 else "int8"
+    print(json.dumps(check_runtime(HateSpeechEvaluator.MODEL_PATH, runtime), indent=2))
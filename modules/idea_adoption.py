@@ -1,47 +1,85 @@
 from modules import Evaluator
+from modules.documents import get_document_service
 from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
-import spacy
 
 class IdeaAdoptionEvaluator(Evaluator):
+    annotations = {"lemma", "dep"}
+
     def __init__(self):
         super().__init__(name="Idea Adoption")
         self.analyzer = SentimentIntensityAnalyzer()
-        self.p1_ideas = {} # (non-stopword) noun, proper noun, verb, adjective -> sentiment when proposing "idea"
-        self.p1_adopted_ideas = set()
-        self.p2_ideas = {}
-        self.p2_adopted_ideas = set()
+        self.documents = get_document_service()
+
+    def load_models(self):
+        self.documents.nlp
+
+    def session(self) -> "IdeaAdoptionSession":
+        """Per-conversation state, so one evaluator can serve many conversations concurrently"""
+        return IdeaAdoptionSession(self)
 
-    def evaluate_conversation(self, conversation: list[str]) -> dict:
+    def parse(self, texts: list[str]) -> list:
+        """Ideas are read from a parse of the lower-cased text (POS tags and lemmas differ from
+        the original-case parse), so `docs` from other consumers can't be shared"""
+        return self.documents.parse([text.lower() for text in texts], self.annotations)
+
+    def evaluate_conversation(self, conversation: list[str], docs: list = None) -> dict:
         """Captures how many 'ideas' (non-stopword nouns, proper nouns, verbs, and adjectives) that 
-        were first proposed by one participant and subsequently adopted by the other participant"""
-        nlp = spacy.load("en_core_web_sm")
-        candidate_idea_pos_lst = ["VERB", "NOUN", "PROPN", "ADJ"]
-        for idx, utterance in enumerate(conversation):
-            utterance = utterance.lower()
-            doc = nlp(utterance)
-            for token in doc:
-                if not token.is_stop and token.pos_ in candidate_idea_pos_lst:
-                    if idx % 2 == 0: # p1's utterance
-                        if token.lemma_ in self.p2_ideas.keys() and token.lemma_ not in self.p1_adopted_ideas: # Idea proposed by p2 but not previously adopted by p1
-                            sentiment = self.analyzer.polarity_scores(" ".join(token.sent.text))["compound"]
-                            if abs(sentiment - self.p2_ideas[token.lemma_]) < .1:
-                                self.p1_adopted_ideas.add(token.lemma_)
-                        elif token.lemma_ not in self.p2_ideas.keys():
-                            sentiment = self.analyzer.polarity_scores(" ".join(token.sent.text))["compound"]
-                            self.p1_ideas[token.lemma_] = sentiment
-                    else: # p2's utterance
-                        if token.lemma_ in self.p1_ideas.keys() and token.lemma_ not in self.p2_adopted_ideas: # Idea proposed by p1 but not previously adopted by p2
-                            sentiment = self.analyzer.polarity_scores(" ".join(token.sent.text))["compound"]
-                            if abs(sentiment - self.p1_ideas[token.lemma_]) < .1:
-                                self.p2_adopted_ideas.add(token.lemma_)
-                        elif token.lemma_ not in self.p1_ideas.keys():
-                            sentiment = self.analyzer.polarity_scores(" ".join(token.sent.text))["compound"]
-                            self.p2_ideas[token.lemma_] = sentiment
+        were first proposed by one participant and subsequently adopted by the other participant.
+        `docs`, if given, must come from `parse`"""
+        if docs is None:
+            docs = self.parse(conversation)
+        session = self.session()
+        res = session.result()
+        for text, doc in zip(conversation, docs):
+            res = session.add_turn(text, doc)
+        return res
+
+class IdeaAdoptionSession:
+    """Streaming idea adoption for one conversation, fed one turn at a time. Cheap to create and
+    throw away; nothing is kept on the evaluator"""
+    candidate_idea_pos = {"VERB", "NOUN", "PROPN", "ADJ"}
+
+    def __init__(self, evaluator: IdeaAdoptionEvaluator):
+        self.evaluator = evaluator
+        self.ideas = ({}, {}) # per participant: (non-stopword) noun, proper noun, verb, adjective -> sentiment when proposing "idea"
+        self.adopted_ideas = (set(), set())
+        self.num_turns = 0
+
+    def add_turn(self, text: str, doc=None) -> dict:
+        if doc is None:
+            doc = self.evaluator.parse([text])[0]
+        speaker = self.num_turns % 2
+        other = 1 - speaker
+        self.num_turns += 1
+
+        ideas, other_ideas = self.ideas[speaker], self.ideas[other]
+        adopted_ideas = self.adopted_ideas[speaker]
+        sentence_sentiments = {} # sentence start -> compound score, each sentence is scored once
+
+        def sentiment(token):
+            sent = token.sent
+            if sent.start not in sentence_sentiments:
+                sentence_sentiments[sent.start] = self.evaluator.analyzer.polarity_scores(sent.text)["compound"]
+            return sentence_sentiments[sent.start]
+
+        for token in doc:
+            if token.is_stop or token.pos_ not in self.candidate_idea_pos:
+                continue
+            lemma = token.lemma_
+            if lemma in other_ideas and lemma not in adopted_ideas: # Idea proposed by the other participant but not previously adopted
+                if abs(sentiment(token) - other_ideas[lemma]) < .1:
+                    adopted_ideas.add(lemma)
+            elif lemma not in other_ideas:
+                ideas[lemma] = sentiment(token)
+
+        return self.result()
+
+    def result(self) -> dict:
         return {
             "participant_1": {
-                "num_ideas_adopted": len(self.p1_adopted_ideas)
+                "num_ideas_adopted": len(self.adopted_ideas[0])
             },
             "participant_2": {
-                "num_ideas_adopted": len(self.p2_adopted_ideas)
+                "num_ideas_adopted": len(self.adopted_ideas[1])
             }
-        }
\ No newline at end of file
+        }
@@ -0,0 +1,78 @@
+from collections import Counter
+
+def _is_word_char(char: str) -> bool:
+    # apostrophes belong to the word so "don't" is one token, like the LSM word cleaning
+    return char.isalnum() or char in "_'’"
+
+class PhraseMatcher:
+    """Aho-Corasick automaton over a lexicon of words and multi-word phrases. Finds every
+    occurrence of every phrase in a single pass over the text, only at token boundaries (so "or"
+    does not match inside "for"). Matching is case-insensitive"""
+
+    def __init__(self, phrases):
+        self.phrases = sorted({" ".join(phrase.lower().split()) for phrase in phrases})
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for phrase_idx, phrase in enumerate(self.phrases):
+            state = 0
+            for char in phrase:
+                if char not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                    self._goto[state][char] = len(self._goto) - 1
+                state = self._goto[state][char]
+            self._output[state].append(phrase_idx)
+        self._build_failure_links()
+
+    def _build_failure_links(self):
+        queue = list(self._goto[0].values())
+        for state in queue: # breadth-first, the list grows as we go
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def finditer(self, text: str):
+        """Yields (start, end, phrase) for every phrase occurrence, in order of their end offset.
+        Any run of whitespace in the text matches the single space between a phrase's words, so
+        "in fact" also matches "in\nfact" and "in  fact". Offsets are into `text`"""
+        lowered = text.lower()
+        state = 0
+        offsets = [] # position in `text` of every character the automaton consumed
+        for idx, char in enumerate(lowered):
+            if char.isspace():
+                if offsets and lowered[offsets[-1]].isspace():
+                    continue # rest of a whitespace run
+                char = " "
+            offsets.append(idx)
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for phrase_idx in self._output[state]:
+                phrase = self.phrases[phrase_idx]
+                start, end = offsets[len(offsets) - len(phrase)], idx + 1
+                if _is_word_char(phrase[0]) and start > 0 and _is_word_char(lowered[start - 1]):
+                    continue
+                if _is_word_char(phrase[-1]) and end < len(lowered) and _is_word_char(lowered[end]):
+                    continue
+                yield start, end, phrase
+
+    def find_all(self, text: str) -> list[tuple]:
+        """Match spans as (start, end, phrase)"""
+        return list(self.finditer(text))
+
+    def counts(self, text: str) -> Counter:
+        """Number of occurrences of each matched phrase"""
+        return Counter(phrase for _, _, phrase in self.finditer(text))
+
+    def count(self, text: str) -> int:
+        """Total number of phrase occurrences"""
+        return sum(1 for _ in self.finditer(text))
+
+    def contains(self, text: str) -> bool:
+        return next(self.finditer(text), None) is not None
@@ -1,128 +1,126 @@
 from modules import Evaluator
-import spacy
-import re
+from modules.documents import get_document_service
+from modules.features import UtteranceFeatures
+from collections import deque
+
+def _category_masks(categories: dict) -> dict:
+    masks = {}
+    for bit, word_set in enumerate(categories.values()):
+        for word in word_set:
+            masks[word] = masks.get(word, 0) | (1 << bit)
+    return masks
 
 class LSMEvaluator(Evaluator):
+    annotations = {"tag"}
+
+    # Use sets for O(1) lookup and remove overlaps
+    personal_pronouns = {"i", "me", "you", "he", "she", "they", "it", 
+                         "him", "her", "them", "we", "us"}
+    impersonal_pronouns = {"one"}
+    articles = {"a", "an", "the"}
+    prepositions = {
+        "aboard", "about", "above", "absent", "across", "after", "against", "along", 
+        "alongside", "amid", "amidst", "among", "amongst", "around", "as", "at", "atop",
+        "bar", "barring", "before", "behind", "below", "beneath", "beside", "besides", 
+        "between", "beyond", "but", "by",
+        "circa", "concerning", "counting",
+        "despite", "down", "during",
+        "effective", "except", "excepting", "excluding",
+        "failing", "following", "for", "from",
+        "in", "including", "inside", "into",
+        "less", "like",
+        "minus",
+        "near", "notwithstanding",
+        "of", "off", "on", "onto", "opposite", "out", "outside", "over",
+        "past", "pending", "per", "plus",
+        "regarding", "respecting",
+        "short", "since",
+        "than", "through", "throughout", "to", "toward", "towards",
+        "under", "underneath", "unlike", "until", "up", "upon",
+        "versus", "vs.", "vs", "via",
+        "wanting", "with", "within", "without", "worth"
+    }
+    auxiliary_verbs = {
+        "best", "better", "can", "could", "dare", "may", "might", "must",
+        "need", "ought", "shall", "should", "will", "would", "be",
+        "do", "does", "did", "have", "has", "had",
+        "am", "is", "are", "was", "were", "been", "being"
+    }
+    frequency_adverbs = {
+        "always", "annually", "constantly", "continually", "continuously",
+        "daily", "eventually", "ever", "frequently", "generally",
+        "hourly", "infrequently", "intermittently", "later", "monthly",
+        "never", "nightly", "normally", "now", "occasionally",
+        "often", "periodically", "quarterly", "regularly",
+        "scarcely", "seldom", "sometimes", "soon", "then",
+        "today", "tonight", "usually", "weekly", "yearly",
+        "yesterday", "yet"
+    }
+    negations = {
+        "not", "nor", "no", "nowhere",
+        "isn't", "aren't", "wasn't", "weren't", "haven't", "hasn't", 
+        "hadn't", "won't", "wouldn't", "don't", "doesn't", "didn't", 
+        "can't", "couldn't", "shouldn't", "mightn't", "mustn't", "shan't"
+    }
+    quantifiers = {
+        "all", "every", "each", "everything", "everybody", "everyone",
+        "most", "many", "much", "lots", "plenty", "numerous", "countless",
+        "loads", "tons", "heaps", "some", "several", "various", "certain",
+        "few", "little", "barely", "hardly", "none", "nothing", "nobody",
+        "neither", "any", "anything", "anybody", "anyone", "either",
+        "more", "less", "fewer", "least", "fewest", "enough", "sufficient",
+        "both", "half", "double", "twice"
+    }
+
+    categories = {
+        "personal_pronouns": personal_pronouns,
+        "impersonal_pronouns": impersonal_pronouns,
+        "articles": articles,
+        "prepositions": prepositions,
+        "auxiliary_verbs": auxiliary_verbs,
+        "frequency_adverbs": frequency_adverbs,
+        "negations": negations,
+        "quantifiers": quantifiers
+    }
+    category_names = list(categories.keys()) + ["conjunctions"]
+    # word -> bitmask of the categories it belongs to, so one lookup per word fills every count
+    word_categories = _category_masks(categories)
+
     def __init__(self):
         super().__init__(name="LSM")
-        self.nlp = spacy.load("en_core_web_sm")
-        
-        # Use sets for O(1) lookup and remove overlaps
-        self.personal_pronouns = {"i", "me", "you", "he", "she", "they", "it", 
-                                  "him", "her", "them", "we", "us"}
-        self.impersonal_pronouns = {"one"}
-        self.articles = {"a", "an", "the"}
-        self.prepositions = {
-            "aboard", "about", "above", "absent", "across", "after", "against", "along", 
-            "alongside", "amid", "amidst", "among", "amongst", "around", "as", "at", "atop",
-            "bar", "barring", "before", "behind", "below", "beneath", "beside", "besides", 
-            "between", "beyond", "but", "by",
-            "circa", "concerning", "counting",
-            "despite", "down", "during",
-            "effective", "except", "excepting", "excluding",
-            "failing", "following", "for", "from",
-            "in", "including", "inside", "into",
-            "less", "like",
-            "minus",
-            "near", "notwithstanding",
-            "of", "off", "on", "onto", "opposite", "out", "outside", "over",
-            "past", "pending", "per", "plus",
-            "regarding", "respecting",
-            "short", "since",
-            "than", "through", "throughout", "to", "toward", "towards",
-            "under", "underneath", "unlike", "until", "up", "upon",
-            "versus", "vs.", "vs", "via",
-            "wanting", "with", "within", "without", "worth"
-        }
-        self.auxiliary_verbs = {
-            "best", "better", "can", "could", "dare", "may", "might", "must",
-            "need", "ought", "shall", "should", "will", "would", "be",
-            "do", "does", "did", "have", "has", "had",
-            "am", "is", "are", "was", "were", "been", "being"
-        }
-        self.frequency_adverbs = {
-            "always", "annually", "constantly", "continually", "continuously",
-            "daily", "eventually", "ever", "frequently", "generally",
-            "hourly", "infrequently", "intermittently", "later", "monthly",
-            "never", "nightly", "normally", "now", "occasionally",
-            "often", "periodically", "quarterly", "regularly",
-            "scarcely", "seldom", "sometimes", "soon", "then",
-            "today", "tonight", "usually", "weekly", "yearly",
-            "yesterday", "yet"
-        }
-        self.negations = {
-            "not", "nor", "no", "nowhere",
-            "isn't", "aren't", "wasn't", "weren't", "haven't", "hasn't", 
-            "hadn't", "won't", "wouldn't", "don't", "doesn't", "didn't", 
-            "can't", "couldn't", "shouldn't", "mightn't", "mustn't", "shan't"
-        }
-        self.quantifiers = {
-            "all", "every", "each", "everything", "everybody", "everyone",
-            "most", "many", "much", "lots", "plenty", "numerous", "countless",
-            "loads", "tons", "heaps", "some", "several", "various", "certain",
-            "few", "little", "barely", "hardly", "none", "nothing", "nobody",
-            "neither", "any", "anything", "anybody", "anyone", "either",
-            "more", "less", "fewer", "least", "fewest", "enough", "sufficient",
-            "both", "half", "double", "twice"
-        }
+        self.documents = get_document_service()
 
-    def _count_word_occurrences(self, text, word_set):
-        """Count whole word matches only, not substrings"""
-        count = 0
-        words = text.lower().split()
-        for word in words:
-            # Remove punctuation from word
-            clean_word = re.sub(r'[^\w\']', '', word)
-            if clean_word in word_set:
-                count += 1
-        return count
+    def load_models(self):
+        self.documents.nlp
 
-    def _count_conjunctions(self, text):
+    def _count_conjunctions(self, docs):
         """Count conjunctions using spaCy POS tags"""
-        doc = self.nlp(text)
         count = 0
-        for token in doc:
-            if token.pos_ == "CCONJ" or token.pos_ == "SCONJ":
-                count += 1
+        for doc in docs:
+            for token in doc:
+                if token.pos_ == "CCONJ" or token.pos_ == "SCONJ":
+                    count += 1
         return count
 
-    def evaluate_conversation(self, conversation: list[str]) -> dict:
-        p1_text = " ".join([utt for idx, utt in enumerate(conversation) if idx % 2 == 0])
-        p2_text = " ".join([utt for idx, utt in enumerate(conversation) if idx % 2 == 1])
-        
-        p1_word_count = len(p1_text.split())
-        p2_word_count = len(p2_text.split())
-        
+    def _utterance_counts(self, text, doc, features: UtteranceFeatures = None):
+        """[word_count, *category counts, conjunctions]; word and category counts come from the
+        shared UtteranceFeatures record"""
+        if features is None:
+            features = UtteranceFeatures(text, readability=False)
+        return [features.num_words, *features.lsm_counts, self._count_conjunctions([doc])]
+
+    def _score(self, p1_counts, p2_counts) -> dict:
+        """LSM from per-speaker [word_count, *category_counts] vectors"""
+        p1_word_count, p2_word_count = p1_counts[0], p2_counts[0]
         if p1_word_count == 0 or p2_word_count == 0:
             return {"avg_lsm_score": 0.0}
-        
-        categories = {
-            "personal_pronouns": self.personal_pronouns,
-            "impersonal_pronouns": self.impersonal_pronouns,
-            "articles": self.articles,
-            "prepositions": self.prepositions,
-            "auxiliary_verbs": self.auxiliary_verbs,
-            "frequency_adverbs": self.frequency_adverbs,
-            "negations": self.negations,
-            "quantifiers": self.quantifiers
-        }
-        
-        p1_counts = {}
-        p2_counts = {}
-        
-        for category, word_set in categories.items():
-            p1_counts[category] = self._count_word_occurrences(p1_text, word_set)
-            p2_counts[category] = self._count_word_occurrences(p2_text, word_set)
-        
-        p1_counts["conjunctions"] = self._count_conjunctions(p1_text)
-        p2_counts["conjunctions"] = self._count_conjunctions(p2_text)
-        
+
         scores = {}
         final_val = 0
         
-        for category in list(categories.keys()) + ["conjunctions"]:
-            p1_rate = p1_counts[category] / p1_word_count
-            p2_rate = p2_counts[category] / p2_word_count
+        for idx, category in enumerate(self.category_names, start=1):
+            p1_rate = p1_counts[idx] / p1_word_count
+            p2_rate = p2_counts[idx] / p2_word_count
             val = 1 - (abs(p1_rate - p2_rate) / (p1_rate + p2_rate + 0.0001))
             scores[category] = val
             final_val += val
@@ -132,6 +130,60 @@ class LSMEvaluator(Evaluator):
         return {
             "avg_lsm_score": final_val,
             "category_scores": scores,
-            "p1_counts": p1_counts,
-            "p2_counts": p2_counts
-        }
\ No newline at end of file
+            "p1_counts": dict(zip(self.category_names, p1_counts[1:])),
+            "p2_counts": dict(zip(self.category_names, p2_counts[1:]))
+        }
+
+    def evaluate_conversation(self, conversation: list[str], docs: list = None, features: list = None) -> dict:
+        # conjunctions come from the per-utterance parses, not a second parse of the joined text
+        if docs is None:
+            docs = self.documents.parse(conversation, self.annotations)
+
+        speaker_counts = [[0] * (len(self.category_names) + 1) for _ in range(2)]
+        features = features or [None] * len(conversation)
+        for idx, (text, doc, feats) in enumerate(zip(conversation, docs, features)):
+            for i, count in enumerate(self._utterance_counts(text, doc, feats)):
+                speaker_counts[idx % 2][i] += count
+
+        return self._score(*speaker_counts)
+
+    def session(self, window: int = None) -> "LSMSession":
+        """Turn-by-turn LSM, see LSMSession"""
+        return LSMSession(self, window)
+
+    def evaluate_conversation_rolling(self, conversation: list[str], window: int = None, docs: list = None) -> list[float]:
+        """avg_lsm_score after every turn (over the last `window` turns if given)"""
+        if docs is None:
+            docs = self.documents.parse(conversation, self.annotations)
+        session = self.session(window)
+        return [session.add_turn(text, doc)["avg_lsm_score"] for text, doc in zip(conversation, docs)]
+
+class LSMSession:
+    """Incremental LSM for long conversations. Each turn's counts are computed once and added to
+    running per-speaker totals; with a `window` the counts of turns falling out of it are
+    subtracted again, so every update costs one turn instead of a full recompute"""
+
+    def __init__(self, evaluator: LSMEvaluator, window: int = None):
+        self.evaluator = evaluator
+        self.window = window
+        self.num_turns = 0
+        self.turns = deque() # (speaker, counts) of the turns inside the window
+        self.speaker_counts = [[0] * (len(evaluator.category_names) + 1) for _ in range(2)]
+
+    def add_turn(self, text: str, doc=None, features: UtteranceFeatures = None) -> dict:
+        if doc is None:
+            doc = self.evaluator.documents.parse_one(text, self.evaluator.annotations)
+        speaker = self.num_turns % 2
+        counts = self.evaluator._utterance_counts(text, doc, features)
+        self.num_turns += 1
+
+        for i, count in enumerate(counts):
+            self.speaker_counts[speaker][i] += count
+        if self.window is not None:
+            self.turns.append((speaker, counts))
+            if len(self.turns) > self.window:
+                old_speaker, old_counts = self.turns.popleft()
+                for i, count in enumerate(old_counts):
+                    self.speaker_counts[old_speaker][i] -= count
+
+        return self.evaluator._score(*self.speaker_counts)
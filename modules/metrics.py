@@ -0,0 +1,185 @@
+from collections import defaultdict, deque
+from contextlib import contextmanager
+import cProfile, functools, io, pstats, threading, time
+
+# seconds, covers everything from a VADER call to a cold model load
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class MetricsRegistry:
+    """In-process counters and timers for evaluators, with a Prometheus text exposition.
+    Everything is a no-op until `enable()` is called, so the disabled cost is two attribute
+    checks. `profile()` works on its own, without enabling the counters"""
+
+    def __init__(self):
+        self.enabled = False
+        self.tracing = False
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.counters = defaultdict(float) # (name, labels) -> value
+        self.histograms = {} # (name, labels) -> [bucket counts..., count, sum]
+        self.profiled = set() # evaluator names profiled with cProfile
+        self.profiles = {}
+        self.spans = deque(maxlen=10000)
+
+    def enable(self, tracing: bool = False):
+        self.enabled = True
+        self.tracing = tracing
+
+    def disable(self):
+        self.enabled = False
+        self.tracing = False
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.profiles.clear()
+            self.spans.clear()
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[self._key(name, labels)] += value
+
+    def observe(self, name: str, seconds: float, **labels):
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * (len(DURATION_BUCKETS) + 2)
+            for idx, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    histogram[idx] += 1
+            histogram[-2] += 1
+            histogram[-1] += seconds
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def profile(self, evaluator_name: str, enabled: bool = True):
+        """Opt-in cProfile for every evaluate_* call of one evaluator"""
+        if enabled:
+            self.profiled.add(evaluator_name)
+        else:
+            self.profiled.discard(evaluator_name)
+
+    def profile_stats(self, evaluator_name: str, sort: str = "cumulative", limit: int = 30) -> str:
+        profiler = self.profiles.get(evaluator_name)
+        if profiler is None:
+            return ""
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    def call(self, evaluator_name: str, method: str, fn, *args, **kwargs):
+        """Times one evaluator call and, if requested, profiles it and records a trace span"""
+        started = time.perf_counter()
+        profiler = None
+        # cProfile can't nest, so only the outermost profiled call in a thread collects
+        if evaluator_name in self.profiled and not getattr(self._local, "profiling", False):
+            with self._lock:
+                profiler = self.profiles.setdefault(evaluator_name, cProfile.Profile())
+            self._local.profiling = True
+            profiler.enable()
+        status = "ok"
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self._local.profiling = False
+            elapsed = time.perf_counter() - started
+            self.inc("evaluator_calls_total", evaluator=evaluator_name, method=method, status=status)
+            self.observe("evaluator_call_duration_seconds", elapsed, evaluator=evaluator_name, method=method)
+            if self.tracing:
+                self.spans.append({
+                    "name": f"{evaluator_name}.{method}",
+                    "ts": started,
+                    "dur": elapsed,
+                    "thread": threading.get_ident(),
+                    "status": status
+                })
+
+    def trace_events(self) -> list[dict]:
+        """Recorded spans in Chrome trace-event format (load in chrome://tracing or Perfetto)"""
+        return [
+            {"name": span["name"], "ph": "X", "ts": span["ts"] * 1e6, "dur": span["dur"] * 1e6,
+             "pid": 0, "tid": span["thread"], "args": {"status": span["status"]}}
+            for span in list(self.spans)
+        ]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": {self._format(name, labels): value for (name, labels), value in self.counters.items()},
+                "timers": {
+                    self._format(name, labels): {"count": histogram[-2], "sum": histogram[-1]}
+                    for (name, labels), histogram in self.histograms.items()
+                }
+            }
+
+    @staticmethod
+    def _format(name: str, labels: tuple, extra: tuple = ()) -> str:
+        labels = labels + extra
+        if not labels:
+            return name
+        rendered = ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+        return f"{name}{{{rendered}}}"
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, list(value)) for key, value in self.histograms.items())
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                lines.append(f"# TYPE {name} counter")
+                seen.add(name)
+            lines.append(f"{self._format(name, labels)} {value}")
+        for (name, labels), histogram in histograms:
+            if name not in seen:
+                lines.append(f"# TYPE {name} histogram")
+                seen.add(name)
+            for idx, bound in enumerate(DURATION_BUCKETS):
+                lines.append(f"{self._format(name + '_bucket', labels, (('le', bound),))} {histogram[idx]}")
+            lines.append(f"{self._format(name + '_bucket', labels, (('le', '+Inf'),))} {histogram[-2]}")
+            lines.append(f"{self._format(name + '_count', labels)} {histogram[-2]}")
+            lines.append(f"{self._format(name + '_sum', labels)} {histogram[-1]}")
+        return "\n".join(lines) + "\n"
+
+def _escape(value) -> str:
+    """Label value escaping required by the text format: backslash, double quote and newline"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+registry = MetricsRegistry()
+
+def instrument(fn):
+    """Wraps an evaluate_* method so calls are timed (and optionally traced) when metrics are
+    enabled, and profiled when any evaluator opted in with `profile()`"""
+    @functools.wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        if not registry.enabled and not registry.profiled:
+            return fn(self, *args, **kwargs)
+        return registry.call(self.name, fn.__name__, fn, self, *args, **kwargs)
+    wrapper._instrumented = True
+    return wrapper
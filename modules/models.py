@@ -0,0 +1,120 @@
+from modules.metrics import registry as metrics
+import gc, os, threading, time
+
+def _rss_bytes() -> int:
+    """Current resident set size (Linux), None where /proc is unavailable"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+def _parameter_bytes(model) -> int:
+    """Weight and buffer bytes of torch modules (incl. SentenceTransformer), None otherwise"""
+    parameters, buffers = getattr(model, "parameters", None), getattr(model, "buffers", None)
+    if not callable(parameters):
+        return None
+    tensors = list(parameters()) + (list(buffers()) if callable(buffers) else [])
+    return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+
+class _Entry:
+    __slots__ = ("model", "load_seconds", "rss_delta", "parameter_bytes", "last_used", "uses")
+
+class ModelRegistry:
+    """Loads every model once per process, under a name that includes its config (e.g.
+    "hatebert:int8"), so all evaluators asking for the same model share one copy. Tracks
+    per-model memory and use, and can drop idle models; the next `get` reloads them.
+
+    Loading models before forking worker processes (see `freeze`) lets the workers share the
+    read-only weights copy-on-write instead of each holding its own copy"""
+
+    def __init__(self):
+        self._models = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str, loader):
+        entry = self._models.get(name)
+        if entry is None:
+            with self._lock:
+                lock = self._locks.setdefault(name, threading.Lock())
+            with lock: # one load per model, different models may load concurrently
+                entry = self._models.get(name)
+                if entry is None:
+                    entry = self._load(name, loader)
+        entry.last_used = time.monotonic()
+        entry.uses += 1
+        return entry.model
+
+    def _load(self, name: str, loader) -> _Entry:
+        rss_before = _rss_bytes()
+        started = time.perf_counter()
+        entry = _Entry()
+        entry.model = loader()
+        entry.load_seconds = time.perf_counter() - started
+        rss_after = _rss_bytes()
+        entry.rss_delta = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+        entry.parameter_bytes = _parameter_bytes(entry.model)
+        entry.last_used = time.monotonic()
+        entry.uses = 0
+        self._models[name] = entry
+        metrics.inc("evaluator_model_loads_total", model=name)
+        metrics.observe("evaluator_model_load_duration_seconds", entry.load_seconds, model=name)
+        return entry
+
+    def loaded(self) -> list[str]:
+        return list(self._models)
+
+    def report(self) -> dict:
+        """{name: memory and usage}. `rss_mb` is the process growth while the model loaded (an
+        estimate when models load concurrently), `parameter_mb` the exact torch weight size"""
+        now = time.monotonic()
+        to_mb = lambda size: round(size / (1 << 20), 1) if size is not None else None
+        return {
+            name: {
+                "rss_mb": to_mb(entry.rss_delta),
+                "parameter_mb": to_mb(entry.parameter_bytes),
+                "load_seconds": round(entry.load_seconds, 3),
+                "idle_seconds": round(now - entry.last_used, 1),
+                "uses": entry.uses
+            }
+            for name, entry in list(self._models.items())
+        }
+
+    def unload(self, name: str) -> bool:
+        with self._lock:
+            entry = self._models.pop(name, None)
+        if entry is None:
+            return False
+        gc.collect()
+        return True
+
+    def unload_idle(self, max_idle: float) -> list[str]:
+        """Drops models unused for `max_idle` seconds. Callers still holding a reference keep
+        theirs alive until they let go"""
+        now = time.monotonic()
+        idle = [name for name, entry in list(self._models.items()) if now - entry.last_used >= max_idle]
+        with self._lock:
+            for name in idle:
+                self._models.pop(name, None)
+        if idle:
+            gc.collect()
+        return idle
+
+    def freeze(self):
+        """Call after loading models and right before forking workers: moves every live object
+        into the permanent GC generation, so collections in the children don't write to (and
+        thereby copy) the pages holding the shared models"""
+        gc.collect()
+        gc.freeze()
+
+_shared_registry = None
+_shared_registry_lock = threading.Lock()
+
+def get_model_registry() -> ModelRegistry:
+    """Process-wide model registry (inherited by forked workers)"""
+    global _shared_registry
+    with _shared_registry_lock:
+        if _shared_registry is None:
+            _shared_registry = ModelRegistry()
+        return _shared_registry
@@ -0,0 +1,102 @@
+from concurrent.futures import ThreadPoolExecutor
+from modules.metrics import registry
+import random, threading, time
+import requests
+from requests.adapters import HTTPAdapter
+
+class TokenBucket:
+    """Thread-safe token bucket, `acquire` blocks until a token is available"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class PerspectiveAPIError(RuntimeError):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"Perspective API error {status}: {message}")
+        self.status = status
+
+class PerspectiveClient:
+    """Concurrent Perspective API client. Requests are sent from a thread pool over a shared
+    keep-alive session, throttled to `qps` with a token bucket and retried with exponential
+    backoff on 429/5xx responses, timeouts and connection errors"""
+    DEFAULT_URL = "https://commentanalyzer.googleapis.com"
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, api_key: str = None, qps: float = 1.0, max_workers: int = 8, max_retries: int = 5,
+                 backoff: float = 1.0, max_backoff: float = 32.0, timeout: float = 30.0, base_url: str = None):
+        self.api_key = api_key
+        self.url = f"{(base_url or self.DEFAULT_URL).rstrip('/')}/v1alpha1/comments:analyze"
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.limiter = TokenBucket(qps)
+        self.max_workers = max_workers
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def analyze(self, text: str, attributes=("TOXICITY",)) -> dict:
+        """Returns {attribute: summary score} for every requested attribute, in one API call"""
+        body = {
+            "comment": {"text": text},
+            "requestedAttributes": {attribute: {} for attribute in attributes}
+        }
+        params = {"key": self.api_key} if self.api_key else None
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            started = time.perf_counter()
+            try:
+                response = self.session.post(self.url, params=params, json=body, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                status = "timeout" if isinstance(e, requests.Timeout) else "connection_error"
+                registry.inc("evaluator_http_requests_total", service="perspective", status=status)
+                if attempt == self.max_retries:
+                    raise
+                self._sleep(attempt, None)
+                continue
+            registry.inc("evaluator_http_requests_total", service="perspective", status=str(response.status_code))
+            registry.observe("evaluator_http_request_duration_seconds", time.perf_counter() - started, service="perspective")
+
+            if response.status_code == 200:
+                scores = response.json()["attributeScores"]
+                return {attribute: float(scores[attribute]["summaryScore"]["value"]) for attribute in attributes}
+            if response.status_code not in self.RETRY_STATUSES or attempt == self.max_retries:
+                raise PerspectiveAPIError(response.status_code, response.text)
+            self._sleep(attempt, response.headers.get("Retry-After"))
+
+    def _sleep(self, attempt: int, retry_after: str):
+        if retry_after is not None:
+            try:
+                time.sleep(float(retry_after))
+                return
+            except ValueError:
+                pass
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        time.sleep(delay * random.uniform(0.5, 1.0)) # jitter so retries don't arrive in lockstep
+
+    def analyze_many(self, texts: list[str], attributes=("TOXICITY",)) -> list[dict]:
+        """Analyzes texts in parallel (still bounded by the QPS limit), results in input order"""
+        return list(self._executor.map(lambda text: self.analyze(text, attributes), texts))
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
@@ -0,0 +1,108 @@
+"""Local stand-in for the commentanalyzer endpoint, for tests and benchmarks without network
+access. Run it standalone for an offline service.py (--perspective-url http://127.0.0.1:8001):
+
+    python -m modules.perspective_stub --port 8001"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse, json, threading, time
+
+class StubPerspectiveServer:
+    """Scores are derived deterministically from a small list of abusive words. The first
+    `fail_first` requests are answered with `fail_status` (and a Retry-After header unless
+    `retry_after` is None), the first `stall_first` are held for `stall` seconds before being
+    answered (past a client's timeout). Every request is recorded in `requests` as (arrival
+    time, body)"""
+    abusive_words = {"idiot", "stupid", "garbage", "nonsense", "naive", "hate", "shut", "dumb", "moron"}
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, fail_first: int = 0,
+                 fail_status: int = 429, retry_after: str = "0", stall_first: int = 0, stall: float = 0.5):
+        self.latency = latency
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.retry_after = retry_after
+        self.stall_first = stall_first
+        self.stall = stall
+        self.requests = []
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def num_requests(self) -> int:
+        return len(self.requests)
+
+    def score(self, text: str) -> float:
+        words = [word.strip(".,!?\"'").lower() for word in text.split()]
+        hits = sum(word in self.abusive_words for word in words)
+        return min(1.0, hits / max(1, len(words)) * 5)
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # keep-alive, like the real endpoint
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                with stub.lock:
+                    stub.requests.append((time.monotonic(), body))
+                    failed = len(stub.requests) <= stub.fail_first
+                    stalled = len(stub.requests) <= stub.stall_first
+                if stub.latency or stalled:
+                    time.sleep(stub.latency + (stub.stall if stalled else 0))
+                if failed:
+                    headers = {"Retry-After": stub.retry_after} if stub.retry_after is not None else {}
+                    self._send(stub.fail_status, {"error": {"code": stub.fail_status, "message": "Quota exceeded"}}, headers)
+                    return
+                score = stub.score(body["comment"]["text"])
+                self._send(200, {"attributeScores": {
+                    attribute: {"summaryScore": {"value": score, "type": "PROBABILITY"}}
+                    for attribute in body["requestedAttributes"]
+                }})
+
+            def _send(self, status: int, payload: dict, headers: dict = None):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "StubPerspectiveServer":
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a local Perspective API stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    args = parser.parse_args()
+    stub = StubPerspectiveServer(args.host, args.port, latency=args.latency)
+    print(f"[perspective stub] listening on {stub.url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
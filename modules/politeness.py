@@ -0,0 +1,356 @@
+from modules import available_cores
+from modules.cache import get_result_cache
+from modules.documents import get_document_service
+from modules.metrics import registry
+from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+import atexit, json, subprocess, threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from queue import Queue
+
+class _RWorker:
+    """A single long-lived Rscript process running r/politeness_worker.R"""
+    RESPONSE_PREFIX = "@@POLITENESS@@"
+    ERROR_PREFIX = "@@POLITENESS_ERROR@@"
+
+    def __init__(self, script: Path):
+        registry.inc("evaluator_subprocess_launches_total", command="Rscript")
+        self.process = subprocess.Popen(
+            ["Rscript", str(script)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+        )
+
+    def is_alive(self) -> bool:
+        return self.process.poll() is None
+
+    def score(self, texts: list[str]) -> list[dict]:
+        self.process.stdin.write(json.dumps(texts) + "\n")
+        self.process.stdin.flush()
+        while True:
+            line = self.process.stdout.readline()
+            if not line: # worker died mid-request
+                raise EOFError(f"R politeness worker exited (exit {self.process.poll()})")
+            if line.startswith(self.RESPONSE_PREFIX):
+                rows = json.loads(line[len(self.RESPONSE_PREFIX):])
+                if len(rows) != len(texts):
+                    raise RuntimeError(f"R politeness worker returned {len(rows)} rows for {len(texts)} texts")
+                return rows
+            if line.startswith(self.ERROR_PREFIX):
+                raise RuntimeError(f"R politeness worker failed: {line[len(self.ERROR_PREFIX):].strip()}")
+            # anything else is chatter from R packages, skip it
+
+    def close(self):
+        if self.is_alive():
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+
+class RPolitenessPool:
+    """Pool of persistent R politeness workers. Each worker loads jsonlite/spacyr/politeness and
+    initializes spaCy once, then scores batches of utterances sent over stdin as JSON lines with
+    a single vectorized `politeness()` call"""
+    WORKER_SCRIPT = Path(__file__).resolve().parent.parent / "r" / "politeness_worker.R"
+    version = 1
+
+    def __init__(self, num_workers: int = None, max_chunk_size: int = 64, max_retries: int = 1):
+        self.num_workers = num_workers or available_cores()
+        self.max_chunk_size = max_chunk_size
+        self.max_retries = max_retries
+        self._idle = Queue()
+        self._workers: list[_RWorker] = []
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @property
+    def started(self) -> bool:
+        return self._executor is not None
+
+    def warmup(self):
+        """Start the R workers now instead of on the first request"""
+        self._start()
+
+    def _start(self):
+        with self._lock:
+            if self._executor is not None:
+                return
+            # workers are started lazily so constructing the pool is free
+            for _ in range(self.num_workers):
+                worker = _RWorker(self.WORKER_SCRIPT)
+                self._workers.append(worker)
+                self._idle.put(worker)
+            self._executor = ThreadPoolExecutor(max_workers=self.num_workers)
+
+    def _restart(self, worker: _RWorker) -> _RWorker:
+        worker.close()
+        replacement = _RWorker(self.WORKER_SCRIPT)
+        with self._lock:
+            self._workers[self._workers.index(worker)] = replacement
+        return replacement
+
+    def _score_chunk(self, texts: list[str]) -> list[dict]:
+        worker = self._idle.get()
+        try:
+            for attempt in range(self.max_retries + 1):
+                if not worker.is_alive():
+                    worker = self._restart(worker)
+                try:
+                    return worker.score(texts)
+                except (EOFError, BrokenPipeError, json.JSONDecodeError):
+                    # crashed or garbled worker, replace it and try again
+                    worker = self._restart(worker)
+                    if attempt == self.max_retries:
+                        raise RuntimeError("R politeness worker crashed repeatedly")
+        finally:
+            self._idle.put(worker)
+
+    def score(self, texts: list[str], docs: list = None) -> list[dict]:
+        """Returns one politeness feature dict per text, in input order. `docs` is accepted for
+        interface parity with SpacyPolitenessExtractor and ignored, R parses the text itself"""
+        if not texts:
+            return []
+        # the same text is often scored by both the constructiveness evaluator and the ensemble
+        return get_result_cache().map(f"politeness/rscript/v{self.version}", texts, self._score_uncached)
+
+    def _score_uncached(self, texts: list[str]) -> list[dict]:
+        self._start()
+        chunk_size = min(self.max_chunk_size, -(-len(texts) // self.num_workers))
+        chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+        res = []
+        for rows in self._executor.map(self._score_chunk, chunks):
+            res.extend(rows)
+        return res
+
+    def close(self):
+        with self._lock:
+            for worker in self._workers:
+                worker.close()
+            self._workers = []
+            self._idle = Queue()
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+def get_politeness_pool(num_workers: int = None) -> RPolitenessPool:
+    """Process-wide pool shared by every evaluator that needs politeness features. `num_workers`
+    (default: one R worker per core) resizes it as long as no R worker has started, e.g. in a
+    worker process that inherited the pool from its parent"""
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            _shared_pool = RPolitenessPool(num_workers)
+            atexit.register(_shared_pool.close)
+        elif num_workers and not _shared_pool.started:
+            _shared_pool.num_workers = num_workers
+        return _shared_pool
+
+class SpacyPolitenessExtractor:
+    """In-process approximation of `politeness::politeness(parser="spacy", drop_blank=FALSE)`.
+    Produces the same feature columns as r/politeness_eval.R from an already-parsed spaCy Doc,
+    so no R process is spawned and the text is not parsed a second time"""
+    FEATURES = (
+        "Hedges", "Positive.Emotion", "Negative.Emotion", "Impersonal.Pronoun", "Swearing",
+        "Negation", "Filler.Pause", "Informal.Title", "Formal.Title", "Could.You", "Can.You",
+        "By.The.Way", "Let.Me.Know", "Goodbye", "For.Me", "For.You", "Reasoning", "Reassurance",
+        "Ask.Agency", "Give.Agency", "Hello", "Please", "First.Person.Plural", "First.Person.Single",
+        "Second.Person", "Agreement", "Acknowledgement", "Subjectivity", "Bare.Command",
+        "WH.Questions", "YesNo.Questions", "Gratitude", "Apology", "Truth.Intensifier",
+        "Affirmation", "Adverb.Just", "Conjunction.Start", "Disagreement"
+    )
+    # entries are single spaCy tokens: contractions are split ("it's" -> "it" + "'s"), so the
+    # pronoun half is counted on its own and multi-token entries belong in phrase_features
+    word_features = {
+        "Hedges": {
+            "almost", "apparent", "apparently", "appear", "appeared", "appears", "approximately",
+            "around", "assume", "assumed", "broadly", "claim", "claimed", "claims", "doubt",
+            "doubtful", "essentially", "estimate", "estimated", "fairly", "frequently", "generally",
+            "guess", "indicate", "indicated", "indicates", "largely", "likely", "mainly", "maybe",
+            "mostly", "often", "perhaps", "plausible", "plausibly", "possible", "possibly",
+            "postulate", "presumably", "probable", "probably", "quite", "rather", "relatively",
+            "roughly", "seem", "seemed", "seems", "sometimes", "somewhat", "suggest", "suggested",
+            "suggests", "suppose", "supposed", "suspect", "typically", "uncertain", "unclear",
+            "unlikely", "usually"
+        },
+        "Impersonal.Pronoun": {
+            "it", "its", "they", "them", "their", "theirs", "themselves", "this", "that",
+            "these", "those", "someone", "somebody", "something", "anyone", "anybody", "anything",
+            "everyone", "everybody", "everything", "nobody", "nothing"
+        },
+        "Swearing": {
+            "damn", "dammit", "hell", "crap", "shit", "shitty", "fuck", "fucking", "fucked", "ass",
+            "asshole", "bastard", "bitch", "bullshit", "piss", "pissed", "wtf", "stfu"
+        },
+        "Filler.Pause": {"um", "umm", "uh", "uhh", "er", "erm", "hmm", "hm", "uhm"},
+        "Informal.Title": {"dude", "bro", "buddy", "pal", "guys", "mate", "man", "folks"},
+        "Formal.Title": {"sir", "madam", "ma'am", "mr", "mrs", "ms", "miss", "dr", "professor", "mister"},
+        "Goodbye": {"goodbye", "bye", "farewell", "cya"},
+        "Hello": {"hi", "hello", "hey", "greetings", "howdy"},
+        "Please": {"please", "pls", "plz"},
+        "First.Person.Plural": {"we", "us", "our", "ours", "ourselves"},
+        "First.Person.Single": {"i", "me", "my", "mine", "myself"},
+        "Second.Person": {"you", "your", "yours", "yourself", "yourselves"},
+        "Gratitude": {"thank", "thanks", "thx", "appreciate", "appreciated", "grateful"},
+        "Apology": {"sorry", "apologize", "apologise", "apologies", "apology", "oops", "pardon"},
+        "Truth.Intensifier": {
+            "really", "actually", "honestly", "surely", "truly", "definitely", "obviously",
+            "clearly", "certainly", "undoubtedly", "indeed", "literally", "totally", "absolutely"
+        },
+        "Reasoning": {"because", "reason", "reasons", "rationale", "explain", "explained", "explains", "therefore"}
+    }
+    phrase_features = {
+        "Hedges": {("in", "general"), ("in", "most", "cases"), ("on", "the", "whole"), ("tend", "to"),
+                   ("tends", "to"), ("in", "my", "opinion"), ("in", "my", "view"), ("to", "my", "knowledge"),
+                   ("sort", "of"), ("kind", "of")},
+        "Could.You": {("could", "you"), ("would", "you")},
+        "Can.You": {("can", "you"), ("will", "you")},
+        "By.The.Way": {("by", "the", "way"), ("btw",)},
+        "Let.Me.Know": {("let", "me", "know")},
+        "Goodbye": {("see", "you"), ("take", "care"), ("talk", "soon")},
+        "For.Me": {("for", "me")},
+        "For.You": {("for", "you")},
+        "Reasoning": {("the", "reason"), ("reason", "why"), ("that", "'s", "why"), ("which", "is", "why")},
+        "Reassurance": {("no", "problem"), ("no", "worries"), ("do", "n't", "worry"), ("it", "'s", "okay"),
+                        ("it", "'s", "ok"), ("that", "'s", "fine"), ("that", "'s", "okay"), ("not", "a", "problem")},
+        "Ask.Agency": {("let", "me"), ("allow", "me"), ("can", "i"), ("could", "i"), ("may", "i"),
+                       ("might", "i"), ("should", "i"), ("do", "me", "a", "favor")},
+        "Give.Agency": {("let", "you"), ("allow", "you"), ("you", "can"), ("you", "may"), ("you", "could"),
+                        ("you", "are", "welcome", "to"), ("feel", "free")},
+        "Agreement": {("i", "agree"), ("good", "point"), ("you", "'re", "right"), ("you", "are", "right"),
+                      ("i", "concur"), ("fair", "point"), ("that", "'s", "true")},
+        "Acknowledgement": {("i", "understand"), ("i", "see"), ("i", "hear", "you"), ("i", "get", "it"),
+                            ("point", "taken"), ("makes", "sense")},
+        "Subjectivity": {("i", "think"), ("i", "believe"), ("i", "feel"), ("i", "suppose"), ("i", "guess"),
+                         ("we", "think"), ("we", "believe"), ("we", "feel")},
+        "Gratitude": {("much", "obliged")},
+        "Apology": {("excuse", "me"), ("my", "bad"), ("forgive", "me")},
+        "Truth.Intensifier": {("in", "fact"), ("the", "truth", "is"), ("to", "be", "honest")},
+        "Disagreement": {("i", "disagree"), ("i", "do", "n't", "agree"), ("i", "do", "n't", "think"),
+                         ("not", "sure"), ("that", "'s", "not", "true"), ("that", "'s", "wrong"), ("i", "doubt")}
+    }
+    wh_words = {"what", "who", "whom", "whose", "where", "when", "why", "how", "which"}
+    affirmation_starts = {"yes", "yeah", "yep", "ok", "okay", "great", "good", "nice", "cool", "awesome", "perfect", "sure"}
+    conjunction_starts = {"so", "then", "and", "but", "or", "also"}
+
+    annotations = {"tag", "dep"}
+
+    def __init__(self):
+        self.documents = get_document_service()
+        # VADER's lexicon stands in for the Hu & Liu emotion word lists used by the R package
+        lexicon = SentimentIntensityAnalyzer().lexicon
+        self.positive_words = {word for word, valence in lexicon.items() if valence > 0}
+        self.negative_words = {word for word, valence in lexicon.items() if valence < 0}
+        self._phrases_by_first = {}
+        for feature, phrases in self.phrase_features.items():
+            for phrase in phrases:
+                self._phrases_by_first.setdefault(phrase[0], []).append((phrase, feature))
+
+    def extract(self, doc) -> dict:
+        """Politeness feature counts for one parsed utterance"""
+        res = dict.fromkeys(self.FEATURES, 0)
+        words = [token.lower_ for token in doc]
+
+        for idx, token in enumerate(doc):
+            word = words[idx]
+            for feature, word_set in self.word_features.items():
+                if word in word_set:
+                    res[feature] += 1
+            if word in self.positive_words:
+                res["Positive.Emotion"] += 1
+            if word in self.negative_words:
+                res["Negative.Emotion"] += 1
+            if token.dep_ == "neg":
+                res["Negation"] += 1
+            if word == "just" and token.pos_ == "ADV":
+                res["Adverb.Just"] += 1
+            for phrase, feature in self._phrases_by_first.get(word, ()):
+                if tuple(words[idx:idx + len(phrase)]) == phrase:
+                    res[feature] += 1
+
+        for sent in doc.sents:
+            tokens = [token for token in sent if not token.is_punct and not token.is_space]
+            if not tokens:
+                continue
+            first = tokens[0]
+            if first.lower_ in self.conjunction_starts:
+                res["Conjunction.Start"] += 1
+            if first.lower_ in self.affirmation_starts:
+                res["Affirmation"] += 1
+            if sent.text.rstrip().endswith("?"):
+                if any(token.lower_ in self.wh_words for token in tokens[:3]):
+                    res["WH.Questions"] += 1
+                else:
+                    res["YesNo.Questions"] += 1
+            elif first.tag_ == "VB" and first.lower_ not in self.word_features["Please"] \
+                    and not any(child.dep_ in ("nsubj", "nsubjpass") for child in first.children):
+                res["Bare.Command"] += 1
+
+        return res
+
+    def score(self, texts: list[str], docs: list = None) -> list[dict]:
+        """Returns one politeness feature dict per text, in input order. Pass `docs` to reuse
+        existing parses"""
+        if docs is None:
+            docs = self.documents.parse(texts, self.annotations)
+        return [self.extract(doc) for doc in docs]
+
+POLITENESS_BACKENDS = ("rscript", "spacy")
+
+def get_politeness_backend(name: str = "rscript", num_workers: int = None):
+    """Returns the politeness scorer for `name`, one of POLITENESS_BACKENDS. `num_workers` sizes
+    the R pool and is ignored by the in-process backend"""
+    if name == "rscript":
+        return get_politeness_pool(num_workers)
+    if name == "spacy":
+        return SpacyPolitenessExtractor()
+    raise ValueError(f"Unknown politeness backend '{name}', expected one of {POLITENESS_BACKENDS}")
+
+PARITY_TEXTS = Path(__file__).resolve().parent.parent / "r" / "politeness_parity_texts.txt"
+PARITY_FIXTURE = Path(__file__).resolve().parent.parent / "r" / "politeness_parity.json"
+
+def read_parity_texts(path: Path = PARITY_TEXTS) -> list[str]:
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+def record_parity_fixture(texts: list[str] = None, path: Path = PARITY_FIXTURE):
+    """Records R politeness outputs (needs R, see setup_r.py) for `texts`, by default the
+    utterances in r/politeness_parity_texts.txt, so the spaCy backend can be checked without R"""
+    texts = texts if texts is not None else read_parity_texts()
+    rows = get_politeness_pool().score(texts)
+    with open(path, "w") as f:
+        json.dump([{"text": text, "politeness": row} for text, row in zip(texts, rows)], f, indent=2)
+
+def check_parity(path: Path = PARITY_FIXTURE, extractor: SpacyPolitenessExtractor = None) -> dict:
+    """Compares the spaCy backend against recorded R outputs. Returns the fraction of utterances on
+    which each feature matches exactly and the mean absolute difference per feature"""
+    if not Path(path).exists():
+        raise FileNotFoundError(f"No recorded R outputs at {path}, record them with `python -m modules.politeness record`")
+    with open(path) as f:
+        records = json.load(f)
+    extractor = extractor or SpacyPolitenessExtractor()
+    predicted = extractor.score([record["text"] for record in records])
+
+    res = {"num_utterances": len(records), "features": {}}
+    for feature in extractor.FEATURES:
+        expected = [record["politeness"].get(feature, 0) for record in records]
+        actual = [row[feature] for row in predicted]
+        diffs = [abs(e - a) for e, a in zip(expected, actual)]
+        res["features"][feature] = {
+            "exact_match": sum(d == 0 for d in diffs) / len(diffs) if diffs else 1.0,
+            "mean_abs_diff": sum(diffs) / len(diffs) if diffs else 0.0
+        }
+    return res
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == "record":
+        # python -m modules.politeness record [utterances.txt]
+        record_parity_fixture(read_parity_texts(sys.argv[2]) if len(sys.argv) > 2 else None)
+    else:
+        print(json.dumps(check_parity(), indent=2))
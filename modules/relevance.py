@@ -1,28 +1,191 @@
 from modules import Evaluator
+from modules.batching import TokenBudgetBatcher
+from modules.embeddings import EmbeddingStore, TopKIndex
+from modules.models import get_model_registry
+from collections import OrderedDict
 import numpy as np
-from sklearn.feature_extraction.text import CountVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from sentence_transformers import SentenceTransformer
-from bert_score import score as bert_score
+import threading
+
+IRRELEVANCE_THRESHOLD = 0.25 # utterances at or below it on both similarities count as irrelevant
+# sklearn, sentence_transformers and bert_score are imported on first use to keep startup fast
 
 def cosine_similarity_lexical(text1, text2):
     """Computes how similar the two texts are based on what words they use"""
+    from sklearn.feature_extraction.text import CountVectorizer
+    from sklearn.metrics.pairwise import cosine_similarity
     vectorizer = CountVectorizer()
     vectors = vectorizer.fit_transform([text1, text2])
     
     similarity = cosine_similarity(vectors[0], vectors[1])[0][0]
     return float(similarity)
 
-def semantic_similarity(text1, text2):
+def lexical_similarities(anchor: str, texts: list[str]) -> np.ndarray:
+    """Lexical cosine similarity of every text to the anchor. One vocabulary is fit over all of
+    them and the similarities come from a single sparse document-term product"""
+    from sklearn.feature_extraction.text import CountVectorizer
+    from sklearn.metrics.pairwise import cosine_similarity
+    vectors = CountVectorizer().fit_transform([anchor] + list(texts))
+    return cosine_similarity(vectors[1:], vectors[0]).ravel()
+
+def lexical_similarity_matrix(texts: list[str]) -> np.ndarray:
+    """All-pairs lexical cosine similarity over one shared vocabulary"""
+    from sklearn.feature_extraction.text import CountVectorizer
+    from sklearn.metrics.pairwise import cosine_similarity
+    vectors = CountVectorizer().fit_transform(texts)
+    return cosine_similarity(vectors)
+
+def corpus_lexical_similarities(conversations: list[list[str]]) -> list[np.ndarray]:
+    """Lexical similarity of every utterance to its conversation's first utterance, for a whole
+    corpus at once: one vocabulary, one document-term matrix, one sparse row-wise product"""
+    from sklearn.feature_extraction.text import CountVectorizer
+    from sklearn.preprocessing import normalize
+    texts, anchor_rows, offsets = [], [], [0]
+    for conversation in conversations:
+        anchor_rows.extend([len(texts)] * max(0, len(conversation) - 1))
+        texts.extend(conversation)
+        offsets.append(len(texts))
+    vectors = normalize(CountVectorizer().fit_transform(texts))
+
+    utterance_rows = [row for start, end in zip(offsets, offsets[1:]) for row in range(start + 1, end)]
+    sims = np.asarray(vectors[utterance_rows].multiply(vectors[anchor_rows]).sum(axis=1)).ravel()
+
+    res, start = [], 0
+    for conversation in conversations:
+        num_utterances = max(0, len(conversation) - 1)
+        res.append(sims[start:start + num_utterances])
+        start += num_utterances
+    return res
+
+def semantic_similarities(sentence_model: "SentenceTransformer", anchor: str, texts: list[str]) -> np.ndarray:
+    """Computes how similar the meaning of each text is to the anchor (even with different words).
+    The anchor and all texts are encoded in one batch, so the anchor is only encoded once"""
+    embeddings = sentence_model.encode([anchor] + list(texts), normalize_embeddings=True, convert_to_numpy=True)
+    # embeddings are unit length, so cosine similarity is a plain matrix-vector product
+    return embeddings[1:] @ embeddings[0]
+
+def load_sentence_model(name: str = 'all-MiniLM-L6-v2') -> "SentenceTransformer":
+    """Loaded once per process through the model registry"""
+    from sentence_transformers import SentenceTransformer
+    return get_model_registry().get(f"sentence-transformers:{name}", lambda: SentenceTransformer(name))
+
+def semantic_similarity(text1, text2, sentence_model: "SentenceTransformer" = None):
     """Computes how similar the meaning of both texts are (even with different words)"""
-    sentence_model = SentenceTransformer('all-MiniLM-L6-v2')
-    embedding1 = sentence_model.encode(text1)
-    embedding2 = sentence_model.encode(text2)
-    
-    similarity = cosine_similarity([embedding1], [embedding2])[0][0]
-    return float(similarity)
+    if sentence_model is None:
+        sentence_model = load_sentence_model()
+    return float(semantic_similarities(sentence_model, text1, [text2])[0])
+
+def _truncate_layers(model, num_layers: int):
+    """Drops transformer layers above `num_layers`, so BERTScore never computes them"""
+    import torch
+    for parent in ("encoder", "transformer"): # BERT/RoBERTa, DistilBERT
+        layers = getattr(getattr(model, parent, None), "layer", None)
+        if isinstance(layers, torch.nn.ModuleList):
+            setattr(getattr(model, parent), "layer", layers[:num_layers])
+            return True
+    return False
+
+class BERTScorer:
+    """BERTScore (greedy cosine matching of contextual token embeddings, no idf or baseline
+    rescaling) without bert_score's per-call overhead: the model is loaded once through the model
+    registry, each text is encoded once and its token embeddings are kept in an LRU, so the
+    anchor of a conversation is encoded a single time, and the scores of all (anchor, text) pairs
+    come from one padded batch of similarity matrices.
+
+    Defaults to distilbert-base-uncased at layer 5 (bert_score's choice for that model), a small
+    fraction of the cost of bert_score's roberta-large/layer 17 default for English"""
+
+    def __init__(self, model_type: str = "distilbert-base-uncased", num_layers: int = 5, max_length: int = 512,
+                 token_budget: int = 8192, max_cached: int = 4096):
+        self.model_type = model_type
+        self.num_layers = num_layers
+        self.max_length = max_length
+        self.batcher = TokenBudgetBatcher(max_length, token_budget=token_budget)
+        self.max_cached = max_cached
+        self._cache = OrderedDict() # text -> (tokens x dim) unit-length float32 embeddings
+        self._lock = threading.Lock()
+
+    @property
+    def tokenizer(self):
+        from transformers import AutoTokenizer
+        return get_model_registry().get(f"bertscore-tokenizer:{self.model_type}",
+                                        lambda: AutoTokenizer.from_pretrained(self.model_type))
+
+    @property
+    def model(self):
+        return get_model_registry().get(f"bertscore:{self.model_type}:{self.num_layers}", self._load_model)
+
+    def _load_model(self):
+        from transformers import AutoModel
+        model = AutoModel.from_pretrained(self.model_type)
+        model.eval()
+        model.bertscore_last_layer = self.num_layers is None or _truncate_layers(model, self.num_layers)
+        return model
 
-def bertscore_similarity(text1, text2):
+    def load_models(self):
+        self.tokenizer, self.model
+
+    def encode(self, texts: list[str]) -> list[np.ndarray]:
+        """Unit-length token embeddings of every text ([CLS]/[SEP] excluded), cached per text"""
+        with self._lock:
+            cached = {text: self._cache[text] for text in texts if text in self._cache}
+            for text in cached:
+                self._cache.move_to_end(text)
+        misses = list(dict.fromkeys(text for text in texts if text not in cached))
+        if misses:
+            cached.update(zip(misses, self._encode(misses)))
+            with self._lock:
+                for text in misses:
+                    self._cache[text] = cached[text]
+                while len(self._cache) > self.max_cached:
+                    self._cache.popitem(last=False)
+        return [cached[text] for text in texts]
+
+    def _encode(self, texts: list[str]) -> list[np.ndarray]:
+        import torch
+        tokenizer, model = self.tokenizer, self.model
+        token_ids = tokenizer(texts, add_special_tokens=False, truncation=True,
+                              max_length=self.batcher.window_length)["input_ids"]
+        res = [None] * len(texts)
+        with torch.inference_mode():
+            for batch in self.batcher.batches([len(ids) for ids in token_ids]):
+                inputs = tokenizer.pad([tokenizer.prepare_for_model(token_ids[idx]) for idx in batch], return_tensors="pt")
+                outputs = model(**inputs, output_hidden_states=not model.bertscore_last_layer)
+                hidden = outputs.last_hidden_state if model.bertscore_last_layer else outputs.hidden_states[self.num_layers]
+                hidden = torch.nn.functional.normalize(hidden, dim=-1).float().numpy()
+                for row, idx in enumerate(batch):
+                    res[idx] = hidden[row, 1:len(token_ids[idx]) + 1] # drop [CLS], [SEP] and padding
+        return res
+
+    def score(self, candidate: str, references: list[str]) -> dict:
+        """{"precision", "recall", "f1"} arrays, one value per reference. Precision matches the
+        candidate's tokens, recall the reference's, like bert_score.score([candidate], [reference])"""
+        if not references:
+            return {"precision": np.zeros(0), "recall": np.zeros(0), "f1": np.zeros(0)}
+        candidate_embeddings, *reference_embeddings = self.encode([candidate] + list(references))
+        if not len(candidate_embeddings): # empty texts share no tokens, bert_score scores them 0
+            return {name: np.zeros(len(references)) for name in ("precision", "recall", "f1")}
+        lengths = np.array([len(embeddings) for embeddings in reference_embeddings])
+        padded = np.zeros((len(references), max(lengths.max(), 1), candidate_embeddings.shape[1]), dtype=np.float32)
+        for idx, embeddings in enumerate(reference_embeddings):
+            padded[idx, :len(embeddings)] = embeddings
+        mask = np.arange(padded.shape[1]) < lengths[:, None] # references x reference tokens
+
+        # references x reference tokens x candidate tokens cosine similarities
+        sims = np.where(mask[:, :, None], padded @ candidate_embeddings.T, -np.inf)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            precision = sims.max(axis=1).mean(axis=1)
+            recall = np.where(mask, sims.max(axis=2), 0).sum(axis=1) / lengths
+            f1 = 2 * precision * recall / (precision + recall)
+        valid = lengths > 0
+        return {name: np.where(valid, np.nan_to_num(values), 0.0) for name, values in
+                (("precision", precision), ("recall", recall), ("f1", f1))}
+
+def bertscore_similarity(text1, text2, scorer: BERTScorer = None):
+    """With a `scorer`, the fast BERTScorer path, otherwise bert_score's own (slow) default model"""
+    if scorer is not None:
+        scores = scorer.score(text1, [text2])
+        return {name: float(values[0]) for name, values in scores.items()}
+    from bert_score import score as bert_score
     P, R, F1 = bert_score([text1], [text2], lang="en", verbose=False)
     
     return {
@@ -32,27 +195,141 @@ def bertscore_similarity(text1, text2):
     }
 
 class RelevanceEvaluator(Evaluator):
-    def __init__(self):
+    def __init__(self, sentence_model_name: str = 'all-MiniLM-L6-v2', chunked: bool = False, token_budget: int = 8192,
+                 stride: int = 32, bertscore: bool = False, bertscore_model: str = "distilbert-base-uncased",
+                 bertscore_layer: int = 5, embedding_store: str = None):
+        """With `chunked`, texts longer than the sentence model's max_seq_length are embedded as
+        the mean of overlapping windows (under a `token_budget` per batch) instead of truncated.
+        `bertscore` adds BERTScore P/R/F1 (see BERTScorer) to the per-pair results.
+        `embedding_store` is a directory for an EmbeddingStore: texts embedded once (in any run)
+        are read back from it instead of being encoded again"""
         super().__init__(name="Relevance")
+        self.sentence_model_name = sentence_model_name
+        self.chunked = chunked
+        self.token_budget = token_budget
+        self.stride = stride
+        self.bertscorer = BERTScorer(bertscore_model, bertscore_layer, token_budget=token_budget) if bertscore else None
+        # one store per embedding config, chunked vectors depend on the window overlap
+        store_name = sentence_model_name.replace("/", "--") + (f"-chunked-stride{stride}" if chunked else "")
+        self.store = EmbeddingStore(embedding_store, store_name) if embedding_store else None
+
+    @property
+    def sentence_model(self):
+        return load_sentence_model(self.sentence_model_name)
+
+    @property
+    def dimension(self) -> int:
+        return self.sentence_model.get_sentence_embedding_dimension()
+
+    def load_models(self):
+        self.sentence_model
+        if self.bertscorer is not None:
+            self.bertscorer.load_models()
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        """Unit-length sentence embeddings, one row per text"""
+        if self.store is not None:
+            return self.store.map(texts, self._encode)
+        return self._encode(list(texts))
+
+    def _encode(self, texts: list[str]) -> np.ndarray:
+        if self.chunked:
+            return self._embed_chunked(texts)
+        return self.sentence_model.encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+
+    def _embed_chunked(self, texts: list[str]) -> np.ndarray:
+        """Window token ids go straight through the model's modules (transformer, pooling and
+        any normalization) instead of being decoded and tokenized again by encode(), so every
+        text is tokenized once and each window is exactly what the token budget counted"""
+        import torch
+        model = self.sentence_model
+        tokenizer = model.tokenizer
+        batcher = TokenBudgetBatcher(
+            model.max_seq_length, num_special_tokens=tokenizer.num_special_tokens_to_add(), stride=self.stride,
+            token_budget=self.token_budget, combine="mean"
+        )
+        owners, windows = batcher.split(tokenizer(texts, add_special_tokens=False, verbose=False)["input_ids"])
+        embeddings = np.zeros((len(windows), model.get_sentence_embedding_dimension()), dtype=np.float32)
+        with torch.inference_mode():
+            for batch in batcher.batches([len(window) for window in windows]):
+                inputs = tokenizer.pad([tokenizer.prepare_for_model(windows[idx]) for idx in batch], return_tensors="pt")
+                features = model({key: value.to(model.device) for key, value in inputs.items()})
+                embeddings[batch] = torch.nn.functional.normalize(features["sentence_embedding"], dim=-1).float().cpu().numpy()
+        combined = batcher.combine(owners, embeddings, len(texts))
+        return (combined / np.linalg.norm(combined, axis=1, keepdims=True)).astype(np.float32)
+
+    def evaluate_batch(self, anchor: str, texts: list[str], embeddings: np.ndarray = None,
+                       bertscore: bool = True) -> list[dict]:
+        """Relevance of every text to the anchor, each similarity computed in one batched pass.
+        `embeddings` may hold precomputed rows for [anchor] + texts. BERTScore is only added when
+        the evaluator was built with `bertscore=True` and `bertscore` isn't switched off here"""
+        if not texts:
+            return []
+        cosine_sims = lexical_similarities(anchor, texts)
+        if embeddings is None: # through embed() so a batching service can intercept it
+            embeddings = self.embed([anchor] + list(texts))
+        semantic_sims = embeddings[1:] @ embeddings[0]
+        res = [
+            {
+                "cosine_similarity": float(cosine_sim),
+                "semantic_similarity": float(semantic_sim)
+            }
+            for cosine_sim, semantic_sim in zip(cosine_sims, semantic_sims)
+        ]
+        if bertscore and self.bertscorer is not None:
+            scores = self.bertscorer.score(anchor, texts)
+            for idx, item in enumerate(res):
+                item["bertscore"] = {name: float(values[idx]) for name, values in scores.items()}
+        return res
 
     def evaluate_utterance_pair(self, text1: str, text2: str) -> dict:
-        cosine_sim = cosine_similarity_lexical(text1, text2)
-        semantic_sim =semantic_similarity(text1, text2)
-        # bert_scores = bertscore_similarity(text1, text2)
-        
-        return {
-            "cosine_similarity": cosine_sim,
-            "semantic_similarity": semantic_sim,
-            # "bertscore": bert_scores
-        }
-
-    def evaluate_conversation(self, conversation):
+        return self.evaluate_batch(text1, [text2])[0]
+
+    @staticmethod
+    def is_irrelevant(cosine_similarity: float, semantic_similarity: float) -> bool:
+        return cosine_similarity <= IRRELEVANCE_THRESHOLD and semantic_similarity <= IRRELEVANCE_THRESHOLD
+
+    def evaluate_conversation(self, conversation, embeddings: np.ndarray = None):
         """Counts how many utterances are irrelevant (cosine and semantic similarity 
         values <= 0.25) to the first utterance in the conversation"""
         num_irrelevant_utterances = 0
-        text1 = conversation[0]
-        for text in conversation[1:len(conversation)]:
-            res = self.evaluate_utterance_pair(text1, text)
-            if (res["cosine_similarity"] <= 0.25 and res["semantic_similarity"] <= 0.25):
+        for res in self.evaluate_batch(conversation[0], conversation[1:], embeddings, bertscore=False):
+            if self.is_irrelevant(res["cosine_similarity"], res["semantic_similarity"]):
                 num_irrelevant_utterances += 1
-        return num_irrelevant_utterances
\ No newline at end of file
+        return num_irrelevant_utterances
+
+    def irrelevant_utterances(self, conversations: list[list[str]]) -> list[list[int]]:
+        """Corpus-wide evaluate_conversation rule: the turn indices (1 = first reply) of every
+        conversation's utterances that are irrelevant to its first utterance. One shared
+        vocabulary for the lexical side, one embed() call (through the store, if any) for the
+        semantic side"""
+        lexical = corpus_lexical_similarities(conversations)
+        embeddings = self.embed([text for conversation in conversations for text in conversation])
+        res, start = [], 0
+        for conversation, cosine_sims in zip(conversations, lexical):
+            rows = embeddings[start:start + len(conversation)]
+            start += len(conversation)
+            semantic_sims = rows[1:] @ rows[0] if len(conversation) else []
+            res.append([turn + 1 for turn, (cosine_sim, semantic_sim) in enumerate(zip(cosine_sims, semantic_sims))
+                        if self.is_irrelevant(cosine_sim, semantic_sim)])
+        return res
+
+    def conversation_embeddings(self, conversations: list[list[str]]) -> np.ndarray:
+        """One unit-length vector per conversation, the normalized mean of its utterance embeddings.
+        Empty conversations get a zero vector, which scores 0 against every query"""
+        texts = [text for conversation in conversations for text in conversation]
+        embeddings = self.embed(texts) if texts else None
+        dim = embeddings.shape[1] if embeddings is not None else self.dimension
+        means = np.zeros((len(conversations), dim), dtype=np.float32)
+        start = 0
+        for row, conversation in enumerate(conversations):
+            if conversation:
+                means[row] = embeddings[start:start + len(conversation)].mean(axis=0)
+                start += len(conversation)
+        norms = np.linalg.norm(means, axis=1, keepdims=True)
+        return means / np.where(norms > 0, norms, 1)
+
+    def conversation_index(self, conversations: list[list[str]], ids: list = None, **index_options) -> TopKIndex:
+        """Top-k index over conversations, query it with conversation_embeddings([new_conversation]).
+        `index_options` go to TopKIndex (e.g. num_lists=256 for approximate search)"""
+        return TopKIndex(self.conversation_embeddings(conversations), ids, **index_options)
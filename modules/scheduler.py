@@ -0,0 +1,85 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from modules import available_cores
+
+LANES = ("io", "cpu")
+
+class TaskGraph:
+    """Named tasks with dependencies. Each task's function is called with the results of its
+    dependencies, in the order they were declared, followed by any extra `args`"""
+
+    def __init__(self):
+        self.tasks = {}
+
+    def add(self, name: str, fn, deps: tuple = (), lane: str = "cpu", args: tuple = ()):
+        """`lane` picks where the task runs: "io" for network/subprocess-bound work, "cpu" for
+        torch/spaCy/numpy work that releases the GIL"""
+        if lane not in LANES:
+            raise ValueError(f"Unknown lane '{lane}', expected one of {LANES}")
+        for dep in deps:
+            if dep not in self.tasks:
+                raise ValueError(f"Task '{name}' depends on unknown task '{dep}'")
+        self.tasks[name] = (fn, tuple(deps), lane, tuple(args))
+        return self
+
+class Scheduler:
+    """Runs a TaskGraph, starting every task as soon as its dependencies finish. I/O-bound tasks
+    overlap on a large thread pool and CPU tasks share a core-sized thread pool. Pools are
+    created lazily and reused across runs. There is no process lane: forking from a process
+    whose other threads may hold locks can deadlock, and the pure-Python tasks in the ensemble
+    graphs cost less than pickling their inputs. batch.py runs whole conversations in worker
+    processes instead"""
+
+    def __init__(self, io_workers: int = 16, cpu_workers: int = None, parallel: bool = True):
+        self.parallel = parallel
+        self.num_workers = {
+            "io": io_workers,
+            "cpu": cpu_workers or available_cores()
+        }
+        self.executors = {}
+
+    def _executor(self, lane: str):
+        if lane not in self.executors:
+            self.executors[lane] = ThreadPoolExecutor(max_workers=self.num_workers[lane])
+        return self.executors[lane]
+
+    def run(self, graph: TaskGraph) -> dict:
+        """Returns {task name: result}"""
+        if not self.parallel:
+            return self._run_sequential(graph)
+
+        results = {}
+        pending = dict(graph.tasks)
+        running = {}
+        try:
+            while pending or running:
+                for name, (fn, deps, lane, args) in list(pending.items()):
+                    if all(dep in results for dep in deps):
+                        dep_results = [results[dep] for dep in deps]
+                        running[self._executor(lane).submit(fn, *dep_results, *args)] = name
+                        del pending[name]
+                if not running:
+                    raise ValueError(f"Tasks {sorted(pending)} have cyclic dependencies")
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+        finally:
+            for future in running:
+                future.cancel()
+        return results
+
+    def _run_sequential(self, graph: TaskGraph) -> dict:
+        results = {}
+        pending = dict(graph.tasks)
+        while pending:
+            ready = [name for name, (_, deps, _, _) in pending.items() if all(dep in results for dep in deps)]
+            if not ready:
+                raise ValueError(f"Tasks {sorted(pending)} have cyclic dependencies")
+            for name in ready:
+                fn, deps, _, args = pending.pop(name)
+                results[name] = fn(*[results[dep] for dep in deps], *args)
+        return results
+
+    def close(self):
+        for executor in self.executors.values():
+            executor.shutdown(wait=False)
+        self.executors = {}
@@ -1,4 +1,5 @@
 from modules import Evaluator
+from modules.cache import get_result_cache
 from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
 
 class SentimentEvaluator(Evaluator):
@@ -6,8 +7,13 @@ class SentimentEvaluator(Evaluator):
         super().__init__(name="Sentiment")
         self.analyzer = SentimentIntensityAnalyzer()
 
+    def _scores(self, texts: list[str]) -> list[dict]:
+        return get_result_cache().map(
+            f"{self.name}/v{self.version}", texts, lambda misses: [self.analyzer.polarity_scores(text) for text in misses]
+        )
+
     def evaluate_utterance(self, text: str) -> dict:
-        score = self.analyzer.polarity_scores(text)
+        score = self._scores([text])[0]
         return score
 
     def evaluate_conversation(self, conversation):
@@ -18,8 +24,7 @@ class SentimentEvaluator(Evaluator):
             "utterances": []
         }
 
-        for utterance in conversation:
-            score = self.evaluate_utterance(utterance)
+        for score in self._scores(conversation):
             res["utterances"].append(score)
             for key in score.keys():
                 res['aggregate'][key] = res['aggregate'].get(key, 0) + score[key] 
@@ -1,31 +1,51 @@
-from modules import Evaluator
-from googleapiclient import discovery
+from modules import Evaluator, lazy_property
+from modules.cache import get_result_cache
 import os
 
 class ToxicityEvaluator(Evaluator):
-    def __init__(self):
+    def __init__(self, qps: float = 1.0, max_workers: int = 8, attributes: tuple = ("TOXICITY",), base_url: str = None):
+        """`qps` should match the project's Perspective quota (1 QPS by default). Any extra
+        `attributes` are requested in the same call and reported under "attribute_scores\""""
         super().__init__(name="Toxicity")
-        self.client = discovery.build(
-            "commentanalyzer",
-            "v1alpha1",
-            developerKey=os.getenv("PERSPECTIVE_API_KEY"),
-            discoveryServiceUrl="https://commentanalyzer.googleapis.com/$discovery/rest?version=v1alpha1",
-            static_discovery=False
+        self.attributes = tuple(attributes) if "TOXICITY" in attributes else ("TOXICITY", *attributes)
+        self.qps = qps
+        self.max_workers = max_workers
+        self.base_url = base_url
+
+    @lazy_property
+    def client(self):
+        from modules.perspective import PerspectiveClient
+        return PerspectiveClient(
+            api_key=os.getenv("PERSPECTIVE_API_KEY"),
+            qps=self.qps,
+            max_workers=self.max_workers,
+            base_url=self.base_url
         )
 
-    def evaluate_utterance(self, text: str) -> dict:
-        analyze_request = {
-            'comment': {'text': text},
-            'requestedAttributes': {'TOXICITY': {}}
-        }
-        response = self.client.comments().analyze(body=analyze_request).execute()
-        score = float(response["attributeScores"]["TOXICITY"]["summaryScore"]["value"])
+    def warmup(self):
+        self.client
+
+    def _result(self, scores: dict) -> dict:
+        score = scores["TOXICITY"]
         label = "highly-toxic" if score > .8 else "toxic" if score > .5 else "non-toxic" # Threshold values from 'Conversations Gone Alright'
 
-        return {
+        res = {
             "score": round(score, 3),
             "label": label
         }
+        if len(self.attributes) > 1:
+            res["attribute_scores"] = {attribute: round(value, 3) for attribute, value in scores.items()}
+        return res
+
+    def _scores(self, texts: list[str]) -> list[dict]:
+        # Perspective calls are slow and quota-bound, repeated texts are answered from the cache
+        return get_result_cache().map(
+            f"{self.name}/v{self.version}/{','.join(self.attributes)}", texts,
+            lambda misses: self.client.analyze_many(misses, self.attributes)
+        )
+
+    def evaluate_utterance(self, text: str) -> dict:
+        return self._result(self._scores([text])[0])
 
     def evaluate_conversation(self, conversation: list[str]) -> dict:
         res = {
@@ -37,12 +57,13 @@ class ToxicityEvaluator(Evaluator):
             "utterances": []
         }
 
-        for text in conversation:
-            _res = self.evaluate_utterance(text)
+        # utterances are analyzed concurrently, up to the client's QPS limit
+        for scores in self._scores(conversation):
+            _res = self._result(scores)
             res["aggregate"][_res["label"]] += 1
             res["utterances"].append(_res)
 
         for label in ["non-toxic", "toxic", "highly-toxic"]:
             res["aggregate"][label] /= len(conversation)
 
-        return res
\ No newline at end of file
+        return res
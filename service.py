@@ -0,0 +1,286 @@
+"""Long-running HTTP scoring service: one process keeps an EnsembleEvaluator warm and serves
+
+    POST /utterance           {"text": ...}
+    POST /utterance_pair      {"text1": ..., "text2": ...}
+    POST /conversation        {"conversation": [...]}
+    GET  /health
+    GET  /metrics             (Prometheus text format, see modules.metrics)
+
+    python service.py --port 8000 --max-wait-ms 10
+
+Concurrent requests share HateBERT and sentence-embedding forward passes: their texts are merged
+by a micro-batcher that waits at most --max-wait-ms for company. Once --max-pending requests are
+in progress new ones get 503 with Retry-After instead of queueing without bound. Only the standard
+library is used for the server, so it runs anywhere the evaluators do; point --perspective-url at
+a local stub (python -m modules.perspective_stub) to run it fully offline."""
+from concurrent.futures import Future, ThreadPoolExecutor
+from modules.cache import get_result_cache
+from modules.metrics import registry
+from modules.models import get_model_registry
+import argparse, asyncio, json, queue, sys, threading, time
+
+class MicroBatcher:
+    """Merges items submitted from many threads into batched calls of `fn(items) -> results`.
+    A batch is dispatched once it holds `max_batch_size` items or its oldest item has waited
+    `max_wait` seconds"""
+
+    def __init__(self, fn, max_batch_size: int = 64, max_wait: float = 0.01, name: str = "batch"):
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name=f"{name}-batcher", daemon=True)
+        self._thread.start()
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, item) -> Future:
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def map(self, items: list) -> list:
+        """Blocking, results in input order. Items may end up in batches with other callers' items"""
+        futures = [self.submit(item) for item in items]
+        return [future.result() for future in futures]
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            if batch[0] is None:
+                return
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    entry = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if entry is None:
+                    self._queue.put(None) # finish this batch, stop afterwards
+                    break
+                batch.append(entry)
+            self._run(batch)
+
+    def _run(self, batch: list):
+        items = [item for item, _ in batch]
+        registry.inc("service_batches_total", batcher=self.name)
+        registry.inc("service_batched_items_total", len(items), batcher=self.name)
+        try:
+            results = list(self.fn(items))
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str, headers: dict = None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+def _to_json(value):
+    return value.item() if hasattr(value, "item") else str(value) # numpy scalars
+
+class ScoringService:
+    """asyncio HTTP/1.1 server around an EnsembleEvaluator. Scoring runs on a thread pool, the
+    HateBERT and embedding calls of every in-flight request go through shared MicroBatchers"""
+
+    def __init__(self, ensemble, host: str = "127.0.0.1", port: int = 8000, max_pending: int = 64,
+                 max_workers: int = 16, max_batch_size: int = 64, max_wait: float = 0.01, max_body: int = 1 << 20):
+        self.ensemble = ensemble
+        self.host = host
+        self.port = port
+        self.max_pending = max_pending
+        self.max_body = max_body
+        self.pending = 0
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.batchers = {}
+        self._server = None
+
+        hate_speech = ensemble.hate_speech_evaluator
+        if hate_speech is not None:
+            batcher = MicroBatcher(hate_speech.evaluate_batch, max_batch_size, max_wait, name="hate_speech")
+            # instance attribute shadows the method, evaluate_utterance/conversation pick it up
+            hate_speech.evaluate_batch = lambda texts, max_batch_size=None, batcher=batcher: batcher.map(texts)
+            self.batchers["hate_speech"] = batcher
+        relevance = ensemble.relevance_evaluator
+        if relevance is not None:
+            import numpy as np
+            batcher = MicroBatcher(relevance.embed, max_batch_size, max_wait, name="embeddings")
+            def embed(texts, batcher=batcher):
+                rows = batcher.map(list(texts))
+                return np.stack(rows) if rows else np.zeros((0, relevance.dimension), dtype=np.float32)
+            relevance.embed = embed
+            self.batchers["embeddings"] = batcher
+
+        self.routes = {
+            ("POST", "/utterance"): self._utterance,
+            ("POST", "/utterance_pair"): self._utterance_pair,
+            ("POST", "/conversation"): self._conversation,
+            ("GET", "/health"): self._health,
+            ("GET", "/metrics"): self._metrics
+        }
+
+    # handlers: parsed JSON body -> (status, payload)
+    async def _score(self, fn, *args):
+        if self.pending >= self.max_pending: # shed load instead of growing an unbounded queue
+            registry.inc("service_rejected_requests_total")
+            raise HTTPError(503, "Server overloaded, retry later", {"Retry-After": "1"})
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    @staticmethod
+    def _field(body, key: str, kind):
+        if not isinstance(body, dict) or not isinstance(body.get(key), kind):
+            raise HTTPError(400, f"Expected a JSON object with '{key}' ({kind.__name__})")
+        return body[key]
+
+    async def _utterance(self, body):
+        return await self._score(self.ensemble.evaluate_utterance, self._field(body, "text", str))
+
+    async def _utterance_pair(self, body):
+        text1, text2 = self._field(body, "text1", str), self._field(body, "text2", str)
+        return await self._score(self.ensemble.evaluate_utterance_pair, text1, text2)
+
+    async def _conversation(self, body):
+        conversation = self._field(body, "conversation", list)
+        if len(conversation) < 2 or not all(isinstance(text, str) for text in conversation):
+            raise HTTPError(400, "'conversation' must be a list of at least two strings")
+        return await self._score(self.ensemble.evaluate_conversation, conversation)
+
+    async def _health(self, body):
+        return {
+            "status": "ok",
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "batch_queues": {name: batcher.qsize() for name, batcher in self.batchers.items()},
+            "evaluators": list(self.ensemble.evaluators),
+            "result_cache": get_result_cache().report(),
+            "models": get_model_registry().report()
+        }
+
+    async def _metrics(self, body):
+        return registry.to_prometheus()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, version = request_line.decode("latin-1").split()
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                if length > self.max_body:
+                    await self._respond(writer, 413, {"error": "Request body too large"}, close=True)
+                    break
+                raw = await reader.readexactly(length) if length else b""
+                close = headers.get("connection", "").lower() == "close" or version == "HTTP/1.0"
+                status, payload, extra = await self._dispatch(method, path.split("?")[0], raw)
+                await self._respond(writer, status, payload, extra, close)
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method: str, path: str, raw: bytes) -> tuple:
+        handler = self.routes.get((method, path))
+        if handler is None:
+            allowed = any(route_path == path for _, route_path in self.routes)
+            return (405, {"error": f"{method} not allowed on {path}"}, {}) if allowed else \
+                   (404, {"error": f"No route for {path}"}, {})
+        try:
+            body = json.loads(raw) if raw else None
+        except ValueError:
+            return 400, {"error": "Request body is not valid JSON"}, {}
+        try:
+            return 200, await handler(body), {}
+        except HTTPError as e:
+            return e.status, {"error": str(e)}, e.headers
+        except Exception as e:
+            return 500, {"error": f"{type(e).__name__}: {e}"}, {}
+
+    async def _respond(self, writer, status: int, payload, headers: dict = None, close: bool = False):
+        if isinstance(payload, str):
+            body, content_type = payload.encode(), "text/plain; version=0.0.4"
+        else:
+            body, content_type = json.dumps(payload, default=_to_json).encode(), "application/json"
+        head = [f"HTTP/1.1 {status} {REASONS.get(status, '')}", f"Content-Type: {content_type}",
+                f"Content-Length: {len(body)}", f"Connection: {'close' if close else 'keep-alive'}"]
+        head += [f"{key}: {value}" for key, value in (headers or {}).items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1] # resolves port=0
+        return self
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for batcher in self.batchers.values():
+            batcher.close()
+        self.executor.shutdown(wait=False)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve EnsembleEvaluator over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-pending", type=int, default=64, help="requests in progress before answering 503")
+    parser.add_argument("--workers", type=int, default=16, help="threads running evaluator calls")
+    parser.add_argument("--max-batch-size", type=int, default=64, help="texts per batched forward pass")
+    parser.add_argument("--max-wait-ms", type=float, default=10.0, help="longest a text waits for a batch to fill")
+    parser.add_argument("--politeness-backend", choices=("rscript", "spacy"), default="rscript")
+    parser.add_argument("--evaluators", nargs="+", default=None, help="evaluator names to run (default: all)")
+    parser.add_argument("--perspective-url", default=None, help="Perspective API base URL (e.g. a local stub)")
+    parser.add_argument("--metrics", action="store_true", help="collect metrics for GET /metrics")
+    args = parser.parse_args(argv)
+
+    from main import EnsembleEvaluator
+    options = {"toxicity": {"base_url": args.perspective_url}} if args.perspective_url else None
+    ensemble = EnsembleEvaluator(politeness_backend=args.politeness_backend, evaluators=args.evaluators,
+                                 evaluator_options=options)
+    if args.metrics:
+        registry.enable()
+    ensemble.warmup() # load every model before taking traffic
+
+    service = ScoringService(ensemble, args.host, args.port, max_pending=args.max_pending, max_workers=args.workers,
+                             max_batch_size=args.max_batch_size, max_wait=args.max_wait_ms / 1000)
+    print(f"[service] listening on http://{args.host}:{args.port}", file=sys.stderr)
+    try:
+        asyncio.run(service.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+from pathlib import Path
+import json
+import batch
+import modules.politeness
+import pytest
+
+@pytest.fixture
+def fresh_politeness_pool(monkeypatch):
+    monkeypatch.setattr(modules.politeness, "_shared_pool", None)
+
+def test_worker_kwargs_split_the_machine():
+    kwargs = batch.worker_ensemble_kwargs({"evaluators": ["sentiment"], "evaluator_options": {"toxicity": {"qps": 5}}}, 3)
+    assert kwargs["evaluators"] == ["sentiment"]
+    assert kwargs["evaluator_options"] == {"toxicity": {"qps": 5}, "constructiveness": {"politeness_workers": 3}}
+    assert kwargs["scheduler"].num_workers["cpu"] == 3
+
+def test_explicit_politeness_workers_win():
+    kwargs = batch.worker_ensemble_kwargs({"evaluator_options": {"constructiveness": {"politeness_workers": 1}}}, 4)
+    assert kwargs["evaluator_options"]["constructiveness"] == {"politeness_workers": 1}
+
+def test_worker_ensemble_sizes_the_r_pool(fresh_politeness_pool):
+    pytest.importorskip("vaderSentiment")
+    from main import EnsembleEvaluator
+    ensemble = EnsembleEvaluator(**batch.worker_ensemble_kwargs({"evaluators": ["constructiveness"]}, 2))
+    assert ensemble.politeness.num_workers == 2
+    assert not ensemble.politeness.started
+
+def test_inherited_pool_is_resized_until_started(fresh_politeness_pool):
+    pool = modules.politeness.get_politeness_pool()
+    assert pool.num_workers == modules.politeness.available_cores()
+    assert modules.politeness.get_politeness_pool(2) is pool and pool.num_workers == 2
+    pool._executor = object() # as if the R workers were running
+    assert modules.politeness.get_politeness_pool(5).num_workers == 2
+    pool._executor = None
+
+def test_limit_threads(monkeypatch):
+    for var in batch.THREAD_ENV_VARS:
+        monkeypatch.setenv(var, "") # registers the original value for restoring
+        monkeypatch.delenv(var)
+    monkeypatch.setenv("MKL_NUM_THREADS", "7") # explicit settings are kept
+    batch._limit_threads(2)
+    assert batch.os.environ["OMP_NUM_THREADS"] == "2"
+    assert batch.os.environ["MKL_NUM_THREADS"] == "7"
+
+def test_run_batch_resumes(tmp_path: Path, monkeypatch):
+    pytest.importorskip("textstat")
+    monkeypatch.setenv("RESULT_CACHE_ENTRIES", "0")
+    inputs = tmp_path / "conversations.jsonl"
+    conversations = [{"id": f"c{idx}", "conversation": ["Hello there.", "I think so.", "Maybe not.", "My turn now."]}
+                     for idx in range(4)]
+    inputs.write_text("".join(json.dumps(record) + "\n" for record in conversations[:2]))
+    output = tmp_path / "results.jsonl"
+    stats = batch.run_batch(inputs, output, workers=2, evaluators=[])
+    assert (stats["scored"], stats["failed"]) == (2, 0)
+
+    inputs.write_text("".join(json.dumps(record) + "\n" for record in conversations))
+    stats = batch.run_batch(inputs, output, workers=2, evaluators=[])
+    assert (stats["skipped"], stats["scored"]) == (2, 2)
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert sorted(record["id"] for record in records) == ["c0", "c1", "c2", "c3"]
+    assert records[0]["result"]["Social Cohesion"]["num_self_disclosure_utterances"] == 2
@@ -0,0 +1,73 @@
+from modules.embeddings import KEY_SIZE, EmbeddingStore, TopKIndex
+import numpy as np
+import pytest
+
+def unit_vectors(num: int, dim: int = 8, seed: int = 0) -> np.ndarray:
+    vectors = np.random.default_rng(seed).normal(size=(num, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def test_stores_share_appends(tmp_path):
+    writer, reader = EmbeddingStore(tmp_path, "model"), EmbeddingStore(tmp_path, "model") # reader opened before any data
+    vectors = unit_vectors(3)
+    writer.add(["a", "b", "c"], vectors)
+    found, missing = reader.get_many(["c", "x", "a"])
+    assert missing == [1]
+    np.testing.assert_array_equal(found, vectors[[2, 0]])
+
+    calls = []
+    def encode(texts):
+        calls.append(texts)
+        return unit_vectors(len(texts), seed=1)
+    res = reader.map(["a", "d", "d", "e"], encode)
+    assert calls == [["d", "e"]] # only unseen texts, each once
+    np.testing.assert_array_equal(res[1], res[2])
+    assert len(writer.get_many(["d", "e"])[1]) == 0 and len(writer) == 5
+    np.testing.assert_array_equal(EmbeddingStore(tmp_path, "model").vectors, writer.vectors)
+
+def test_partial_writes_are_overwritten(tmp_path):
+    store = EmbeddingStore(tmp_path, "model")
+    vectors = unit_vectors(3)
+    store.add(["a", "b"], vectors[:2])
+    # a writer died after writing a row and half of its key
+    with open(store.vectors_path, "ab") as f:
+        f.write(vectors[2].tobytes())
+    with open(store.keys_path, "ab") as f:
+        f.write(EmbeddingStore.key("c")[:KEY_SIZE // 2])
+
+    reopened = EmbeddingStore(tmp_path, "model")
+    assert len(reopened) == 2 and "c" not in reopened
+    replacement = unit_vectors(2, seed=3)
+    reopened.add(["d", "e"], replacement)
+    fresh = EmbeddingStore(tmp_path, "model")
+    assert len(fresh) == 4 and "d" in fresh and "e" in fresh
+    np.testing.assert_array_equal(fresh.get_many(["a", "b", "d", "e"])[0], np.vstack([vectors[:2], replacement]))
+
+def test_dimension_mismatch(tmp_path):
+    store = EmbeddingStore(tmp_path, "model")
+    store.add(["a"], unit_vectors(1, dim=8))
+    with pytest.raises(ValueError, match="8-dimensional"):
+        EmbeddingStore(tmp_path, "model").add(["b"], unit_vectors(1, dim=4))
+
+def test_exact_search_matches_argsort(monkeypatch):
+    vectors, queries = unit_vectors(500, seed=0), unit_vectors(7, seed=1)
+    monkeypatch.setattr(TopKIndex, "BLOCK_ROWS", 64) # several blocks
+    indices, scores = TopKIndex(vectors).search(queries, k=10)
+    expected = np.argsort(-(queries @ vectors.T), axis=1, kind="stable")[:, :10]
+    np.testing.assert_array_equal(indices, expected)
+    np.testing.assert_allclose(scores, np.take_along_axis(queries @ vectors.T, expected, axis=1), rtol=1e-6)
+
+def test_ivf_search():
+    vectors, queries = unit_vectors(400, seed=0), unit_vectors(20, seed=1)
+    ids = [f"conv{idx}" for idx in range(len(vectors))]
+    index = TopKIndex(vectors, ids, num_lists=8, nprobe=8)
+    exact, _ = index.search(queries, k=5, exact=True)
+    approx, _ = index.search(queries, k=5)
+    np.testing.assert_array_equal(approx, exact) # probing every list is exhaustive
+
+    # one probed list can hold fewer than k vectors: the rest is padded
+    index.nprobe = 1
+    k = max(len(members) for members in index.lists) + 1
+    indices, scores = index.search(queries[:1], k=k)
+    assert indices[0, -1] is None and scores[0, -1] == -np.inf
+    found = [idx for idx in indices[0] if idx is not None]
+    assert len(found) == len(set(found)) and np.all(np.diff(scores[0, :len(found)]) <= 0)
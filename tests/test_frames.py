@@ -0,0 +1,52 @@
+from modules.frames import ResultFrame
+import math
+import numpy as np
+import pytest
+
+def section(*utterances, aggregate=None) -> dict:
+    return {"aggregate": aggregate or {}, "utterances": list(utterances)}
+
+def test_missing_conversation_keys_are_padded():
+    frame = ResultFrame.from_results([{"a": {"x": 1.0, "y": 2.0}}, {"a": {"x": 1.5}}])
+    assert len(frame.columns["a/x"]) == len(frame.columns["a/y"]) == 2
+    first, second = frame.to_dicts()
+    assert first == {"a": {"x": 1.0, "y": 2.0}}
+    assert second["a"]["x"] == 1.5 and math.isnan(second["a"]["y"])
+
+def test_keys_first_seen_later_are_padded_for_earlier_rows():
+    frame = ResultFrame.from_results([{"n": 1}, {"n": 2, "label": "b", "flag": True}, {"n": 3, "label": "c"}])
+    assert [row.get("label") for row in frame.to_dicts()] == [None, "b", "c"]
+    assert frame.columns["flag"][1] == 1 and math.isnan(frame.columns["flag"][0]) and math.isnan(frame.columns["flag"][2])
+    assert frame.columns["n"].tolist() == [1, 2, 3]
+
+def test_missing_utterance_keys_stay_on_their_rows():
+    results = [
+        {"S": section({"score": 0.1, "label": "non-hate"}, {"score": 0.9, "label": "hate"})},
+        {"S": section({"label": "hate"}, {"score": 0.4, "label": "non-hate", "extra": 7})}
+    ]
+    frame = ResultFrame.from_results(results)
+    columns = frame.sections["S"]["columns"]
+    assert all(len(values) == 4 for values in columns.values())
+    assert columns["score"][:2].tolist() == [0.1, 0.9]
+    assert math.isnan(columns["score"][2]) and columns["score"][3] == 0.4
+    assert math.isnan(columns["extra"][0]) and columns["extra"][3] == 7
+    utterances = frame.to_dicts()[1]["S"]["utterances"]
+    assert utterances[0]["label"] == "hate" and math.isnan(utterances[0]["score"])
+    assert utterances[1] == {"score": 0.4, "label": "non-hate", "extra": 7.0}
+
+def test_padded_frame_round_trips(tmp_path):
+    frame = ResultFrame.from_results([{"a": {"x": 1.0, "y": "p"}}, {"a": {"x": 1.5}}])
+    frame.save(tmp_path / "frame.npz")
+    loaded = ResultFrame.load(tmp_path / "frame.npz")
+    assert loaded.to_dicts()[1]["a"]["y"] is None
+    assert loaded.to_dicts()[0] == {"a": {"x": 1.0, "y": "p"}}
+
+def test_mixed_types_are_rejected():
+    with pytest.raises(ValueError, match="'a/x' mixes strings and numbers"):
+        ResultFrame.from_results([{"a": {"x": 1.0}}, {"a": {"x": "high"}}])
+
+def test_many_distinct_strings():
+    results = [{"id": f"utterance-{idx}"} for idx in range(40000)] # past int16 codes
+    frame = ResultFrame.from_results(results)
+    assert frame.columns["id"].dtype == np.int32
+    assert frame.to_dicts()[-1] == {"id": "utterance-39999"}
@@ -0,0 +1,45 @@
+from pathlib import Path
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+from modules.hate_speech import runtime
+
+@pytest.fixture
+def tiny_model(tmp_path) -> Path:
+    """A randomly initialized 2-layer BERT classifier with a toy vocabulary, built offline"""
+    from transformers import BertConfig, BertForSequenceClassification, BertTokenizerFast
+    words = sorted({word.strip(".,!?").lower() for text in runtime.SAMPLE_TEXTS for word in text.split()})
+    (tmp_path / "vocab.txt").write_text("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", *words]))
+    model_path = tmp_path / "HateBERT_tiny"
+    BertTokenizerFast(str(tmp_path / "vocab.txt")).save_pretrained(model_path)
+    config = BertConfig(vocab_size=5 + len(words), hidden_size=32, num_hidden_layers=2, num_attention_heads=2,
+                        intermediate_size=64, max_position_embeddings=64)
+    BertForSequenceClassification(config).save_pretrained(model_path)
+    return model_path
+
+def test_runtime_is_renamed_into_place(tiny_model, monkeypatch):
+    cache_path = runtime.cached_runtime_path(tiny_model, "torchscript")
+    saved_to = []
+    save = torch.jit.save
+
+    def checked_save(module, path):
+        saved_to.append(path)
+        assert not cache_path.exists() # readers only ever see the finished file
+        save(module, path)
+
+    monkeypatch.setattr(torch.jit, "save", checked_save)
+    assert runtime.build_runtime(tiny_model, "torchscript") == cache_path
+    assert saved_to and Path(saved_to[0]) != cache_path
+    assert [path.name for path in tiny_model.parent.glob("*.pt")] == [cache_path.name] # no temp file left
+    assert runtime.check_runtime(tiny_model, "torchscript")["label_agreement"] == 1.0
+
+def test_failed_build_leaves_no_files(tiny_model, monkeypatch):
+    def failing_save(module, path):
+        Path(path).write_bytes(b"partial")
+        raise OSError("disk full")
+
+    monkeypatch.setattr(torch.jit, "save", failing_save)
+    with pytest.raises(OSError):
+        runtime.build_runtime(tiny_model, "torchscript")
+    assert list(tiny_model.parent.glob("*.pt")) == []
@@ -0,0 +1,41 @@
+from modules.idea_adoption import IdeaAdoptionEvaluator
+import pytest
+
+spacy = pytest.importorskip("spacy")
+
+class TaggingDocuments:
+    """Stands in for the document service: a blank pipeline that tags every word as a noun"""
+
+    def __init__(self):
+        self.nlp = spacy.blank("en")
+        self.nlp.add_pipe("sentencizer")
+        self.texts = []
+
+    def parse(self, texts, annotations):
+        self.texts.extend(texts)
+        docs = list(self.nlp.pipe(texts))
+        for token in (token for doc in docs for token in doc):
+            if token.is_alpha:
+                token.pos_, token.lemma_ = "NOUN", token.text
+        return docs
+
+@pytest.fixture
+def evaluator() -> IdeaAdoptionEvaluator:
+    evaluator = IdeaAdoptionEvaluator()
+    evaluator.documents = TaggingDocuments()
+    return evaluator
+
+def test_parses_lower_cased_text(evaluator):
+    conversation = ["Taxes on Capital", "capital rules and TAXES", "Rules"]
+    res = evaluator.evaluate_conversation(conversation)
+    assert evaluator.documents.texts == [text.lower() for text in conversation]
+    assert res["participant_2"]["num_ideas_adopted"] == 2 # taxes and capital, whatever their case
+    assert res["participant_1"]["num_ideas_adopted"] == 1
+
+def test_session_matches_whole_conversation(evaluator):
+    conversation = ["Taxes on Capital", "capital rules and TAXES", "Rules"]
+    session = evaluator.session()
+    for text in conversation:
+        session.add_turn(text)
+    assert session.result() == evaluator.evaluate_conversation(conversation)
+    assert evaluator.documents.texts == [text.lower() for text in conversation] * 2
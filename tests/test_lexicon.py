@@ -0,0 +1,28 @@
+from modules.lexicon import PhraseMatcher
+
+def test_matches_only_at_token_boundaries():
+    matcher = PhraseMatcher(["or", "for example"])
+    assert matcher.counts("For example, coffee or tea; nothing for me") == {"for example": 1, "or": 1}
+
+def test_case_insensitive_with_spans_into_the_original_text():
+    matcher = PhraseMatcher(["I mean"])
+    text = "Well, I MEAN it."
+    assert matcher.find_all(text) == [(6, 12, "i mean")]
+    assert text[6:12] == "I MEAN"
+
+def test_whitespace_runs_match_phrase_spaces():
+    matcher = PhraseMatcher(["in fact", "on the other hand"])
+    text = "In\nfact it works.  On  the\t other\r\nhand, in fact."
+    spans = matcher.find_all(text)
+    assert [phrase for _, _, phrase in spans] == ["in fact", "on the other hand", "in fact"]
+    assert [text[start:end] for start, end, _ in spans] == ["In\nfact", "On  the\t other\r\nhand", "in fact"]
+
+def test_leading_whitespace_and_single_words():
+    matcher = PhraseMatcher(["however"])
+    assert matcher.find_all("   however") == [(3, 10, "however")]
+    assert matcher.count("however,\n\nhowever") == 2
+
+def test_overlapping_phrases():
+    matcher = PhraseMatcher(["as well", "as well as", "well"])
+    assert matcher.counts("this as well as that") == {"as well": 1, "as well as": 1, "well": 1}
+    assert not matcher.contains("farewell aswell")
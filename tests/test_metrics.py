@@ -0,0 +1,43 @@
+from modules import Evaluator
+from modules.metrics import MetricsRegistry, registry
+import pytest
+
+class SlowEvaluator(Evaluator):
+    def __init__(self, name: str = "Slow"):
+        super().__init__(name=name)
+
+    def evaluate_utterance(self, text: str) -> int:
+        return sum(len(word) for word in text.split() * 200)
+
+@pytest.fixture
+def clean_registry():
+    yield registry
+    registry.disable()
+    registry.reset()
+    registry.profiled.clear()
+
+def test_profile_without_enable(clean_registry):
+    evaluator = SlowEvaluator()
+    evaluator.profile()
+    assert not registry.enabled
+    evaluator.evaluate_utterance("profile me please")
+    assert "evaluate_utterance" in evaluator.profile_stats()
+    assert registry.counters == {} # counters stay off until enable()
+
+def test_disabled_registry_records_nothing(clean_registry):
+    SlowEvaluator().evaluate_utterance("nothing to see")
+    assert registry.counters == {} and registry.profiles == {}
+
+def test_enabled_registry_counts_calls(clean_registry):
+    registry.enable()
+    SlowEvaluator().evaluate_utterance("count me")
+    assert registry.snapshot()["counters"] == {
+        'evaluator_calls_total{evaluator="Slow",method="evaluate_utterance",status="ok"}': 1
+    }
+
+def test_prometheus_label_values_are_escaped():
+    metrics = MetricsRegistry()
+    metrics.enable()
+    metrics.inc("evaluator_calls_total", evaluator='say "hi"\\now\nthen')
+    line = metrics.to_prometheus().splitlines()[1]
+    assert line == 'evaluator_calls_total{evaluator="say \\"hi\\"\\\\now\\nthen"} 1.0'
@@ -0,0 +1,117 @@
+from modules.perspective import PerspectiveAPIError, PerspectiveClient, TokenBucket
+from modules.perspective_stub import StubPerspectiveServer
+import time
+import pytest
+import requests
+
+@pytest.fixture
+def stub():
+    with StubPerspectiveServer() as server:
+        yield server
+
+def client_for(server, **kwargs) -> PerspectiveClient:
+    kwargs = {"qps": 1000.0, "backoff": 0.01, "max_backoff": 0.05, **kwargs}
+    return PerspectiveClient(base_url=server.url, **kwargs)
+
+def test_multiple_attributes_in_one_request(stub):
+    client = client_for(stub)
+    scores = client.analyze("you are an idiot", ("TOXICITY", "INSULT", "PROFANITY"))
+    assert set(scores) == {"TOXICITY", "INSULT", "PROFANITY"}
+    assert scores["TOXICITY"] == pytest.approx(stub.score("you are an idiot"))
+    assert stub.num_requests == 1
+    assert set(stub.requests[0][1]["requestedAttributes"]) == {"TOXICITY", "INSULT", "PROFANITY"}
+    client.close()
+
+def test_retries_429_until_success():
+    with StubPerspectiveServer(fail_first=3) as stub:
+        client = client_for(stub, max_retries=5)
+        assert client.analyze("hello there") == {"TOXICITY": 0.0}
+        assert stub.num_requests == 4
+        client.close()
+
+def test_gives_up_after_max_retries():
+    with StubPerspectiveServer(fail_first=10) as stub:
+        client = client_for(stub, max_retries=2)
+        with pytest.raises(PerspectiveAPIError) as error:
+            client.analyze("hello there")
+        assert error.value.status == 429
+        assert stub.num_requests == 3
+        client.close()
+
+def test_retries_timeouts():
+    with StubPerspectiveServer(stall_first=2, stall=0.5) as stub:
+        client = client_for(stub, timeout=0.1, max_retries=3)
+        assert client.analyze("hello there") == {"TOXICITY": 0.0}
+        assert stub.num_requests == 3
+        client.close()
+
+def test_gives_up_after_repeated_timeouts():
+    with StubPerspectiveServer(stall_first=10, stall=0.3) as stub:
+        client = client_for(stub, timeout=0.05, max_retries=1)
+        with pytest.raises(requests.Timeout):
+            client.analyze("hello there")
+        assert stub.num_requests == 2
+        client.close()
+
+def test_does_not_retry_client_errors():
+    with StubPerspectiveServer(fail_first=1, fail_status=400, retry_after=None) as stub:
+        client = client_for(stub, max_retries=5)
+        with pytest.raises(PerspectiveAPIError) as error:
+            client.analyze("hello there")
+        assert error.value.status == 400
+        assert stub.num_requests == 1
+        client.close()
+
+def test_honours_retry_after():
+    # a backoff of 100s would time the test out, so the wait must come from Retry-After
+    with StubPerspectiveServer(fail_first=1, retry_after="0.3") as stub:
+        client = client_for(stub, backoff=100.0, max_backoff=100.0)
+        started = time.monotonic()
+        client.analyze("hello there")
+        elapsed = time.monotonic() - started
+        assert 0.3 <= elapsed < 5
+        (first, _), (second, _) = stub.requests
+        assert second - first >= 0.3
+        client.close()
+
+def test_backs_off_without_retry_after():
+    with StubPerspectiveServer(fail_first=2, retry_after=None) as stub:
+        client = client_for(stub, backoff=0.1, max_backoff=1.0)
+        client.analyze("hello there")
+        (first, _), (second, _), (third, _) = stub.requests
+        # jittered exponential backoff: 0.05-0.1s, then 0.1-0.2s
+        assert second - first >= 0.05
+        assert third - second >= 0.1
+        client.close()
+
+def test_qps_limit_across_workers(stub):
+    qps = 20.0
+    client = client_for(stub, qps=qps, max_workers=8)
+    texts = [f"message {idx}" for idx in range(50)]
+    started = time.monotonic()
+    results = client.analyze_many(texts)
+    elapsed = time.monotonic() - started
+    assert len(results) == len(texts)
+    # the bucket starts full (one second's worth), the rest is paced at `qps`
+    assert elapsed >= (len(texts) - qps) / qps * 0.9
+    arrivals = sorted(arrival for arrival, _ in stub.requests)
+    for idx in range(len(arrivals)):
+        in_window = sum(1 for arrival in arrivals[idx:] if arrival - arrivals[idx] < 1.0)
+        assert in_window <= 2 * qps + 1 # burst plus one second of refill
+    client.close()
+
+def test_token_bucket_paces_after_burst():
+    bucket = TokenBucket(rate=50.0, capacity=5)
+    started = time.monotonic()
+    for _ in range(15):
+        bucket.acquire()
+    assert time.monotonic() - started >= 10 / 50.0 * 0.9
+
+def test_toxicity_evaluator_against_stub(stub, no_result_cache):
+    from modules.toxicity import ToxicityEvaluator
+    evaluator = ToxicityEvaluator(qps=1000.0, attributes=("TOXICITY", "INSULT"), base_url=stub.url)
+    res = evaluator.evaluate_conversation(["thanks for the help", "shut up you moron"])
+    assert [utterance["label"] for utterance in res["utterances"]] == ["non-toxic", "highly-toxic"]
+    assert res["aggregate"] == {"non-toxic": 0.5, "toxic": 0.0, "highly-toxic": 0.5}
+    assert set(res["utterances"][0]["attribute_scores"]) == {"TOXICITY", "INSULT"}
+    assert stub.num_requests == 2
@@ -0,0 +1,50 @@
+from modules.politeness import PARITY_FIXTURE, SpacyPolitenessExtractor, check_parity
+import os
+import pytest
+
+# minimum share of utterances on which the spaCy backend must match R's count exactly. The
+# emotion features use VADER's lexicon instead of the R package's word lists and the sentence
+# level features depend on the parse, so they get looser bounds
+DEFAULT_EXACT_MATCH = 0.9
+EXACT_MATCH = {
+    "Positive.Emotion": 0.6,
+    "Negative.Emotion": 0.6,
+    "Bare.Command": 0.8,
+    "WH.Questions": 0.8,
+    "YesNo.Questions": 0.8,
+    "Hedges": 0.8,
+    "Impersonal.Pronoun": 0.8
+}
+MAX_MEAN_ABS_DIFF = 0.5
+
+@pytest.fixture(scope="module")
+def parity():
+    if not PARITY_FIXTURE.exists():
+        reason = f"{PARITY_FIXTURE.name} not recorded, run `python -m modules.politeness record` where R is set up"
+        if os.getenv("CI"): # a missing fixture must not pass CI as a skip
+            pytest.fail(reason)
+        pytest.skip(reason)
+    spacy = pytest.importorskip("spacy")
+    if not spacy.util.is_package("en_core_web_sm"):
+        pytest.skip("en_core_web_sm is not installed")
+    return check_parity()
+
+def test_fixture_covers_every_feature(parity):
+    assert parity["num_utterances"] > 0
+    assert set(parity["features"]) == set(SpacyPolitenessExtractor.FEATURES)
+
+@pytest.mark.parametrize("feature", SpacyPolitenessExtractor.FEATURES)
+def test_feature_agreement(parity, feature):
+    stats = parity["features"][feature]
+    assert stats["exact_match"] >= EXACT_MATCH.get(feature, DEFAULT_EXACT_MATCH), stats
+    assert stats["mean_abs_diff"] <= MAX_MEAN_ABS_DIFF, stats
+
+def test_lexicon_entries_are_single_tokens():
+    # entries spaCy would split (e.g. "it's") could never match a token
+    tokenizer = pytest.importorskip("spacy").blank("en").tokenizer
+    for feature, words in SpacyPolitenessExtractor.word_features.items():
+        for word in words:
+            assert [token.lower_ for token in tokenizer(word)] == [word], (feature, word)
+    for feature, phrases in SpacyPolitenessExtractor.phrase_features.items():
+        for phrase in phrases:
+            assert tuple(token.lower_ for token in tokenizer(" ".join(phrase))) == phrase, (feature, phrase)
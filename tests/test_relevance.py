@@ -0,0 +1,63 @@
+from modules.relevance import RelevanceEvaluator
+import numpy as np
+import pytest
+
+def test_store_is_keyed_by_chunking_config(tmp_path):
+    names = {
+        RelevanceEvaluator("org/model", embedding_store=tmp_path).store.name,
+        RelevanceEvaluator("org/model", chunked=True, stride=32, embedding_store=tmp_path).store.name,
+        RelevanceEvaluator("org/model", chunked=True, stride=64, embedding_store=tmp_path).store.name,
+        RelevanceEvaluator("org/model", chunked=True, stride=64, token_budget=1024, embedding_store=tmp_path).store.name
+    }
+    assert names == {"org--model", "org--model-chunked-stride32", "org--model-chunked-stride64"}
+
+@pytest.fixture
+def tiny_model_path(tmp_path):
+    """A randomly initialized 2-layer BERT sentence model with a toy vocabulary, built offline"""
+    pytest.importorskip("sentence_transformers")
+    from sentence_transformers import SentenceTransformer, models
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+    words = "the cat sat on mat and dog ran in park while bird sang a song".split()
+    (tmp_path / "vocab.txt").write_text("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", *words]))
+    BertTokenizerFast(str(tmp_path / "vocab.txt")).save_pretrained(tmp_path / "bert")
+    config = BertConfig(vocab_size=5 + len(words), hidden_size=32, num_hidden_layers=2, num_attention_heads=2,
+                        intermediate_size=64, max_position_embeddings=64)
+    BertModel(config).save_pretrained(tmp_path / "bert")
+    transformer = models.Transformer(str(tmp_path / "bert"), max_seq_length=16)
+    pooling = models.Pooling(transformer.get_word_embedding_dimension())
+    SentenceTransformer(modules=[transformer, pooling, models.Normalize()]).save(str(tmp_path / "sentence"))
+    return str(tmp_path / "sentence")
+
+def test_chunked_short_texts_match_encode(tiny_model_path):
+    evaluator = RelevanceEvaluator(tiny_model_path, chunked=True, stride=4)
+    texts = ["the cat sat on the mat", "a dog ran in the park"]
+    expected = evaluator.sentence_model.encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+    np.testing.assert_allclose(evaluator.embed(texts), expected, atol=1e-5)
+
+def test_chunked_long_texts_are_windowed(tiny_model_path):
+    evaluator = RelevanceEvaluator(tiny_model_path, chunked=True, stride=4)
+    model = evaluator.sentence_model
+    text = " ".join(["the cat sat on the mat while a bird sang a song"] * 4) # 48 tokens, 16 per window
+    seen = []
+    hook = model[0].register_forward_pre_hook(lambda module, args: seen.append(args[0]["input_ids"].shape[1]))
+    try:
+        embedding = evaluator.embed([text])[0]
+    finally:
+        hook.remove()
+    assert seen and max(seen) <= model.max_seq_length
+    assert np.linalg.norm(embedding) == pytest.approx(1.0, abs=1e-5)
+    truncated = model.encode([text], normalize_embeddings=True, convert_to_numpy=True)[0]
+    assert not np.allclose(embedding, truncated, atol=1e-4) # the tail beyond max_seq_length counts
+
+class TwoAxisRelevanceEvaluator(RelevanceEvaluator):
+    """Embeds texts starting with "a" on one axis and everything else on the other, no model needed"""
+
+    def _encode(self, texts: list[str]) -> np.ndarray:
+        return np.array([[1.0, 0.0] if text.startswith("a") else [0.0, 1.0] for text in texts], dtype=np.float32)
+
+def test_empty_conversations_get_zero_vectors():
+    with np.errstate(all="raise"): # no mean of an empty slice
+        embeddings = TwoAxisRelevanceEvaluator().conversation_embeddings([["a1", "b1"], [], ["a2"]])
+    np.testing.assert_allclose(embeddings, [[2 ** -0.5, 2 ** -0.5], [0, 0], [1, 0]], rtol=1e-6)
+    indices, scores = TwoAxisRelevanceEvaluator().conversation_index([["a1"], [], ["b1"]]).search(embeddings[2:], k=3)
+    assert indices.tolist() == [[0, 1, 2]] and not np.isnan(scores).any()
@@ -0,0 +1,40 @@
+from modules.scheduler import Scheduler, TaskGraph
+import threading
+import pytest
+
+def diamond() -> TaskGraph:
+    graph = TaskGraph()
+    graph.add("a", lambda: 2)
+    graph.add("b", lambda a: a * 3, deps=("a",), lane="io")
+    graph.add("c", lambda a, offset: a + offset, deps=("a",), args=(10,))
+    graph.add("d", lambda b, c: (b, c), deps=("b", "c"))
+    return graph
+
+@pytest.mark.parametrize("parallel", [True, False])
+def test_results_follow_dependencies(parallel):
+    scheduler = Scheduler(parallel=parallel)
+    assert scheduler.run(diamond()) == {"a": 2, "b": 6, "c": 12, "d": (6, 12)}
+    scheduler.close()
+
+def test_independent_tasks_overlap():
+    barrier = threading.Barrier(2, timeout=5) # deadlocks unless both run at once
+    graph = TaskGraph().add("x", barrier.wait, lane="io").add("y", barrier.wait, lane="io")
+    scheduler = Scheduler(io_workers=2)
+    assert set(scheduler.run(graph)) == {"x", "y"}
+    scheduler.close()
+
+def test_unknown_dependency_and_lane():
+    with pytest.raises(ValueError):
+        TaskGraph().add("a", lambda b: b, deps=("b",))
+    for lane in ("gpu", "process"):
+        with pytest.raises(ValueError):
+            TaskGraph().add("a", lambda: 1, lane=lane)
+
+def test_default_ensemble_never_forks(no_result_cache):
+    pytest.importorskip("textstat")
+    from main import EnsembleEvaluator
+    ensemble = EnsembleEvaluator(evaluators=[])
+    res = ensemble.evaluate_conversation(["Hi there, how are you?", "I am fine.", "Good to hear.", "My day was long."])
+    assert res["Social Cohesion"] == {"num_dialogue_exchanges": 2, "num_self_disclosure_utterances": 2}
+    assert set(ensemble.scheduler.executors) <= {"io", "cpu"}
+    ensemble.scheduler.close()
@@ -0,0 +1,135 @@
+from main import EnsembleEvaluator
+from modules import Evaluator
+from modules.metrics import registry
+from modules.relevance import RelevanceEvaluator
+from service import ScoringService
+import asyncio, http.client, json, threading, time
+import numpy as np
+import pytest
+
+class RecordingHateSpeechEvaluator(Evaluator):
+    """Stands in for HateBERT: records the size of every batch and can hold calls until released"""
+
+    def __init__(self):
+        super().__init__(name="Hate Speech")
+        self.batch_sizes = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def evaluate_batch(self, texts: list[str], max_batch_size: int = None) -> list[dict]:
+        self.release.wait(timeout=10)
+        self.batch_sizes.append(len(texts))
+        return [{"score": len(text) / 100, "label": "non-hate"} for text in texts]
+
+    def evaluate_utterance(self, text: str) -> dict:
+        return self.evaluate_batch([text])[0]
+
+class LengthRelevanceEvaluator(RelevanceEvaluator):
+    """Two-dimensional embeddings from text length, no sentence model needed"""
+    dimension = 2
+
+    def _encode(self, texts: list[str]) -> np.ndarray:
+        return np.array([[1.0, len(text)] for text in texts], dtype=np.float32)
+
+class Server:
+    """ScoringService on an ephemeral port, its event loop running in a background thread"""
+
+    def __init__(self, **options):
+        self.hate_speech = RecordingHateSpeechEvaluator()
+        ensemble = EnsembleEvaluator(evaluators=[])
+        ensemble.hate_speech_evaluator = self.hate_speech
+        ensemble.utterance_evaluators = [self.hate_speech]
+        ensemble.relevance_evaluator = LengthRelevanceEvaluator()
+        self.service = ScoringService(ensemble, port=0, **options)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.run(self.service.start())
+
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout=10)
+
+    def request(self, method: str, path: str, body=None, raw: bytes = None) -> tuple:
+        connection = http.client.HTTPConnection("127.0.0.1", self.service.port, timeout=10)
+        try:
+            if body is not None:
+                raw = json.dumps(body).encode()
+            connection.request(method, path, body=raw)
+            response = connection.getresponse()
+            return response.status, dict(response.getheaders()), response.read()
+        finally:
+            connection.close()
+
+    def close(self):
+        self.hate_speech.release.set()
+        self.run(self.service.stop())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+@pytest.fixture
+def server(request, no_result_cache):
+    server = Server(**getattr(request, "param", {}))
+    yield server
+    server.close()
+
+@pytest.mark.parametrize("server", [{"max_batch_size": 8, "max_wait": 5.0}], indirect=True)
+def test_concurrent_requests_share_batches(server):
+    results = [None] * 8
+    def post(idx):
+        results[idx] = server.request("POST", "/utterance", {"text": "x" * idx})
+    threads = [threading.Thread(target=post, args=(idx,)) for idx in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # a full batch goes out right away, long before max_wait
+    assert server.hate_speech.batch_sizes == [8]
+    for idx, (status, _, body) in enumerate(results):
+        assert status == 200
+        assert json.loads(body) == {"Hate Speech": {"score": idx / 100, "label": "non-hate"}}
+
+@pytest.mark.parametrize("server", [{"max_pending": 1}], indirect=True)
+def test_overload_answers_503(server):
+    server.hate_speech.release.clear()
+    blocked = threading.Thread(target=server.request, args=("POST", "/utterance", {"text": "slow"}))
+    blocked.start()
+    for _ in range(1000):
+        if server.service.pending:
+            break
+        time.sleep(0.01)
+    status, headers, body = server.request("POST", "/utterance", {"text": "rejected"})
+    assert status == 503 and headers["Retry-After"] == "1"
+    assert "overloaded" in json.loads(body)["error"]
+    server.hate_speech.release.set()
+    blocked.join()
+    assert server.request("POST", "/utterance", {"text": "accepted"})[0] == 200
+
+@pytest.mark.parametrize("server", [{"max_body": 1024}], indirect=True)
+def test_client_errors(server):
+    assert server.request("POST", "/utterance", raw=b"{not json")[0] == 400
+    assert server.request("POST", "/utterance", {"txt": "typo"})[0] == 400
+    assert server.request("POST", "/conversation", {"conversation": ["only one"]})[0] == 400
+    assert server.request("GET", "/nowhere")[0] == 404
+    assert server.request("GET", "/utterance")[0] == 405
+    assert server.request("POST", "/health")[0] == 405
+    assert server.request("POST", "/utterance", {"text": "x" * 2048})[0] == 413
+    assert server.hate_speech.batch_sizes == [] # nothing reached the evaluator
+
+def test_metrics_endpoint(server):
+    registry.enable()
+    try:
+        assert server.request("POST", "/utterance", {"text": "counted"})[0] == 200
+        status, headers, body = server.request("GET", "/metrics")
+    finally:
+        registry.disable()
+        registry.reset()
+    assert status == 200 and headers["Content-Type"].startswith("text/plain")
+    lines = body.decode().splitlines()
+    assert 'service_batches_total{batcher="hate_speech"} 1.0' in lines
+    assert 'service_batched_items_total{batcher="hate_speech"} 1.0' in lines
+
+def test_batched_embeddings(server):
+    embed = server.service.ensemble.relevance_evaluator.embed
+    np.testing.assert_array_equal(embed(["a", "bcd"]), [[1, 1], [1, 3]])
+    assert embed([]).shape == (0, 2) # np.stack needs at least one row
@@ -0,0 +1,97 @@
+from main import EnsembleEvaluator, check_session
+from modules import Evaluator
+from modules.relevance import RelevanceEvaluator
+from modules.perspective_stub import StubPerspectiveServer
+import hashlib
+import numpy as np
+import pytest
+
+CONVERSATION = [
+    "Rich people pay too much in taxes, and the loopholes argument is lazy thinking.",
+    "Shareholders don't produce anything of value, so we should tax them and give it to the workers.",
+    "What naive garbage. Shareholders provide the capital that makes production possible in the first place.",
+    "That's a dumb and stupid take, they just shouldn't hold most of the wealth.",
+    "You're missing the point. They earned it by risking their capital when others wouldn't.",
+    "My cat knocked a plant off the windowsill this morning.",
+    "Risk is real, but workers risk their livelihoods too. Thanks for hearing me out, honestly."
+]
+
+class HashedRelevanceEvaluator(RelevanceEvaluator):
+    """RelevanceEvaluator with a hashed bag-of-words encoder in place of the sentence model"""
+
+    def _encode(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), 64), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                vectors[row, hashlib.blake2b(word.strip(".,!?'").encode(), digest_size=1).digest()[0] % 64] += 1
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+class StubHateSpeechEvaluator(Evaluator):
+    """Deterministic stand-in for HateBERT, scored by text length"""
+
+    def __init__(self, drift: float = 0.0):
+        super().__init__(name="Hate Speech")
+        self.drift = drift
+
+    def _result(self, text: str, drift: float = 0.0) -> dict:
+        score = len(text) % 97 / 96 + drift
+        return {"score": round(score, 3), "label": "hate" if score > 0.5 else "non-hate"}
+
+    def evaluate_utterance(self, text: str) -> dict:
+        return self._result(text, self.drift) # `drift` only skews the incremental path
+
+    def evaluate_conversation(self, conversation: list[str]) -> dict:
+        res = {"aggregate": {"non-hate": 0, "hate": 0}, "utterances": []}
+        for text in conversation:
+            _res = self._result(text)
+            res["aggregate"][_res["label"]] += 1
+            res["utterances"].append(_res)
+        for label in res["aggregate"]:
+            res["aggregate"][label] /= len(conversation)
+        return res
+
+class StubPolitenessBackend:
+    """Out-of-process politeness backend stand-in: per-text counts of a few markers"""
+    markers = ("please", "thanks", "honestly", "n't")
+
+    def score(self, texts: list[str], docs: list = None) -> list[dict]:
+        return [{marker: text.lower().count(marker) for marker in self.markers} for text in texts]
+
+@pytest.fixture
+def stub():
+    with StubPerspectiveServer() as server:
+        yield server
+
+def build_ensemble(stub, hate_speech: Evaluator = None) -> EnsembleEvaluator:
+    ensemble = EnsembleEvaluator(
+        evaluators=["toxicity", "sentiment"],
+        evaluator_options={"toxicity": {"base_url": stub.url, "qps": 1000.0}}
+    )
+    ensemble.hate_speech_evaluator = hate_speech or StubHateSpeechEvaluator()
+    ensemble.relevance_evaluator = HashedRelevanceEvaluator()
+    ensemble.politeness = StubPolitenessBackend()
+    return ensemble
+
+def test_session_matches_full_recompute(stub, no_result_cache):
+    ensemble = build_ensemble(stub)
+    assert check_session(ensemble, CONVERSATION) == []
+    # one request per participant turn from the session plus one per participant utterance of
+    # every full recompute: both paths really scored, neither read the other's results back
+    num_participant = len(CONVERSATION) // 2
+    assert stub.num_requests == num_participant + num_participant * (num_participant + 1) // 2
+
+    session = ensemble.session()
+    for text in CONVERSATION:
+        res = session.add_turn(text)
+    assert set(res) == {"Antisocialness", "Social Cohesion", "num_irrelevant_messages", "General Engagement",
+                        "Sentiment", "Argumentative Features"}
+    assert set(res["Antisocialness"]) == {"Toxicity", "Hate Speech"}
+    assert res["num_irrelevant_messages"] > 0
+    assert res["Antisocialness"]["Toxicity"]["aggregate"]["non-toxic"] < 1
+    assert res["Argumentative Features"]["aggregate"]["n't"] > 0
+
+def test_check_session_reports_mismatches(stub, no_result_cache):
+    ensemble = build_ensemble(stub, hate_speech=StubHateSpeechEvaluator(drift=0.25))
+    mismatches = check_session(ensemble, CONVERSATION)
+    assert mismatches
+    assert all(".Antisocialness.Hate Speech." in mismatch for mismatch in mismatches)